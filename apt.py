@@ -3,13 +3,17 @@ import json
 import glob
 import argparse
 from archiver_utility import ArchiverUtility
+from status_cache import StatusCache, DEFAULT_CACHE_PATH
+from report_writer import StreamingReportWriter, finalize_yaml
+from archive_index import ArchiveIndex, ParsedArchiveCache, DEFAULT_INDEX_PATH, DEFAULT_PARSE_CACHE_PATH, ioc_data_path
 import pprint
 import os
 import yaml
 
 class PathGenerator():
-    def __init__(self,sub_sys:str = None,loca: str = None)->None:
-        self.base_path = '/mccfs2/u1/lcls/epics/ioc/data/'
+    def __init__(self,sub_sys:str = None,loca: str = None, index: ArchiveIndex = None)->None:
+        self.base_path = index.base_path if index else ioc_data_path()
+        self.index = index
         if sub_sys: 
             self.sub_sys = sub_sys
         else:
@@ -17,16 +21,19 @@ class PathGenerator():
 
         if loca:
             self.area = loca
-            self.ioc_wildcard_string = '*-{}*-{}*/archive/*.archive'.format(self.area.lower(),self.sub_sys.lower())
+            self.ioc_pattern = '*-{}*-{}*'.format(self.area.lower(),self.sub_sys.lower())
         else:
-           self.ioc_wildcard_string = '*-*-{}*/archive/*.archive'.format(self.sub_sys.lower()) 
+           self.ioc_pattern = '*-*-{}*'.format(self.sub_sys.lower()) 
+        self.ioc_wildcard_string = self.ioc_pattern + '/archive/*.archive'
 
-        self.path = self.base_path + self.ioc_wildcard_string
+        self.path = os.path.join(self.base_path, self.ioc_wildcard_string)
         print(f'Wildcard Path: {self.path}')
 
     def get_paths(self):
         temp_paths = []
-        for file_path in glob.glob(self.path):
+        # the index only re-lists IOC directories that changed since the last run
+        file_paths = self.index.query(self.ioc_pattern) if self.index else glob.glob(self.path)
+        for file_path in file_paths:
             print(file_path)
             temp_paths.append(file_path)
         return temp_paths
@@ -39,6 +46,13 @@ if __name__ == "__main__":
     parser.add_argument('-d', '--display_mode', action = 'store_true', help = 'Optional argument that displays paths of files to be search but does not search')
     parser.add_argument('-f', '--filename', required = False, help = 'Instead of generating paths use your own list provided from a text file')
     parser.add_argument('-sp', '--save_paths', action='store_true', help = 'Save paths generated to file',  )
+    parser.add_argument('--index-file', default = DEFAULT_INDEX_PATH, help = 'Location of the cached $IOC_DATA archive file index')
+    parser.add_argument('--no-index', action = 'store_true', help = 'Glob $IOC_DATA directly instead of using the archive file index')
+    parser.add_argument('--parse-cache', default = DEFAULT_PARSE_CACHE_PATH, help = 'Location of the cache of parsed .archive files, only changed files are re-read')
+    parser.add_argument('--no-parse-cache', action = 'store_true', help = 'Re-read every .archive file instead of using the parse cache')
+    parser.add_argument('--format', choices = ['yaml', 'jsonl'], default = 'yaml', help = 'Output format, yaml (default) merges into the outfile at the end of the run, jsonl appends one line per archive file')
+    parser.add_argument('--max-age', type = float, help = 'Reuse PV statuses cached locally within the last MAX_AGE seconds instead of asking the appliance')
+    parser.add_argument('--status-cache', default = DEFAULT_CACHE_PATH, help = 'Location of the local PV status cache used with --max-age')
     args = parser.parse_args()
 
     print(f'dump file {args.outfile}')
@@ -52,7 +66,8 @@ if __name__ == "__main__":
                 file_paths.append(line)
             print(file_paths)
     else: 
-        generator = PathGenerator(sub_sys=args.sub_system,loca = args.loca)
+        index = None if args.no_index else ArchiveIndex(index_path = args.index_file)
+        generator = PathGenerator(sub_sys=args.sub_system,loca = args.loca, index = index)
         file_paths = generator.get_paths()
 
     if args.display_mode:
@@ -65,20 +80,30 @@ if __name__ == "__main__":
                 fn.write('\n')
             fn.close()
    
-    utility = ArchiverUtility('lcls')
+    cache = StatusCache(args.status_cache, ttl = args.max_age) if args.max_age is not None else None
+    utility = ArchiverUtility('lcls', cache = cache)
 
+    parse_cache = None if args.no_parse_cache else ParsedArchiveCache(args.parse_cache)
     master_pv_dictionary = {}
     for f in file_paths:
-        temp_pv_list = utility.parse_pvs_from_archive_file(f)
+        temp_pv_list = parse_cache.pvs(f) if parse_cache else utility.parse_pvs_from_archive_file(f)
         archive_file = f.rsplit('/',1)[-1]
         #print(archive_file)
         #print(temp_pv_list)
         master_pv_dictionary[archive_file]=temp_pv_list
     #pprint.pprint(master_pv_dictionary)
+    if parse_cache:
+        parse_cache.save()
 
     print(f'Parsed {len(list(master_pv_dictionary.keys()))} archive files')
     print(f'Preparing to retrieve PV statuses')
 
+    if args.format == 'jsonl':
+        writer = StreamingReportWriter(args.outfile)
+    else:
+        # stream into a sidecar file, partial results survive an interrupted run
+        writer = StreamingReportWriter(args.outfile + '.jsonl', append = False)
+
     for index, key in enumerate(list(master_pv_dictionary.keys())):
         not_archived_dictionary = {}
         not_archived_list = []
@@ -88,8 +113,7 @@ if __name__ == "__main__":
         master_pv_list = master_pv_dictionary[key]
 
         for pv in master_pv_list:
-            stats= utility.get_pv_status(pv)
-            stats_dictionary = stats[0]
+            stats_dictionary = utility.get_pv_status(pv)
 
             if  stats_dictionary['status'] != 'Being archived':
                 not_archived_list.append({stats_dictionary['pvName']:stats_dictionary['status']})
@@ -97,19 +121,10 @@ if __name__ == "__main__":
         not_archived_dictionary[key] = not_archived_list
         pprint.pprint(not_archived_dictionary)
 
-        if os.path.exists(args.outfile):
-            with open(args.outfile, "r") as f:
-                existing_data = yaml.safe_load(f) or {}  # Ensure it's a dictionary
-        else:
-            existing_data = {}
-        
-        for key, value in not_archived_dictionary.items():
-            if key in existing_data:
-                    existing_data[key].extend(value)  # Append to list if key exists
-            else:
-                existing_data[key] = value  # Add new key
-
-        # Dump everything back to YAML (overwriting with updated data)
-        with open(args.outfile, "w") as f:
-            yaml.dump(existing_data, f, default_flow_style=False, allow_unicode=True, indent=4, width=200)
+        # constant cost per file, the YAML report is only built once at the end
+        writer.write(key, not_archived_list)
 
+    writer.close()
+    if args.format == 'yaml':
+        finalize_yaml(writer.path, args.outfile)
+        os.remove(writer.path)
@@ -0,0 +1,238 @@
+"""
+Persistent caches for .archive files under $IOC_DATA.
+
+ArchiveIndex
+------------
+Index of IOC directories and the .archive files they hold.
+
+Globbing `*-*-{sub}*/archive/*.archive` over the NFS IOC data tree lists every
+matching archive directory on every run. `ArchiveIndex` remembers, per IOC,
+the modification time of its `archive/` directory and the .archive files it
+held (path, mtime, size). A refresh stats the IOC `archive/` directories in
+parallel and only re-lists the ones whose mtime changed, so a query by
+subsystem/area pattern is answered from memory.
+
+Note that editing a .archive file in place does not change its directory's
+mtime; the per-file mtime/size recorded here are only refreshed when the
+directory is re-listed.
+
+ParsedArchiveCache
+------------------
+Parsed contents (PV name, scan period, sampling method) of .archive files
+keyed by path, mtime and size, so unchanged files cost a stat instead of a
+read and re-split.
+"""
+
+import concurrent.futures
+import fnmatch
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from atomic_write import write_json_atomic
+
+DEFAULT_IOC_DATA = '/mccfs2/u1/lcls/epics/ioc/data/'
+DEFAULT_INDEX_PATH = os.path.join(os.path.expanduser("~"), ".cache", "archiver-report-tools", "archive_index.json")
+DEFAULT_PARSE_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "archiver-report-tools", "archive_parse_cache.json")
+
+
+def ioc_data_path() -> str:
+    """Return the IOC data root, honouring $IOC_DATA when it is set."""
+    return os.environ.get('IOC_DATA', DEFAULT_IOC_DATA)
+
+
+def parse_archive_lines(lines) -> List[List[str]]:
+    """Return [pvname, scan, method] for every PV line, missing columns are ''."""
+    records = []
+    for line in lines:
+        if line.startswith('#') or line.strip() == '':
+            continue
+        parts = line.split()
+        parts.extend([''] * (3 - len(parts)))
+        records.append(parts[:3])
+    return records
+
+
+class ArchiveIndex:
+    """
+    Index of .archive files per IOC directory, persisted as JSON.
+
+    Parameters
+    ----------
+    base_path : str, optional
+        IOC data root to index, defaults to $IOC_DATA.
+    index_path : str, optional
+        Location of the JSON index file. Pass None to keep the index in memory only.
+    workers : int, optional
+        Number of threads used to stat IOC directories, by default 16.
+
+    One index may be shared by threads running several subsystems at once.
+    """
+
+    def __init__(self, base_path: str = None, index_path: Optional[str] = DEFAULT_INDEX_PATH, workers: int = 16):
+        self.base_path = base_path or ioc_data_path()
+        self.index_path = index_path
+        self.workers = max(1, workers)
+        # ioc name -> {"mtime": archive dir mtime_ns, "files": [[path, mtime_ns, size], ...]}
+        self.iocs: Dict[str, Dict] = {}
+        self._lock = threading.RLock()
+        self.load()
+
+    def load(self):
+        """Load a previously saved index for the same base path, if there is one."""
+        if not self.index_path or not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, 'r') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        if saved.get("base_path") == self.base_path:
+            self.iocs = saved.get("iocs", {})
+
+    def save(self):
+        """Write the index atomically next to its final location."""
+        if not self.index_path:
+            return
+        with self._lock:
+            write_json_atomic(self.index_path, {"base_path": self.base_path, "iocs": self.iocs})
+
+    def _list_iocs(self, pattern: str) -> List[str]:
+        with os.scandir(self.base_path) as entries:
+            return [entry.name for entry in entries
+                    if not entry.name.startswith('.')
+                    and fnmatch.fnmatchcase(entry.name, pattern)
+                    and entry.is_dir()]
+
+    def _scan_ioc(self, ioc: str) -> Tuple[str, Optional[Dict]]:
+        """Return the fresh index entry for one IOC, re-listing it only if it changed."""
+        archive_dir = os.path.join(self.base_path, ioc, 'archive')
+        try:
+            mtime = os.stat(archive_dir).st_mtime_ns
+        except OSError:
+            return ioc, None
+
+        known = self.iocs.get(ioc)
+        if known is not None and known["mtime"] == mtime:
+            return ioc, known
+
+        files = []
+        try:
+            with os.scandir(archive_dir) as entries:
+                for entry in entries:
+                    if entry.name.startswith('.') or not entry.name.endswith('.archive'):
+                        continue
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    files.append([entry.path, st.st_mtime_ns, st.st_size])
+        except OSError:
+            return ioc, None
+        files.sort()
+        return ioc, {"mtime": mtime, "files": files}
+
+    def refresh(self, pattern: str = '*') -> int:
+        """
+        Bring the index up to date for IOC directories matching `pattern`.
+
+        Returns
+        -------
+        int
+            Number of IOC directories that had to be re-listed.
+        """
+        with self._lock:
+            iocs = self._list_iocs(pattern)
+            rescanned = 0
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+                results = list(executor.map(self._scan_ioc, iocs))
+
+            seen = set()
+            for ioc, entry in results:
+                seen.add(ioc)
+                if entry is None:
+                    if self.iocs.pop(ioc, None) is not None:
+                        rescanned += 1
+                    continue
+                if self.iocs.get(ioc) is not entry:
+                    rescanned += 1
+                self.iocs[ioc] = entry
+
+            # drop IOCs matching the pattern that have disappeared from disk
+            for ioc in [ioc for ioc in self.iocs if ioc not in seen and fnmatch.fnmatchcase(ioc, pattern)]:
+                del self.iocs[ioc]
+                rescanned += 1
+
+            if rescanned:
+                self.save()
+            return rescanned
+
+    def files(self, pattern: str = '*', refresh: bool = True) -> List[Tuple[str, int, int]]:
+        """Return (path, mtime_ns, size) of every .archive file in IOC directories matching `pattern`."""
+        with self._lock:
+            if refresh:
+                self.refresh(pattern)
+            found = []
+            for ioc in sorted(self.iocs):
+                if fnmatch.fnmatchcase(ioc, pattern):
+                    found.extend(tuple(f) for f in self.iocs[ioc]["files"])
+            return found
+
+    def query(self, pattern: str = '*', refresh: bool = True) -> List[str]:
+        """Return the paths of .archive files in IOC directories matching `pattern`."""
+        return [path for path, _, _ in self.files(pattern, refresh)]
+
+
+class ParsedArchiveCache:
+    """
+    Parsed .archive file contents keyed by path, mtime and size, persisted as JSON.
+
+    Parameters
+    ----------
+    cache_path : str, optional
+        Location of the JSON cache file. Pass None to keep it in memory only.
+    """
+
+    def __init__(self, cache_path: Optional[str] = DEFAULT_PARSE_CACHE_PATH):
+        self.cache_path = cache_path
+        # path -> [mtime_ns, size, [[pvname, scan, method], ...]]
+        self.entries: Dict[str, List] = {}
+        self.hits = 0
+        self.misses = 0
+        self._dirty = False
+        self._lock = threading.Lock()
+        if cache_path and os.path.exists(cache_path):
+            try:
+                with open(cache_path, 'r') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                self.entries = {}
+
+    def records(self, path: str) -> List[List[str]]:
+        """Return [pvname, scan, method] records for `path`, re-parsing only if it changed."""
+        st = os.stat(path)
+        entry = self.entries.get(path)
+        if entry is not None and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+            self.hits += 1
+            return entry[2]
+
+        with open(path, 'r') as f:
+            records = parse_archive_lines(f)
+        with self._lock:
+            self.misses += 1
+            self.entries[path] = [st.st_mtime_ns, st.st_size, records]
+            self._dirty = True
+        return records
+
+    def pvs(self, path: str) -> List[str]:
+        """Return the PV names listed in `path`."""
+        return [record[0] for record in self.records(path)]
+
+    def save(self):
+        """Write the cache back to disk if anything was re-parsed."""
+        with self._lock:
+            if not self.cache_path or not self._dirty:
+                return
+            write_json_atomic(self.cache_path, self.entries)
+            self._dirty = False
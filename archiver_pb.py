@@ -0,0 +1,383 @@
+"""
+Decoder for the archiver appliance's raw protocol buffer stream (getData.raw).
+
+The raw response is a sequence of chunks separated by an empty line. The first
+line of a chunk is a `PayloadInfo` message (payload type, PV name, year,
+headers such as PREC/EGU), every following line is one sample message of that
+type. Inside a line the bytes 0x1B, 0x0A and 0x0D are escaped as 0x1B 0x01,
+0x1B 0x02 and 0x1B 0x03.
+
+Samples store seconds into the year of their chunk, so timestamps are rebuilt
+from the chunk's year. Only the message fields the tools use (timestamp, value,
+severity, status) are decoded; everything else is skipped by wire type, so
+this needs neither protoc nor the protobuf package.
+
+`decode_raw` consumes the response in pieces as they arrive (e.g.
+`resp.iter_content()`) and fills array columns directly, which are then handed
+to `archiver_timeseries.PVTimeSeries` without building per-sample objects.
+"""
+
+import calendar
+import struct
+from array import array
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List
+
+import numpy as np
+
+from archiver_timeseries import PVTimeSeries, _values_array
+
+_ESC = b'\x1b'
+_NS = 1_000_000_000
+
+# PayloadType enum of EPICSEvent.proto -> (name, value kind)
+PAYLOAD_TYPES = {
+    0: ('SCALAR_STRING', 'string'),
+    1: ('SCALAR_SHORT', 'sint'),
+    2: ('SCALAR_FLOAT', 'float'),
+    3: ('SCALAR_ENUM', 'sint'),
+    4: ('SCALAR_BYTE', 'bytes'),
+    5: ('SCALAR_INT', 'sfixed32'),
+    6: ('SCALAR_DOUBLE', 'double'),
+    7: ('WAVEFORM_STRING', 'string'),
+    8: ('WAVEFORM_SHORT', 'sint'),
+    9: ('WAVEFORM_FLOAT', 'float'),
+    10: ('WAVEFORM_ENUM', 'sint'),
+    11: ('WAVEFORM_BYTE', 'bytes'),
+    12: ('WAVEFORM_INT', 'sfixed32'),
+    13: ('WAVEFORM_DOUBLE', 'double'),
+}
+
+_DOUBLE = struct.Struct('<d')
+_FLOAT = struct.Struct('<f')
+_SFIXED32 = struct.Struct('<i')
+
+
+class UnsupportedPayload(ValueError):
+    """Raised for payload types the decoder does not handle (e.g. V4 generic bytes)."""
+
+
+def unescape(line: bytes) -> bytes:
+    """Undo the archiver's newline escaping of one line."""
+    if _ESC not in line:
+        return line
+    return line.replace(b'\x1b\x02', b'\n').replace(b'\x1b\x03', b'\r').replace(b'\x1b\x01', _ESC)
+
+
+def escape(message: bytes) -> bytes:
+    """Escape a serialized message so it can be written as one line."""
+    return message.replace(_ESC, b'\x1b\x01').replace(b'\n', b'\x1b\x02').replace(b'\r', b'\x1b\x03')
+
+
+def iter_line_batches(pieces: Iterable[bytes]) -> Iterator[List[bytes]]:
+    """Split a byte stream arriving in arbitrary pieces into lists of complete lines (newline removed)."""
+    pending = b''
+    for piece in pieces:
+        if not piece:
+            continue
+        lines = (pending + piece).split(b'\n')
+        pending = lines.pop()
+        if lines:
+            yield lines
+    if pending:
+        yield [pending]
+
+
+def iter_lines(pieces: Iterable[bytes]) -> Iterator[bytes]:
+    """Split a byte stream arriving in arbitrary pieces into lines without the newline."""
+    for lines in iter_line_batches(pieces):
+        yield from lines
+
+
+def _varint(buf: bytes, pos: int):
+    result = 0
+    shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7F) << shift
+        if b < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _signed32(value: int) -> int:
+    # int32 fields are sign extended to 64 bits on the wire
+    value &= 0xFFFFFFFFFFFFFFFF
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _zigzag(value: int) -> int:
+    return (value >> 1) ^ -(value & 1)
+
+
+def _skip(buf: bytes, pos: int, wire_type: int) -> int:
+    if wire_type == 0:
+        return _varint(buf, pos)[1]
+    if wire_type == 1:
+        return pos + 8
+    if wire_type == 2:
+        length, pos = _varint(buf, pos)
+        return pos + length
+    if wire_type == 5:
+        return pos + 4
+    raise ValueError(f"unsupported protobuf wire type {wire_type}")
+
+
+def _iter_fields(buf: bytes):
+    """Yield (field number, wire type, value or (start, end) for length-delimited fields)."""
+    pos = 0
+    end = len(buf)
+    while pos < end:
+        key, pos = _varint(buf, pos)
+        field, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, pos = _varint(buf, pos)
+        elif wire_type == 1:
+            value = buf[pos:pos + 8]
+            pos += 8
+        elif wire_type == 2:
+            length, pos = _varint(buf, pos)
+            value = (pos, pos + length)
+            pos += length
+        elif wire_type == 5:
+            value = buf[pos:pos + 4]
+            pos += 4
+        else:
+            pos = _skip(buf, pos, wire_type)
+            continue
+        yield field, wire_type, value
+
+
+def parse_payload_info(buf: bytes) -> Dict:
+    """Decode a PayloadInfo message into {"type", "pvname", "year", "elementCount", "headers"}."""
+    info = {"type": None, "pvname": "", "year": 1970, "elementCount": None, "headers": {}}
+    for field, wire_type, value in _iter_fields(buf):
+        if field == 1 and wire_type == 0:
+            info["type"] = value
+        elif field == 2 and wire_type == 2:
+            info["pvname"] = buf[value[0]:value[1]].decode('utf-8', 'replace')
+        elif field == 3 and wire_type == 0:
+            info["year"] = _signed32(value)
+        elif field == 4 and wire_type == 0:
+            info["elementCount"] = _signed32(value)
+        elif field == 15 and wire_type == 2:
+            name = val = ''
+            for f, wt, v in _iter_fields(buf[value[0]:value[1]]):
+                if wt == 2:
+                    text = buf[value[0] + v[0]:value[0] + v[1]].decode('utf-8', 'replace')
+                    if f == 1:
+                        name = text
+                    elif f == 2:
+                        val = text
+            info["headers"][name] = val
+    return info
+
+
+def _packed(buf: bytes, start: int, end: int, kind: str) -> list:
+    if kind == 'double':
+        return list(struct.unpack_from(f'<{(end - start) // 8}d', buf, start))
+    if kind == 'float':
+        return list(struct.unpack_from(f'<{(end - start) // 4}f', buf, start))
+    if kind == 'sfixed32':
+        return list(struct.unpack_from(f'<{(end - start) // 4}i', buf, start))
+    values = []
+    pos = start
+    while pos < end:
+        value, pos = _varint(buf, pos)
+        values.append(_zigzag(value))
+    return values
+
+
+def _scalar(buf: bytes, wire_type: int, value, kind: str):
+    if kind == 'double':
+        return _DOUBLE.unpack(value)[0]
+    if kind == 'float':
+        return _FLOAT.unpack(value)[0]
+    if kind == 'sfixed32':
+        return _SFIXED32.unpack(value)[0]
+    if kind == 'sint':
+        return _zigzag(value)
+    if kind == 'string':
+        return buf[value[0]:value[1]].decode('utf-8', 'replace')
+    return buf[value[0]:value[1]]
+
+
+class _Columns:
+    """Growing columns of one PV."""
+
+    def __init__(self, info: Dict):
+        self.info = info
+        self.timestamps = array('q')
+        self.severity = array('i')
+        self.status = array('i')
+        kind = PAYLOAD_TYPES[info["type"]][1]
+        scalar = not PAYLOAD_TYPES[info["type"]][0].startswith('WAVEFORM')
+        # numeric scalars are collected unboxed, everything else as Python objects
+        if scalar and kind in ('double', 'float'):
+            self.values = array('d')
+        elif scalar and kind in ('sint', 'sfixed32'):
+            self.values = array('q')
+        else:
+            self.values = []
+
+    def to_series(self, pv: str = None) -> PVTimeSeries:
+        info = self.info
+        name, kind = PAYLOAD_TYPES[info["type"]]
+        meta = dict(info["headers"], name=info["pvname"], type=name)
+        if info["elementCount"] is not None:
+            meta["elementCount"] = info["elementCount"]
+        n = len(self.timestamps)
+        if isinstance(self.values, array):
+            values = np.frombuffer(self.values, dtype=np.float64 if self.values.typecode == 'd' else np.int64, count=n)
+        elif kind == 'bytes' and name.startswith('WAVEFORM'):
+            values = [np.frombuffer(v, dtype=np.int8) for v in self.values]
+        else:
+            values = self.values
+        return PVTimeSeries(
+            pv=pv or info["pvname"],
+            timestamps=np.frombuffer(self.timestamps, dtype=np.int64, count=n) if n else np.empty(0, dtype=np.int64),
+            values=values if isinstance(values, np.ndarray) else _values_array(values) if n else np.empty(0, dtype=np.float64),
+            severity=np.frombuffer(self.severity, dtype=np.int32, count=n) if n else np.empty(0, dtype=np.int32),
+            status=np.frombuffer(self.status, dtype=np.int32, count=n) if n else np.empty(0, dtype=np.int32),
+            meta=meta,
+        )
+
+
+def _decode_sample(buf: bytes, year_ns: int, waveform: bool, kind: str, columns: _Columns):
+    secs = nano = severity = status = 0
+    value = [] if waveform else None
+    for field, wire_type, raw in _iter_fields(buf):
+        if field == 1:
+            secs = raw
+        elif field == 2:
+            nano = raw
+        elif field == 3:
+            if waveform and wire_type == 2 and kind not in ('string', 'bytes'):
+                value.extend(_packed(buf, raw[0], raw[1], kind))
+            elif waveform and kind == 'string':
+                value.append(_scalar(buf, wire_type, raw, kind))
+            else:
+                item = _scalar(buf, wire_type, raw, kind)
+                if waveform and kind != 'bytes':
+                    value.append(item)
+                else:
+                    value = item
+        elif field == 4:
+            severity = _signed32(raw)
+        elif field == 5:
+            status = _signed32(raw)
+    columns.timestamps.append(year_ns + secs * _NS + nano)
+    columns.values.append(value)
+    columns.severity.append(severity)
+    columns.status.append(status)
+
+
+def _decode_numeric_scalars(lines: List[bytes], start: int, year_ns: int, kind: str, columns: _Columns) -> int:
+    """
+    Fast path for scalar numeric samples, the bulk of most retrievals.
+
+    Decodes lines[start:] up to the next blank line and returns its index
+    (len(lines) if the batch ended first). Values go straight into an array.
+    """
+    timestamps = columns.timestamps.append
+    values = columns.values.append
+    severities = columns.severity.append
+    statuses = columns.status.append
+    fixed = _FLOAT if kind == 'float' else _SFIXED32
+    unpack_double = _DOUBLE.unpack_from
+    unpack_fixed = fixed.unpack_from
+    index = start
+    for buf in islice(lines, start, None):
+        if not buf:
+            return index
+        index += 1
+        if 27 in buf:
+            buf = unescape(buf)
+        pos = 0
+        end = len(buf)
+        secs = nano = severity = status = 0
+        value = 0
+        while pos < end:
+            key = buf[pos]
+            pos += 1
+            if key == 0x19:
+                value = unpack_double(buf, pos)[0]
+                pos += 8
+                continue
+            wire_type = key & 7
+            if key > 0x7F or wire_type == 2:
+                # fields scalar samples don't normally carry (field values, long keys)
+                key, pos = _varint(buf, pos - 1)
+                pos = _skip(buf, pos, key & 7)
+                continue
+            if wire_type == 5:
+                if key == 0x1D:
+                    value = unpack_fixed(buf, pos)[0]
+                pos += 4
+                continue
+            if wire_type == 1:
+                pos += 8
+                continue
+            v = buf[pos]
+            pos += 1
+            if v > 0x7F:
+                v, pos = _varint(buf, pos - 1)
+            if key == 0x08:
+                secs = v
+            elif key == 0x10:
+                nano = v
+            elif key == 0x18:
+                value = _zigzag(v)
+            elif key == 0x20:
+                severity = _signed32(v)
+            elif key == 0x28:
+                status = _signed32(v)
+        timestamps(year_ns + secs * _NS + nano)
+        values(value)
+        severities(severity)
+        statuses(status)
+    return index
+
+
+def decode_raw(pieces: Iterable[bytes], pv: str = None) -> List[PVTimeSeries]:
+    """
+    Decode a getData.raw stream into one PVTimeSeries per PV, in stream order.
+
+    Parameters
+    ----------
+    pieces : iterable of bytes
+        The response body, whole or in pieces as it arrives.
+    pv : str, optional
+        Name to give the series instead of the one in the payload (useful when
+        a post-processing operator such as mean_N() was requested).
+    """
+    series: Dict[str, _Columns] = {}
+    columns = None
+    for lines in iter_line_batches(pieces):
+        index = 0
+        n = len(lines)
+        while index < n:
+            line = lines[index]
+            index += 1
+            if not line:
+                # blank line ends the chunk, the next line is a new PayloadInfo
+                columns = None
+                continue
+            if columns is None:
+                info = parse_payload_info(unescape(line))
+                if info["type"] not in PAYLOAD_TYPES:
+                    raise UnsupportedPayload(f"payload type {info['type']} of {info['pvname']} is not supported")
+                columns = series.get(info["pvname"])
+                if columns is None:
+                    columns = series[info["pvname"]] = _Columns(info)
+                year_ns = calendar.timegm((info["year"], 1, 1, 0, 0, 0)) * _NS
+                type_name, kind = PAYLOAD_TYPES[info["type"]]
+                waveform = type_name.startswith('WAVEFORM')
+                numeric_scalar = not waveform and kind not in ('string', 'bytes')
+                continue
+            if numeric_scalar:
+                index = _decode_numeric_scalars(lines, index - 1, year_ns, kind, columns)
+            else:
+                _decode_sample(unescape(line), year_ns, waveform, kind, columns)
+    return [c.to_series(pv) for c in series.values()]
@@ -6,31 +6,38 @@ Daily Archiver QA Scheduler
 
 This module schedules and executes daily EPICS archiver quality-assurance checks
 for LCLS subsystems. Subsystems are grouped by day of the week and executed either
-sequentially or with limited parallelism. Each subsystem run invokes an external
-reporting tool and logs timing, status, and failures to a persistent log file.
+sequentially or with limited parallelism. Each subsystem run calls the
+`new_report_tool` report pipeline in-process and logs timing, counts, status,
+and failures to a persistent log file.
 
 Key features
 ------------
 - Day-of-week subsystem scheduling
 - Local-time-based execution semantics (e.g. "run at 1am")
 - Optional limited parallel execution using threads
+- Optional combined mode: one deduplicated status sweep for all of the day's
+  subsystems, still writing one report per subsystem
 - Robust logging of start/end times, duration, and exceptions
+- Per-run metrics (phase timings, request counts and latencies, throughput)
+  exported as a Prometheus text file and a JSON summary
 
 Assumptions
 -----------
 - The system clock timezone matches the desired operational timezone.
-- `new_report_tool.py` is available on PATH or invoked relative to the working directory.
+- `new_report_tool` is importable (it lives next to this module).
 - Log directory exists and is writable.
 """
 
 
 
-import subprocess
+import os
 import time
 import threading
 import logging
 from datetime import datetime, timedelta
 
+import new_report_tool
+
 
 """
 Mapping from subsystem abbreviations to human-readable subsystem names.
@@ -52,7 +59,7 @@ present, the raw abbreviation will be logged instead.
 """
 
 abbrev_name_lookup = {
-    'ky': 'Klystron'
+    'ky': 'Klystron',
     'bp': 'BPM',
     'mp': 'Machine Protection System',
     'tr': 'Feedback',
@@ -109,6 +116,28 @@ subsystems_by_day = {
     'Sunday': ['rd', 'rc', 'cv', 'ex'] #idk?
 }
 
+REPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'reports')
+
+"""
+Command-line options the daily checks run with, as they would be passed to
+`new_report_tool.py`: report Unarchived and Paused PVs with their last event
+and dump one .qa report per subsystem into `REPORT_DIR`, holding only the PVs
+new, resolved or still failing since the previous run of that subsystem.
+Statuses come from the appliance-wide listings, so only paused, unlisted and
+never connected PVs are looked up one by one.
+"""
+
+REPORT_ARGS = ['-k', 'UP', '-l', '--dump', '--diff', '--listings', '--report-dir', REPORT_DIR]
+
+"""
+Where each daily run leaves its metrics: a Prometheus text file, overwritten
+every run, for the node-exporter textfile collector (point
+$ARCHIVER_QA_TEXTFILE into its --collector.textfile.directory), and one JSON
+summary per run in `REPORT_DIR` to compare runs over time.
+"""
+
+METRICS_TEXTFILE = os.environ.get('ARCHIVER_QA_TEXTFILE', os.path.join(REPORT_DIR, 'archiver_qa.prom'))
+
 logging.basicConfig(
     level=logging.INFO,
     filename="/var/log/lcls-archiver-qa.log",
@@ -155,7 +184,7 @@ def next_run_time(hour: int = 1, minute: int = 0) -> datetime:
         target += timedelta(days=1)
     return target
 
-def run_today_subsystems(max_parallel: int = 1):
+def run_today_subsystems(max_parallel: int = 1, combined: bool = False):
     
     """
     Execute all subsystems scheduled for the current day.
@@ -166,6 +195,9 @@ def run_today_subsystems(max_parallel: int = 1):
         Maximum number of subsystems to run concurrently.
         - 1 executes subsystems sequentially (default, safest).
         - Values >1 enable limited parallel execution using threads.
+    combined : bool, optional
+        If True, check all of today's subsystems in a single report run that
+        queries the union of their PVs once. `max_parallel` is ignored.
 
     Notes
     -----
@@ -183,10 +215,16 @@ def run_today_subsystems(max_parallel: int = 1):
 
     logging.info(f"Scheduled subsystems for {today}: {subsystems}")
 
-    if max_parallel <= 1:
+    # one HTTP pool, cache set and CA context shared by every subsystem today
+    context = report_context(max_parallel)
+
+    run_start = time.perf_counter()
+    if combined:
+        check_subsystems_combined(subsystems, context)
+    elif max_parallel <= 1:
         # Sequential (simplest, safest)
         for sub in subsystems:
-            check_subsystem(sub)
+            check_subsystem(sub, context)
     else:
         # Limited parallelism using threads
         sem = threading.Semaphore(max_parallel)
@@ -194,7 +232,7 @@ def run_today_subsystems(max_parallel: int = 1):
 
         def wrapped(sub):
             with sem:
-                check_subsystem(sub)
+                check_subsystem(sub, context)
 
         for sub in subsystems:
             t = threading.Thread(target=wrapped, args=(sub,))
@@ -204,7 +242,84 @@ def run_today_subsystems(max_parallel: int = 1):
         for t in threads:
             t.join()
 
-def check_subsystem(subsystem: str):
+    context[1].metrics.set("run_duration_seconds", time.perf_counter() - run_start,
+                           help_text="Wall time of the daily run.")
+    write_metrics(context, today)
+
+def write_metrics(context, day: str):
+    """
+    Write the metrics of a daily run to `METRICS_TEXTFILE` and a JSON summary.
+
+    Parameters
+    ----------
+    context : tuple
+        Shared state from `report_context` the run used.
+    day : str
+        Weekday name of the run, part of the JSON file name.
+
+    Notes
+    -----
+    Failures are logged and otherwise ignored; metrics must not break the run.
+    """
+    util = context[1]
+    json_path = os.path.join(REPORT_DIR, f"metrics_{local_now().strftime('%Y-%m-%d')}_{day}.json")
+    try:
+        metrics = new_report_tool.write_run_metrics(util, METRICS_TEXTFILE, json_path)
+        phases = metrics.summary()["phases"]
+        logging.info("Run phases: " + ", ".join(f"{name}={t['wall_s']:.2f}s" for name, t in sorted(phases.items())))
+        logging.info(f"Metrics written to {METRICS_TEXTFILE} and {json_path}")
+    except Exception as e:
+        logging.exception(f"Could not write run metrics: {e}")
+
+def report_context(max_parallel: int = 1):
+    """
+    Build the state shared by all report runs of a daily run.
+
+    Parameters
+    ----------
+    max_parallel : int, optional
+        Number of subsystems that may run at once, used to size the HTTP pool.
+
+    Returns
+    -------
+    tuple
+        (args, archiver_utility, search_kwargs, index) parsed from `REPORT_ARGS`,
+        index being the archive file index loaded once for the whole run.
+    """
+    args = new_report_tool.build_parser().parse_args(REPORT_ARGS)
+    pool_size = max(new_report_tool.DEFAULT_POOL_SIZE, max_parallel * args.concurrency)
+    util = new_report_tool.build_utility(args, pool_size=pool_size)
+    return args, util, new_report_tool.setup_search_kwargs(args), new_report_tool.build_index(args)
+
+def run_reports(subsystems: list, context=None) -> dict:
+    """
+    Run the report pipeline in-process for `subsystems` with one status sweep.
+
+    Returns
+    -------
+    dict[str, new_report_tool.ReportOutcome]
+        Outcome (counts, timings, report path) per subsystem.
+    """
+    args, util, search_kwargs, index = context if context is not None else report_context()
+    return new_report_tool.run_subsystems(subsystems, util, search_kwargs,
+                                          concurrency=args.concurrency,
+                                          index=index,
+                                          report_dir=args.report_dir,
+                                          diff=args.diff,
+                                          listings=args.listings)
+
+def log_outcome(name: str, outcome):
+    """Log the counts and timings of one subsystem report."""
+    changes = ""
+    if outcome.new is not None:
+        changes = f", new={outcome.new}, resolved={outcome.resolved}, still_failing={outcome.still_failing}"
+    logging.info(
+        f"Report for {name}: {outcome.report_path} "
+        f"(files={outcome.files}, pvs={outcome.pvs}, unique_pvs={outcome.unique_pvs}, "
+        f"reported={outcome.reported}{changes}, collect={outcome.collect_s:.2f}s, status={outcome.status_s:.2f}s)"
+    )
+
+def check_subsystem(subsystem: str, context=None):
     """
     Run the archiver QA check for a single subsystem.
 
@@ -212,10 +327,17 @@ def check_subsystem(subsystem: str):
     ----------
     subsystem : str
         Subsystem abbreviation identifying the subsystem to check.
+    context : tuple, optional
+        Shared state from `report_context`; built on the fly if omitted.
+
+    Returns
+    -------
+    new_report_tool.ReportOutcome or None
+        Outcome of the report run, None if it failed.
 
     Notes
     -----
-    - Executes `new_report_tool.py` as a subprocess.
+    - Runs the `new_report_tool` pipeline in-process.
     - Logs start time, end time, execution duration, and success/failure.
     - Any raised exception is logged with full traceback.
     """
@@ -224,8 +346,10 @@ def check_subsystem(subsystem: str):
     name = abbrev_name_lookup.get(subsystem, subsystem)
     logging.info(f"Starting archiver checks for {name} at {start.isoformat()}")
 
+    outcome = None
     try:
-        subprocess.run(["python", "new_report_tool.py", "-sub", subsystem, '-k', 'UP', '-l', '--dump'], check=True)
+        outcome = run_reports([subsystem], context)[subsystem]
+        log_outcome(name, outcome)
         status = "success"
     except Exception as e:
         status = "error"
@@ -240,8 +364,73 @@ def check_subsystem(subsystem: str):
         f"Archiver checks for {name} finished at {finish.isoformat()} "
         f"(status={status}, duration={duration_s:.2f}s)"
     )
+    if context is not None:
+        record_status(context, subsystem, status, duration_s)
+    return outcome
 
-def scheduler_loop(run_hour: int = 1, run_minute: int = 0, max_parallel: int = 1):
+def check_subsystems_combined(subsystems: list, context=None):
+    """
+    Run the archiver QA check for several subsystems with one status sweep.
+
+    Parameters
+    ----------
+    subsystems : list[str]
+        Subsystem abbreviations to check together.
+    context : tuple, optional
+        Shared state from `report_context`; built on the fly if omitted.
+
+    Returns
+    -------
+    dict[str, new_report_tool.ReportOutcome]
+        Outcome per subsystem, empty if the run failed.
+
+    Notes
+    -----
+    - Gathers the union of the subsystems' PVs, queries each unique PV once
+      and writes one report per subsystem.
+    - Logs the same start/end lines per subsystem as `check_subsystem`; the
+      reported duration is that of the shared run.
+    """
+
+    start = datetime.now().astimezone()
+    names = {sub: abbrev_name_lookup.get(sub, sub) for sub in subsystems}
+    for name in names.values():
+        logging.info(f"Starting archiver checks for {name} at {start.isoformat()}")
+
+    outcomes = {}
+    try:
+        outcomes = run_reports(subsystems, context)
+        for sub, outcome in outcomes.items():
+            log_outcome(names[sub], outcome)
+        status = "success"
+    except Exception as e:
+        status = "error"
+        exception_time = datetime.now().astimezone()
+        logging.exception(
+            f"Runtime Error at {exception_time.isoformat()} when running checks for {', '.join(names.values())}: {e}"
+        )
+
+    finish = datetime.now().astimezone()
+    duration_s = (finish - start).total_seconds()
+    for name in names.values():
+        logging.info(
+            f"Archiver checks for {name} finished at {finish.isoformat()} "
+            f"(status={status}, duration={duration_s:.2f}s)"
+        )
+    if context is not None:
+        for sub in subsystems:
+            record_status(context, sub, status, duration_s)
+    return outcomes
+
+def record_status(context, subsystem: str, status: str, duration_s: float):
+    """Export whether a subsystem check succeeded and how long it took."""
+    metrics = context[1].metrics
+    metrics.set("subsystem_success", int(status == "success"),
+                help_text="1 if the subsystem check completed, 0 if it failed.", subsystem=subsystem)
+    metrics.set("subsystem_duration_seconds", duration_s,
+                help_text="Wall time of the subsystem check.", subsystem=subsystem)
+
+def scheduler_loop(run_hour: int = 1, run_minute: int = 0, max_parallel: int = 1, combined: bool = False):
     """
     Main scheduler loop that triggers daily subsystem checks.
 
@@ -253,6 +442,8 @@ def scheduler_loop(run_hour: int = 1, run_minute: int = 0, max_parallel: int = 1
         Minute of the hour when the run should start, by default 0.
     max_parallel : int, optional
         Maximum number of subsystems to execute concurrently.
+    combined : bool, optional
+        Check all of the day's subsystems with one deduplicated status sweep.
 
     Notes
     -----
@@ -269,10 +460,11 @@ def scheduler_loop(run_hour: int = 1, run_minute: int = 0, max_parallel: int = 1
 
         started = local_now()
         logging.info(f"=== Daily run triggered at {started.isoformat()} ===")
-        run_today_subsystems(max_parallel=max_parallel)
+        run_today_subsystems(max_parallel=max_parallel, combined=combined)
         finished = local_now()
         logging.info(f"=== Daily run completed at {finished.isoformat()} ===")
 
 if __name__ == "__main__":
     # max_parallel=1 => sequential; bump to 2 or 3 if you want to overlap subsystem runs (not tested extensively)
+    # combined=True => one status sweep over the union of the day's subsystems
     scheduler_loop(run_hour=1, run_minute=0, max_parallel=1)
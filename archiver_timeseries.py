@@ -0,0 +1,126 @@
+"""
+Columnar representation of archiver retrieval data.
+
+`getData.json` returns, per PV, a list of sample objects:
+
+    [{"meta": {"name": ..., ...},
+      "data": [{"secs": ..., "nanos": ..., "val": ..., "severity": ..., "status": ...}, ...]}]
+
+Keeping those as Python dicts costs several hundred bytes per sample and makes
+analysis loop-bound. `PVTimeSeries` holds one PV's samples as NumPy arrays:
+timestamps as int64 nanoseconds since the epoch, values, severity and status.
+
+`PVTimeSeries.from_json` builds the arrays while the response is decoded: a
+`json` object hook turns each sample dict into a small tuple as soon as it is
+parsed, so the per-sample dicts never accumulate.
+"""
+
+import json
+from dataclasses import dataclass, field
+from typing import Iterable, List, Sequence
+
+import numpy as np
+
+_NS = 1_000_000_000
+
+
+def _sample_hook(obj: dict):
+    # sample objects become (timestamp_ns, val, severity, status) tuples on the fly
+    if "secs" in obj and "val" in obj:
+        return (obj["secs"] * _NS + obj.get("nanos", 0), obj["val"], obj.get("severity", 0), obj.get("status", 0))
+    return obj
+
+
+def _values_array(values: Sequence) -> np.ndarray:
+    """Return float64 values (2-D for waveforms), falling back to object for strings."""
+    try:
+        return np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return np.asarray(values, dtype=object)
+
+
+@dataclass
+class PVTimeSeries:
+    """Samples of a single PV held as parallel NumPy arrays."""
+    pv: str
+    timestamps: np.ndarray  # int64 nanoseconds since the epoch
+    values: np.ndarray
+    severity: np.ndarray
+    status: np.ndarray
+    meta: dict = field(default_factory=dict)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @property
+    def seconds(self) -> np.ndarray:
+        """Timestamps as float64 seconds since the epoch."""
+        return self.timestamps / _NS
+
+    @property
+    def nbytes(self) -> int:
+        return self.timestamps.nbytes + self.values.nbytes + self.severity.nbytes + self.status.nbytes
+
+    def after(self, timestamp_ns: int) -> "PVTimeSeries":
+        """Return the samples strictly later than timestamp_ns (timestamps are sorted)."""
+        start = int(np.searchsorted(self.timestamps, timestamp_ns, side='right'))
+        if start == 0:
+            return self
+        return PVTimeSeries(self.pv, self.timestamps[start:], self.values[start:],
+                            self.severity[start:], self.status[start:], self.meta)
+
+    @classmethod
+    def concat(cls, parts: Sequence["PVTimeSeries"], pv: str = None) -> "PVTimeSeries":
+        """Join consecutive series of one PV into a single series."""
+        parts = [part for part in parts if part is not None]
+        if not parts:
+            return cls.empty(pv or "")
+        non_empty = [part for part in parts if len(part)] or parts[:1]
+        return cls(
+            pv=pv or parts[0].pv,
+            timestamps=np.concatenate([part.timestamps for part in non_empty]),
+            values=np.concatenate([part.values for part in non_empty]),
+            severity=np.concatenate([part.severity for part in non_empty]),
+            status=np.concatenate([part.status for part in non_empty]),
+            meta=parts[0].meta,
+        )
+
+    @classmethod
+    def empty(cls, pv: str, meta: dict = None) -> "PVTimeSeries":
+        return cls(pv, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64),
+                   np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32), meta or {})
+
+    @classmethod
+    def from_samples(cls, pv: str, samples: Sequence[tuple], meta: dict = None) -> "PVTimeSeries":
+        """Build from (timestamp_ns, val, severity, status) tuples."""
+        if not samples:
+            return cls.empty(pv, meta)
+        n = len(samples)
+        return cls(
+            pv=pv,
+            timestamps=np.fromiter((s[0] for s in samples), dtype=np.int64, count=n),
+            values=_values_array([s[1] for s in samples]),
+            severity=np.fromiter((s[2] for s in samples), dtype=np.int32, count=n),
+            status=np.fromiter((s[3] for s in samples), dtype=np.int32, count=n),
+            meta=meta or {},
+        )
+
+    @classmethod
+    def from_json(cls, content, pv: str = None) -> List["PVTimeSeries"]:
+        """Decode a getData.json response body (bytes or str) straight into columnar series."""
+        decoded = json.loads(content, object_hook=_sample_hook)
+        series = []
+        for entry in decoded:
+            meta = entry.get("meta", {})
+            series.append(cls.from_samples(pv or meta.get("name", ""), entry.get("data", []), meta))
+        return series
+
+    @classmethod
+    def from_payload(cls, payload: Iterable[dict], pv: str = None) -> List["PVTimeSeries"]:
+        """Convert an already decoded getData.json payload (lists of sample dicts)."""
+        series = []
+        for entry in payload:
+            meta = entry.get("meta", {})
+            samples = [_sample_hook(sample) for sample in entry.get("data", [])]
+            series.append(cls.from_samples(pv or meta.get("name", ""), samples, meta))
+        return series
@@ -7,6 +7,11 @@ import time
 import re
 import glob
 import datetime
+import collections
+import concurrent.futures
+import itertools
+from dataclasses import dataclass
+from http_session import build_session, DEFAULT_POOL_SIZE
 
 '''
 ArchiverUtility: a simple class to access the archiver. Can do almost anything the archiver applicance can do.
@@ -15,8 +20,30 @@ To create an ArchiverUtility object, simply declare, for example:
     au.load_pvs_from_list("myList", input_list) # loads PVs from a list of strings
     data = au.get_status("myList") # gets status of all PVs in list and returns as a json file
 '''
+
+@dataclass
+class BulkResult:
+    '''Outcome of one PV in a bulk management operation'''
+    pv: str
+    operation: str
+    ok: bool
+    message: str = ''
+    status_code: int = None
+    dry_run: bool = False
+
+
+def format_bulk_results(results):
+    '''Formats a {pv: BulkResult} table, failures first, followed by a summary line'''
+    rows = sorted(results.values(), key=lambda r: (r.ok, r.pv))
+    width = max([len(r.pv) for r in rows] + [2])
+    lines = [f"{r.pv:<{width}}  {r.operation:<8}  {'ok' if r.ok else 'FAILED':<6}  {r.message}" for r in rows]
+    failed = sum(1 for r in rows if not r.ok)
+    lines.append(f"{len(rows) - failed}/{len(rows)} PVs ok" + (" (dry run)" if rows and rows[0].dry_run else ""))
+    return "\n".join(lines)
+
+
 class ArchiverUtility:
-    def __init__(self, mode):
+    def __init__(self, mode, pool_size=DEFAULT_POOL_SIZE, cache=None, retrieval_cache=None):
         if (mode == "dev"):
             self.web = "http://dev-archapp.slac.stanford.edu/mgmt/bpl/"
             self.retrieval_url = 'http://dev-archapp.slac.stanford.edu:17668/retrieval/data/'
@@ -36,59 +63,238 @@ class ArchiverUtility:
             self.post_url = 'http://dev-archapp.slac.stanford.edu/retrieval/data/'
 
         self.pv_lists = {}
+        self.session = build_session(pool_size)
+        self.cache = cache # optional status_cache.StatusCache
+        self.retrieval_cache = retrieval_cache # optional retrieval_cache.RetrievalCache, used for columnar data
+        self.retrieval_errors = {} # pv -> exception from the last get_data call
 
 
     
-    def get_data(self, list_name, starttime, endtime, binsize):
-        '''Gets all data from a stored list of PV's specified by list_name. Starttime and endtime can be either in string or timestamp format. Binsize is in seconds'''
-        try:
-            starttime = int(starttime) # It's an int
-            startdate = datetime.datetime.fromtimestamp(starttime)
-            startdate_string = startdate.strftime('%Y-%m-%dT%H:%M:%S-07:00')
-        except ValueError:
-            startdate_string = starttime
-
-        try:
-            endtime = int(endtime)
-            enddate = datetime.datetime.fromtimestamp(endtime)
-            enddate_string = enddate.strftime('%Y-%m-%dT%H:%M:%S-07:00')
-        except ValueError:
-            enddate_string = endtime
-
-        data = {}
-        for pv in self.pv_lists[list_name]:
-            data[pv] = self.get_pv_data(pv, startdate_string, enddate_string, binsize)
+    def get_data(self, list_name, starttime, endtime, binsize, workers=1, progress=False, columnar=False, raw=False,
+                 chunk_seconds=None, chunk_workers=4):
+        '''Gets all data from a stored list of PV's specified by list_name. Starttime and endtime can be either in string or timestamp format. Binsize is in seconds.
+
+        With workers > 1, up to that many PVs are retrieved at once (keep it at or below the session pool_size).
+        A PV whose retrieval fails is returned as None and its exception is kept in self.retrieval_errors.
+        progress=True prints a line as each PV completes.
+        columnar=True returns an archiver_timeseries.PVTimeSeries per PV instead of the raw JSON payload
+        (and lets a retrieval_cache given to the constructor answer from disk).
+        raw=True retrieves the binary getData.raw stream instead of JSON and always returns PVTimeSeries.
+        chunk_seconds splits the window into sub-intervals fetched chunk_workers at a time per PV and stitched
+        into one PVTimeSeries (see iter_pv_data_chunks); up to workers * chunk_workers requests run at once.'''
+        startdate_string = self._time_string(starttime)
+        enddate_string = self._time_string(endtime)
+
+        pvs = self.pv_lists[list_name]
+        data = {pv: None for pv in pvs} # keeps the list order whatever order PVs complete in
+        self.retrieval_errors = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            if chunk_seconds:
+                futures = {executor.submit(self._fetch_pv_data_chunked, pv, startdate_string, enddate_string, binsize,
+                                           chunk_seconds, chunk_workers, raw): pv
+                           for pv in pvs}
+            else:
+                futures = {executor.submit(self._fetch_pv_data, pv, startdate_string, enddate_string, binsize, columnar, raw): pv
+                           for pv in pvs}
+            for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+                pv = futures[future]
+                try:
+                    data[pv] = future.result()
+                except (requests.RequestException, ValueError) as e:
+                    self.retrieval_errors[pv] = e
+                if progress:
+                    status = 'failed' if pv in self.retrieval_errors else 'ok'
+                    print(f"Retrieved {done}/{len(pvs)} PVs: {pv} {status}")
         return data
 
     
-    def get_pv_data(self, pv, starttime, endtime, binsize):
-        '''Gets the data for a specific PV'''
+    def get_pv_data(self, pv, starttime, endtime, binsize, columnar=False, raw=False):
+        '''Gets the data for a specific PV, as a PVTimeSeries if columnar or raw is True'''
+        try:
+            return self._fetch_pv_data(pv, starttime, endtime, binsize, columnar, raw)
+        except (requests.HTTPError, ValueError) as e:
+            print(f"Error retrieving data for {pv}: {e}")
+
+    def _fetch_pv_data(self, pv, starttime, endtime, binsize, columnar=False, raw=False):
+        '''Gets binned data for a PV, through the retrieval cache for columnar data when there is one'''
+        if self.retrieval_cache is not None and (columnar or raw):
+            return self._fetch_pv_data_cached(pv, starttime, endtime, binsize, raw)
+        return self._request_pv_data(pv, starttime, endtime, binsize, columnar, raw)
+
+    def _request_pv_data(self, pv, starttime, endtime, binsize, columnar=False, raw=False):
+        '''Requests binned data for a PV, raising on HTTP or decoding errors'''
         binned_pv = 'mean_' + str(binsize) + '(' + pv + ')'
-        
-        # Build query for archiver
+        if raw:
+            from archiver_pb import UnsupportedPayload
+            try:
+                return self._fetch_pv_data_raw(pv, binned_pv, starttime, endtime)
+            except UnsupportedPayload:
+                columnar = True # fall back to JSON for payload types the decoder doesn't handle
+        resp = self.session.get(self.retrieval_url + "getData.json", params={"pv": binned_pv, "from": starttime, "to": endtime})
+        resp.raise_for_status()
+        if columnar:
+            # numpy is only needed by callers asking for columnar data
+            from archiver_timeseries import PVTimeSeries
+            series = PVTimeSeries.from_json(resp.content, pv)
+            return series[0] if series else PVTimeSeries.empty(pv)
+        return resp.json()
+
+    def _fetch_pv_data_cached(self, pv, starttime, endtime, binsize, raw=False):
+        '''Serves columnar data from the retrieval cache, requesting only the intervals it does not cover.
+
+        The window is widened to whole bins so cached and fetched bins line up. Data newer than one bin
+        before now is returned but not cached, as the appliance may still be adding to it.'''
+        from archiver_timeseries import PVTimeSeries
+        bin_ns = max(1, int(binsize)) * 1_000_000_000
+        start_ns = int(self._parse_time(self._time_string(starttime)).timestamp() * 1e9) // bin_ns * bin_ns
+        end_ns = -(-int(self._parse_time(self._time_string(endtime)).timestamp() * 1e9) // bin_ns) * bin_ns
+        settled_ns = int(time.time() * 1e9) // bin_ns * bin_ns - bin_ns
+        operator = 'mean_' + str(binsize)
+
+        parts, gaps = self.retrieval_cache.lookup(self.retrieval_url, pv, operator, start_ns, end_ns)
+        for lo, hi in gaps:
+            series = self._request_pv_data(pv, self._iso_time(lo), self._iso_time(hi), binsize, True, raw)
+            if min(hi, settled_ns) > lo:
+                self.retrieval_cache.store(self.retrieval_url, pv, operator, lo, min(hi, settled_ns), series)
+            parts.append(series.after(lo - 1))
+
+        parts.sort(key=lambda part: int(part.timestamps[0]) if len(part) else 0)
+        stitched = []
+        last = None
+        for part in parts:
+            if last is not None:
+                part = part.after(last)
+            if len(part):
+                last = int(part.timestamps[-1])
+                stitched.append(part)
+        return PVTimeSeries.concat(stitched, pv)
+
+    @staticmethod
+    def _iso_time(t_ns):
+        '''Formats nanoseconds since the epoch as an ISO 8601 UTC time'''
+        return datetime.datetime.fromtimestamp(t_ns / 1e9, tz=datetime.timezone.utc).isoformat(timespec='milliseconds')
+
+    @staticmethod
+    def _time_string(t):
+        '''Formats a timestamp for the retrieval API, strings are passed through unchanged'''
         try:
-            payload = []
-            resp = requests.get(self.retrieval_url + "getData.json", params={"pv": binned_pv, "from": starttime, "to": endtime})
-            payload = resp.json()
-            return payload
-        
+            t = int(t) # It's an int
+            return datetime.datetime.fromtimestamp(t).strftime('%Y-%m-%dT%H:%M:%S-07:00')
         except ValueError:
-            print("Error!")
+            return t
+
+    @staticmethod
+    def _parse_time(t):
+        '''Parses an ISO 8601 retrieval time string into an aware datetime'''
+        if t.endswith('Z'):
+            t = t[:-1] + '+00:00'
+        return datetime.datetime.fromisoformat(t)
+
+    def iter_pv_data_chunks(self, pv, starttime, endtime, binsize, chunk_seconds=86400, workers=4, raw=False):
+        '''Yields the data of one PV as consecutive PVTimeSeries chunks of at most chunk_seconds each.
+
+        Sub-intervals start on multiples of binsize since the epoch, the appliance's own bin boundaries,
+        and are fetched up to workers at a time, but yielded in order; samples repeated across a chunk
+        boundary are dropped. At most workers chunks are held in memory, so arbitrarily long windows can
+        be processed chunk by chunk.'''
+        bin_s = max(1, int(binsize))
+        start = self._parse_time(self._time_string(starttime))
+        start = datetime.datetime.fromtimestamp(start.timestamp() // bin_s * bin_s, start.tzinfo)
+        end = self._parse_time(self._time_string(endtime))
+        step = bin_s * max(1, -(-int(chunk_seconds) // bin_s)) # round up to whole bins
+        bounds = []
+        lower = start
+        while lower < end:
+            upper = min(lower + datetime.timedelta(seconds=step), end)
+            bounds.append((lower.isoformat(timespec='milliseconds'), upper.isoformat(timespec='milliseconds')))
+            lower = upper
+
+        last = None
+        pending = collections.deque()
+        intervals = iter(bounds)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            try:
+                for lo, hi in itertools.islice(intervals, max(1, workers)):
+                    pending.append(executor.submit(self._fetch_pv_data, pv, lo, hi, binsize, True, raw))
+                while pending:
+                    chunk = pending.popleft().result()
+                    for lo, hi in itertools.islice(intervals, 1):
+                        pending.append(executor.submit(self._fetch_pv_data, pv, lo, hi, binsize, True, raw))
+                    if last is not None:
+                        chunk = chunk.after(last)
+                    if len(chunk):
+                        last = int(chunk.timestamps[-1])
+                        yield chunk
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def _fetch_pv_data_chunked(self, pv, starttime, endtime, binsize, chunk_seconds, workers=4, raw=False):
+        '''Fetches a long window chunk by chunk and stitches it into one PVTimeSeries'''
+        from archiver_timeseries import PVTimeSeries
+        return PVTimeSeries.concat(list(self.iter_pv_data_chunks(pv, starttime, endtime, binsize, chunk_seconds, workers, raw)), pv)
+
+    def _fetch_pv_data_raw(self, pv, binned_pv, starttime, endtime):
+        '''Requests the getData.raw protocol buffer stream and decodes it into a PVTimeSeries as it arrives'''
+        from archiver_pb import decode_raw
+        params = {"pv": binned_pv, "from": starttime, "to": endtime}
+        with self.session.get(self.retrieval_url + "getData.raw", params=params, stream=True) as resp:
+            resp.raise_for_status()
+            series = decode_raw(resp.iter_content(chunk_size=65536), pv)
+        if series:
+            return series[0]
+        from archiver_timeseries import PVTimeSeries
+        return PVTimeSeries.empty(pv)
 
     
-    def get_data_at_time(self, list_name, time):
-        '''Gets the data for a list of PVs at a given time'''
-        try:
-            time = int(time) # It's an int
-            date = datetime.datetime.fromtimestamp(time)
-            date_string = date.strftime('%Y-%m-%dT%H:%M:%S-07:00')
-        except ValueError:
-            date_string = time
+    def get_data_at_time(self, list_name, time, chunk_size=500, workers=4):
+        '''Gets the data for a list of PVs at a given time, as {pv: {pv: sample}} ({} for PVs without data).
+
+        The list is sent to getDataAtTime chunk_size PVs per POST, workers chunks at a time.'''
+        snapshot = self.get_pvs_data_at_time(self.pv_lists[list_name], time, chunk_size, workers)
+        return {pv: ({pv: sample} if sample is not None else {}) for pv, sample in snapshot.items()}
+
+    def get_pvs_data_at_time(self, pvs, at, chunk_size=500, workers=4):
+        '''Gets the sample of every PV in pvs at time at, as {pv: sample or None}'''
+        date_string = self._time_string(at)
+        return self.get_data_at_times(pvs, [date_string], chunk_size, workers)[date_string]
+
+    def get_data_at_times(self, pvs, times, chunk_size=500, workers=4):
+        '''Gets snapshots of pvs at each of times, as {time string: {pv: sample or None}}.
+
+        Every (time, chunk of chunk_size PVs) pair is one getDataAtTime POST; up to workers of them run
+        at once (keep it at or below the session pool_size). A PV missing from the reply, or whose chunk
+        failed, is None; failures are kept in self.retrieval_errors keyed by (time string, pv).'''
+        pvs = list(dict.fromkeys(pvs))
+        chunk_size = max(1, chunk_size)
+        date_strings = [self._time_string(t) for t in times]
+        snapshots = {date_string: dict.fromkeys(pvs) for date_string in date_strings}
+        self.retrieval_errors = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            futures = {}
+            for date_string in snapshots:
+                for start in range(0, len(pvs), chunk_size):
+                    chunk = pvs[start:start + chunk_size]
+                    futures[executor.submit(self._post_data_at_time, chunk, date_string)] = (date_string, chunk)
+            for future in concurrent.futures.as_completed(futures):
+                date_string, chunk = futures[future]
+                try:
+                    result = future.result()
+                except (requests.RequestException, ValueError) as e:
+                    for pv in chunk:
+                        self.retrieval_errors[(date_string, pv)] = e
+                    continue
+                snapshot = snapshots[date_string]
+                for pv in chunk:
+                    snapshot[pv] = result.get(pv)
+        return snapshots
 
-        data = {}
-        for pv in self.pv_lists[list_name]:
-            data[pv] = self.get_pv_data_at_time(pv, date_string)
-        return data
+    def _post_data_at_time(self, pvs, date_string):
+        '''POSTs a list of PVs to getDataAtTime and returns the reply, {pv: sample}'''
+        resp = self.session.post(self.post_url + 'getDataAtTime', params={'at': date_string, 'includeProxies': 'false'}, json=pvs,
+                                 retry=True)
+        resp.raise_for_status()
+        return resp.json() or {}
 
 
     def get_pv_data_at_time(self, pv, time):
@@ -104,7 +310,7 @@ class ArchiverUtility:
         payload = [pv]
         request_string = self.post_url + 'getDataAtTime?at=' + date_string + '&;includeProxies=false'
         try:
-            resp = requests.post(request_string, json=[pv])
+            resp = self.session.post(request_string, json=[pv], retry=True)
             return resp.json()
         
         except ValueError:
@@ -112,23 +318,95 @@ class ArchiverUtility:
 
 
 
-    def pausePVs(self, list_name, keepdata=False):
-        '''Pauses the list of PV's specified by list_name'''
-        for pv in self.pv_lists[list_name]:
-            pvParams = (("pv", pv), ("deleteData", "true" if keepdata else "false"))
-            print(pvParams)
-            pausePVResponse = self.pausePV(pv)
-            if pausePVResponse.status_code != requests.codes.ok:
-                print("{} returned status code {} retrieving data for {}".format(parser.prog, pausePVResponse.status_code, pv))
-                    #print( 'Status code : ', deletePVResponse.status_code, ' returned for ', pv)
+    # bulk operation -> (endpoint, accepts a POSTed list of PVs)
+    BULK_OPERATIONS = {
+        'pause': ('pauseArchivingPV', True),
+        'resume': ('resumeArchivingPV', True),
+        'delete': ('deletePV', False),
+        'change': ('changeArchivalParameters', False),
+    }
+
+    def bulk_operation(self, operation, pvs, params=None, workers=8, chunk_size=500, dry_run=False):
+        '''Runs a management operation ('pause', 'resume', 'delete' or 'change') on every PV in pvs.
+
+        Operations with a list-accepting POST variant send chunk_size PVs per request, the others one GET
+        per PV with params added to it. Up to workers requests run at once. Returns {pv: BulkResult};
+        dry_run=True sends nothing and reports what would be done.'''
+        endpoint, accepts_list = self.BULK_OPERATIONS[operation]
+        pvs = list(dict.fromkeys(pvs))
+        params = dict(params or {})
+        if dry_run:
+            detail = ' '.join(f"{k}={v}" for k, v in params.items())
+            return {pv: BulkResult(pv, operation, True, f"would call {endpoint} {detail}".strip(), dry_run=True)
+                    for pv in pvs}
+
+        results = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            if accepts_list:
+                chunk_size = max(1, chunk_size)
+                futures = {executor.submit(self._bulk_post, operation, endpoint, pvs[i:i + chunk_size]): pvs[i:i + chunk_size]
+                           for i in range(0, len(pvs), chunk_size)}
             else:
-                print(pausePVResponse.text)
+                futures = {executor.submit(self._bulk_get, operation, endpoint, pv, params): [pv] for pv in pvs}
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    results.update(future.result())
+                except requests.RequestException as e:
+                    code = e.response.status_code if e.response is not None else None
+                    for pv in futures[future]:
+                        results[pv] = BulkResult(pv, operation, False, str(e), code)
+        return {pv: results[pv] for pv in pvs}
+
+    def _bulk_post(self, operation, endpoint, pvs):
+        '''POSTs a list of PVs to a list-accepting endpoint, returns {pv: BulkResult}'''
+        resp = self.session.post(self.web + endpoint, json=pvs)
+        resp.raise_for_status()
+        replies = {}
+        for item in resp.json():
+            # the appliance reports refusals in a 'validation' field, with a 200 status code
+            ok = 'validation' not in item
+            message = item.get('validation') or item.get('status') or ''
+            replies[item.get('pvName')] = BulkResult(item.get('pvName'), operation, ok, message, resp.status_code)
+        return {pv: replies.get(pv, BulkResult(pv, operation, False, 'no reply from appliance', resp.status_code))
+                for pv in pvs}
+
+    def _bulk_get(self, operation, endpoint, pv, params):
+        '''Runs a single-PV GET operation, returns {pv: BulkResult}'''
+        resp = self.session.get(self.web + endpoint, params={'pv': pv, **params}, retry=False)
+        try:
+            reply = resp.json()
+        except ValueError:
+            reply = None
+        validation = reply.get('validation') if isinstance(reply, dict) else None
+        if isinstance(reply, dict):
+            message = validation or reply.get('status') or ''
+        else:
+            message = resp.text.strip()
+        ok = resp.status_code == requests.codes.ok and not validation
+        return {pv: BulkResult(pv, operation, ok, message or resp.reason, resp.status_code)}
+
+    def pausePVs(self, list_name, keepdata=False, workers=8, dry_run=False):
+        '''Pauses the list of PV's specified by list_name, returns {pv: BulkResult} and prints the failures'''
+        results = self.bulk_operation('pause', self.pv_lists[list_name], workers=workers, dry_run=dry_run)
+        for result in results.values():
+            if not result.ok:
+                print("pauseArchivingPV returned status code {} for {}: {}".format(result.status_code, result.pv, result.message))
+        return results
+
+    def resumePVs(self, list_name, workers=8, dry_run=False):
+        '''Resumes archiving of the list of PV's specified by list_name, returns {pv: BulkResult}'''
+        return self.bulk_operation('resume', self.pv_lists[list_name], workers=workers, dry_run=dry_run)
+
+    def deletePVs(self, list_name, deleteData=False, workers=8, dry_run=False):
+        '''Deletes the (already paused) PV's specified by list_name, returns {pv: BulkResult}'''
+        params = {'deleteData': 'true' if deleteData else 'false'}
+        return self.bulk_operation('delete', self.pv_lists[list_name], params, workers=workers, dry_run=dry_run)
 
 
     def deletePV(self, pvParams):
         '''Deletes the PV specified by pvName'''
         url = self.web + '/deletePV'
-        deletePVResponse = requests.get(url, params=pvParams)
+        deletePVResponse = self.session.get(url, params=pvParams, retry=False)
         return deletePVResponse
 
 
@@ -136,7 +414,7 @@ class ArchiverUtility:
         '''Pauses the archiving pv'''
         url = self.web + '/pauseArchivingPV'
         payload = {'pv': pv}
-        pausePVResponse = requests.get(url, payload)
+        pausePVResponse = self.session.get(url, params=payload, retry=False)
         return pausePVResponse
 
     
@@ -150,7 +428,7 @@ class ArchiverUtility:
     def getPaused(self):
         '''Gets a list of paused PV's'''
         url = self.web + 'getPausedPVsForThisAppliance'
-        getPaused = requests.get(url)
+        getPaused = self.session.get(url)
         getPaused.raise_for_status() 
         if getPaused.status_code != requests.codes.ok:
             print(getPaused.status_code) 
@@ -172,7 +450,7 @@ class ArchiverUtility:
     def getDisconnects(self):
         '''Gets the currently disconnected PV's'''
         url = self.web + 'getCurrentlyDisconnectedPVs'
-        getDisc = requests.get(url)
+        getDisc = self.session.get(url)
         getDisc.raise_for_status() 
         if getDisc.status_code != requests.codes.ok:
             print(getDisc.status_code) 
@@ -180,21 +458,14 @@ class ArchiverUtility:
             return getDisc
 
     
-    def resamplePVs(self, list_name, samplingPeriod, samplingMethod):
-        '''Resamples all PV's in the given list to the given sampling period (in seconds) and sampling method (either 'MONITOR' or 'SCAN').'''
+    def resamplePVs(self, list_name, samplingPeriod, samplingMethod, workers=8, dry_run=False):
+        '''Resamples all PV's in the given list to the given sampling period (in seconds) and sampling method (either 'MONITOR' or 'SCAN'). Returns {pv: BulkResult}.'''
         if (samplingMethod != 'MONITOR' and samplingMethod != 'SCAN'):
             print("Error - samplingMethod must be 'MONITOR' or 'SCAN'")
             return
 
-        lines = []
-        pvParamList = []
-        pvParamKeys = ['pv', 'samplingperiod', 'samplingmethod']
-        for pv in self.pv_lists[list_name]:
-            pvParamVals = [pv, samplingPeriod, samplingMethod]
-            pvParamDict = {key:value for (key, value) in zip(pvParamKeys, pvParamVals)}
-            pvParamList.append(pvParamDict)
-            pvChangeParamsResponse = self.changeArchivalParameters(pvParamDict)
-            #print('Response returned with status ', pvChangeParamsResponse)
+        params = {'samplingperiod': samplingPeriod, 'samplingmethod': samplingMethod}
+        return self.bulk_operation('change', self.pv_lists[list_name], params, workers=workers, dry_run=dry_run)
 
 
     def resamplePV(self, pv, samplingPeriod, samplingMethod):
@@ -212,7 +483,7 @@ class ArchiverUtility:
     def changeArchivalParameters(self, pvParams):
         '''Changes the archival parameters using pvParams'''
         url = self.web + '/changeArchivalParameters'
-        resp = requests.get(url, params=pvParams)
+        resp = self.session.get(url, params=pvParams, retry=False)
         return resp.status_code
 
     @staticmethod
@@ -259,19 +530,27 @@ class ArchiverUtility:
 
     def get_status(self,pv_list:list[str])->dict[str,dict]:
         '''Gets all statuses of a stored list of PV's specified by list_name'''
+        cached = self.cache.get_many(self.web, pv_list) if self.cache is not None else {}
         data = {}
         for pv in pv_list:
-            data[pv] = self.get_pv_status(pv)
+            data[pv] = cached[pv] if pv in cached else self.get_pv_status(pv)
         return data
 
     def get_pv_status(self, pv):
-        '''Gets the status of a specific PV'''
+        '''Gets the status of a specific PV, from the status cache when it holds a fresh entry'''
+        if self.cache is not None:
+            cached = self.cache.get(self.web, pv)
+            if cached is not None:
+                return cached
+
         payload = {'pv': pv}
         url = self.web + "getPVStatus"
 
-        get_stats = requests.get(url, params=payload)
+        get_stats = self.session.get(url, params=payload)
         get_stats.raise_for_status()
 
         if get_stats.status_code == requests.codes.ok:
             stats = get_stats.json()
+            if self.cache is not None:
+                self.cache.put(self.web, pv, stats[0])
             return stats[0]
\ No newline at end of file
@@ -0,0 +1,33 @@
+"""
+Atomic file replacement shared by the caches, state snapshots and metrics.
+
+Readers (the next run, the node-exporter textfile collector) must never see a
+half written file. The content is written to a temporary file next to the
+target, unique per process and thread so concurrent writers never share one,
+and moved into place with `os.replace`.
+"""
+
+import json
+import os
+import threading
+
+
+def write_atomic(path: str, text: str):
+    """Replace the file at `path` with `text`, creating its directory if needed."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_json_atomic(path: str, obj):
+    """Replace the file at `path` with `obj` as compact JSON."""
+    write_atomic(path, json.dumps(obj, separators=(",", ":")))
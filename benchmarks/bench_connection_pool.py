@@ -0,0 +1,59 @@
+"""
+Before/after request rate for the pooled HTTP session.
+
+Runs the same single-PV getPVStatus loop against the local stand-in appliance
+twice: once through bare `requests.get` (a new connection per PV) and once
+through ArchiverUtility's pooled keep-alive session.
+
+    python benchmarks/bench_connection_pool.py -n 2000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from archiver_utility import ArchiverUtility  # noqa: E402
+from mock_appliance import MockAppliance  # noqa: E402
+
+
+def time_status_calls(util: ArchiverUtility, pvs):
+    start = time.perf_counter()
+    for pv in pvs:
+        util.get_pv_status(pv)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare request rates with and without connection pooling.")
+    parser.add_argument("-n", "--num-pvs", type=int, default=2000, help="Number of getPVStatus calls per run")
+    args = parser.parse_args()
+
+    server = MockAppliance().start()
+    pvs = [f"BENCH:PV:{i}" for i in range(args.num_pvs)]
+
+    util = ArchiverUtility("dev")
+    util.web = server.url + "/mgmt/bpl/"
+
+    pooled_session = util.session
+    results = {}
+    for label, session in (("bare requests", requests), ("pooled session", pooled_session)):
+        util.session = session
+        server.reset_counters()
+        elapsed = time_status_calls(util, pvs)
+        results[label] = (args.num_pvs / elapsed, server.connection_count)
+
+    server.stop()
+
+    for label, (rate, connections) in results.items():
+        print(f"{label:<16}  {rate:10.1f} req/s  {connections:6d} connections")
+    before, after = results["bare requests"][0], results["pooled session"][0]
+    print(f"speedup: {after / before:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
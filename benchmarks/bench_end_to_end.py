@@ -0,0 +1,252 @@
+"""
+End-to-end benchmark of the report tools and ArchiverUtility against the mock appliance.
+
+Writes a synthetic `$IOC_DATA` tree (see synthetic_ioc_data), starts
+mock_appliance in a separate process with the configured latency, error rate
+and PV population, points every utility at it and runs:
+
+- new_report_tool   run_subsystems over all subsystems (the --dump path)
+- new_report_tool_listings  the same, classifying PVs from the appliance listings
+- report_tool       the per-file report over a directory of .archive files
+- get_status        archiver_utility.ArchiverUtility.get_status
+- get_data          get_data (JSON, columnar) over a window of binned data
+- get_data_raw      the same through getData.raw
+- get_data_at_time  one getDataAtTime snapshot of all PVs
+
+Each scenario is timed once and, unless --no-memory is given, run a second
+time under tracemalloc for its peak Python heap. The appliance runs in its own
+process so neither figure includes the server's work. Requests are counted by
+the appliance, retried attempts included.
+
+    python benchmarks/bench_end_to_end.py --iocs 20 --files 5 --pvs 200 --latency 0.005 --concurrency 16
+"""
+
+import argparse
+import contextlib
+import gc
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import archiver_utility  # noqa: E402
+import new_report_tool  # noqa: E402
+import report_tool  # noqa: E402
+from synthetic_ioc_data import build_ioc_tree  # noqa: E402
+
+SCENARIOS = ("new_report_tool", "new_report_tool_listings", "report_tool", "get_status", "get_data", "get_data_raw", "get_data_at_time")
+
+
+@dataclass
+class ScenarioResult:
+    scenario: str
+    pvs: int
+    wall_s: float
+    requests: int
+    peak_mib: float = None
+
+    @property
+    def pvs_per_s(self) -> float:
+        return self.pvs / self.wall_s if self.wall_s else 0.0
+
+    @property
+    def requests_per_s(self) -> float:
+        return self.requests / self.wall_s if self.wall_s else 0.0
+
+
+class ApplianceProcess:
+    """mock_appliance.py running as a child process."""
+
+    def __init__(self, latency: float, error_rate: float, population_file: str, sample_period: float):
+        self.proc = subprocess.Popen(
+            [sys.executable, os.path.join(BENCH_DIR, "mock_appliance.py"), "--latency", str(latency),
+             "--error-rate", str(error_rate), "--population", population_file,
+             "--sample-period", str(sample_period)],
+            stdout=subprocess.PIPE, text=True,
+        )
+        self.url = self.proc.stdout.readline().strip()
+        if not self.url:
+            raise RuntimeError("mock appliance did not start")
+
+    def request_count(self) -> int:
+        return requests.get(self.url + "/mock/stats").json()["requests"]
+
+    def stop(self):
+        self.proc.terminate()
+        self.proc.wait()
+
+
+def point_at(util, url: str):
+    """Send all of a utility's appliance requests to `url`."""
+    util.web = url + "/mgmt/bpl/"
+    util.retrieval_url = url + "/retrieval/data/"
+    util.post_url = url + "/retrieval/data/"
+    return util
+
+
+def flat_archive_dir(ioc_root: str, target: str) -> str:
+    """Symlink every .archive file of the tree into one directory, as report_tool -d expects."""
+    os.makedirs(target, exist_ok=True)
+    for ioc in sorted(os.listdir(ioc_root)):
+        archive_dir = os.path.join(ioc_root, ioc, "archive")
+        if not os.path.isdir(archive_dir):
+            continue
+        for name in os.listdir(archive_dir):
+            link = os.path.join(target, name)
+            if not os.path.exists(link):
+                os.symlink(os.path.join(archive_dir, name), link)
+    return target
+
+
+def make_scenarios(args: argparse.Namespace, url: str, workdir: str, flat_dir: str,
+                   population: List[str]) -> Dict[str, Callable[[], int]]:
+    """Return {name: callable running the scenario once and returning the PVs it handled}."""
+    end = int(time.time()) - 3600
+    start = end - int(args.window_hours * 3600)
+    data_pvs = population[:args.data_pvs]
+
+    def run_new_report_tool(listings: bool = False):
+        cli = ["-a", "dev", "-sub", *args.subsystems, "-k", "UP", "-l", "--dump", "--no-parse-cache",
+               "--index-file", os.path.join(workdir, "index.json"),
+               "-b", str(args.batch_size), "--concurrency", str(args.concurrency)]
+        if listings:
+            cli.append("--listings")
+        tool_args = new_report_tool.build_parser().parse_args(cli)
+        util = point_at(new_report_tool.build_utility(tool_args), url)
+        outcomes = new_report_tool.run_subsystems(
+            tool_args.subsystem, util, new_report_tool.setup_search_kwargs(tool_args), tool_args.concurrency,
+            new_report_tool.build_index(tool_args), report_dir=os.path.join(workdir, "reports"),
+            listings=tool_args.listings)
+        return sum(outcome.pvs for outcome in outcomes.values())
+
+    def run_report_tool():
+        cli = ["-a", "dev", "-d", flat_dir, "-k", "All", "-l", "--no-parse-cache",
+               "--concurrency", str(args.concurrency)]
+        tool_args = report_tool.build_parser().parse_args(cli)
+        util = point_at(report_tool.ArchiverUtility(tool_args.archiver, pool_size=max(10, tool_args.concurrency)), url)
+        pv_dict, _ = report_tool.collect_pvs(tool_args, util)
+        search_kwargs = report_tool.setup_search_kwargs(tool_args)
+        for _ in report_tool.iter_reports(pv_dict, util, search_kwargs, tool_args.concurrency):
+            pass
+        return sum(len(pvs) for pvs in pv_dict.values())
+
+    def utility():
+        return point_at(archiver_utility.ArchiverUtility("dev", pool_size=max(10, args.concurrency)), url)
+
+    def run_get_status():
+        pvs = population[:args.status_pvs]
+        utility().get_status(pvs)
+        return len(pvs)
+
+    def run_get_data(raw: bool = False):
+        util = utility()
+        util.pv_lists["bench"] = data_pvs
+        util.get_data("bench", start, end, args.binsize, workers=args.concurrency, columnar=True, raw=raw)
+        return len(data_pvs)
+
+    def run_get_data_at_time():
+        util = utility()
+        util.pv_lists["bench"] = population
+        util.get_data_at_time("bench", end, workers=min(args.concurrency, 8))
+        return len(population)
+
+    return {
+        "new_report_tool": run_new_report_tool,
+        "new_report_tool_listings": lambda: run_new_report_tool(listings=True),
+        "report_tool": run_report_tool,
+        "get_status": run_get_status,
+        "get_data": run_get_data,
+        "get_data_raw": lambda: run_get_data(raw=True),
+        "get_data_at_time": run_get_data_at_time,
+    }
+
+
+def run_scenario(name: str, scenario: Callable[[], int], appliance: ApplianceProcess,
+                 memory: bool) -> ScenarioResult:
+    gc.collect()
+    before = appliance.request_count()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        pvs = scenario()
+        wall = time.perf_counter() - start
+    result = ScenarioResult(name, pvs, wall, appliance.request_count() - before)
+
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                scenario()
+            result.peak_mib = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the report tools and ArchiverUtility against a mock appliance.")
+    parser.add_argument("-s", "--subsystems", nargs="+", default=["bp", "mg"])
+    parser.add_argument("--iocs", type=int, default=10, help="IOC directories per subsystem")
+    parser.add_argument("--files", type=int, default=4, help=".archive files per IOC")
+    parser.add_argument("--pvs", type=int, default=100, help="PVs per .archive file")
+    parser.add_argument("--latency", type=float, default=0.002, help="Seconds the appliance adds to every request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of a 503 reply")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrency passed to the tools")
+    parser.add_argument("-b", "--batch-size", type=int, default=100, help="new_report_tool status batch size")
+    parser.add_argument("--status-pvs", type=int, default=1000,
+                        help="PVs looked up by the (sequential) get_status scenario")
+    parser.add_argument("--data-pvs", type=int, default=50, help="PVs retrieved by the get_data scenarios")
+    parser.add_argument("--window-hours", type=float, default=24, help="Retrieval window")
+    parser.add_argument("--binsize", type=int, default=60, help="mean_<binsize> operator of the retrieval")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc pass")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="archiver-bench-") as workdir:
+        ioc_root = os.path.join(workdir, "ioc")
+        population = build_ioc_tree(ioc_root, args.subsystems, args.iocs, args.files, args.pvs)
+        population_file = os.path.join(workdir, "population.txt")
+        with open(population_file, "w") as f:
+            f.writelines(pv + "\n" for pv in population)
+        flat_dir = flat_archive_dir(ioc_root, os.path.join(workdir, "flat"))
+        os.environ["IOC_DATA"] = ioc_root
+
+        print(f"{len(population)} distinct PVs, {len(args.subsystems) * args.iocs * args.files} .archive files, "
+              f"latency {args.latency * 1000:.1f} ms, error rate {args.error_rate:.1%}")
+
+        appliance = ApplianceProcess(args.latency, args.error_rate, population_file, args.binsize)
+        try:
+            scenarios = make_scenarios(args, appliance.url, workdir, flat_dir, population)
+            results = [run_scenario(name, scenarios[name], appliance, not args.no_memory) for name in args.scenarios]
+        finally:
+            appliance.stop()
+
+    print(f"{'scenario':<26} {'PVs':>8} {'wall s':>8} {'PVs/s':>10} {'requests':>9} {'req/s':>9} {'peak MiB':>9}")
+    for r in results:
+        peak = f"{r.peak_mib:9.1f}" if r.peak_mib is not None else f"{'-':>9}"
+        print(f"{r.scenario:<26} {r.pvs:8d} {r.wall_s:8.2f} {r.pvs_per_s:10.1f} {r.requests:9d} "
+              f"{r.requests_per_s:9.1f} {peak}")
+    maxrss_mib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"max RSS of the benchmark process: {maxrss_mib:.1f} MiB")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "max_rss_mib": maxrss_mib,
+                       "results": [dict(asdict(r), pvs_per_s=r.pvs_per_s, requests_per_s=r.requests_per_s)
+                                   for r in results]}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Bytes transferred and decode time of getData.json vs getData.raw.
+
+Decodes the same samples from both formats: JSON through
+PVTimeSeries.from_json, raw protocol buffers through archiver_pb.decode_raw.
+By default the payloads are synthesized (a noisy double PV); recorded
+responses can be passed instead, e.g. saved with
+
+    curl -o pv.json '<retrieval>/getData.json?pv=...&from=...&to=...'
+    curl -o pv.raw  '<retrieval>/getData.raw?pv=...&from=...&to=...'
+
+    python benchmarks/bench_retrieval_formats.py -n 200000
+    python benchmarks/bench_retrieval_formats.py --json-file pv.json --raw-file pv.raw
+"""
+
+import argparse
+import calendar
+import gzip
+import json
+import os
+import random
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from archiver_pb import decode_raw, escape  # noqa: E402
+from archiver_timeseries import PVTimeSeries  # noqa: E402
+
+SCALAR_DOUBLE = 6
+
+
+def _varint(value: int) -> bytes:
+    value &= 0xFFFFFFFFFFFFFFFF
+    out = bytearray()
+    while True:
+        b = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(b | 0x80)
+        else:
+            out.append(b)
+            return bytes(out)
+
+
+def _string_field(field: int, text: str) -> bytes:
+    data = text.encode()
+    return _varint(field << 3 | 2) + _varint(len(data)) + data
+
+
+def synth_samples(n: int, start: int = 1_700_000_000, period: float = 1.0, seed: int = 0):
+    """Return n (secs, nanos, val, severity, status) samples of a noisy signal."""
+    rng = random.Random(seed)
+    samples = []
+    for i in range(n):
+        t = start + i * period
+        secs = int(t)
+        samples.append((secs, int((t - secs) * 1e9), 100.0 + rng.gauss(0, 1), 0 if rng.random() > 0.01 else 1, 0))
+    return samples
+
+
+def synth_json(pv: str, samples) -> bytes:
+    data = [{"secs": s, "nanos": ns, "val": v, "severity": sev, "status": st} for s, ns, v, sev, st in samples]
+    return json.dumps([{"meta": {"name": pv, "PREC": "3"}, "data": data}]).encode()
+
+
+def synth_raw(pv: str, samples, payload_type: int = SCALAR_DOUBLE) -> bytes:
+    """Encode scalar double samples the way the appliance streams getData.raw (one chunk per year)."""
+    chunks = []
+    year = None
+    for secs, nanos, val, severity, status in samples:
+        sample_year = time.gmtime(secs).tm_year
+        if sample_year != year:
+            year = sample_year
+            year_start = calendar.timegm((year, 1, 1, 0, 0, 0))
+            header = _varint(0x7A) + _varint(len(b'\x0a\x04PREC\x12\x013')) + b'\x0a\x04PREC\x12\x013'
+            info = (_varint(1 << 3) + _varint(payload_type) + _string_field(2, pv)
+                    + _varint(3 << 3) + _varint(year) + header)
+            if chunks:
+                chunks.append(b'\n')
+            chunks.append(escape(info) + b'\n')
+        msg = (_varint(1 << 3) + _varint(secs - year_start) + _varint(2 << 3) + _varint(nanos)
+               + _varint(3 << 3 | 1) + struct.pack('<d', val))
+        if severity:
+            msg += _varint(4 << 3) + _varint(severity)
+        if status:
+            msg += _varint(5 << 3) + _varint(status)
+        chunks.append(escape(msg) + b'\n')
+    return b''.join(chunks)
+
+
+def best_of(repeat: int, func):
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare getData.json and getData.raw size and decode time.")
+    parser.add_argument("-n", "--num-samples", type=int, default=200000, help="Samples to synthesize")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="Decode runs per format, best is reported")
+    parser.add_argument("--json-file", help="Recorded getData.json response to use instead of synthesized data")
+    parser.add_argument("--raw-file", help="Recorded getData.raw response to use instead of synthesized data")
+    args = parser.parse_args()
+
+    if args.json_file and args.raw_file:
+        with open(args.json_file, 'rb') as f:
+            json_body = f.read()
+        with open(args.raw_file, 'rb') as f:
+            raw_body = f.read()
+    else:
+        samples = synth_samples(args.num_samples)
+        json_body = synth_json("BENCH:PV", samples)
+        raw_body = synth_raw("BENCH:PV", samples)
+
+    json_time, json_series = best_of(args.repeat, lambda: PVTimeSeries.from_json(json_body))
+    # feed the raw body in 64 KiB pieces like resp.iter_content() would
+    pieces = [raw_body[i:i + 65536] for i in range(0, len(raw_body), 65536)]
+    raw_time, raw_series = best_of(args.repeat, lambda: decode_raw(pieces))
+
+    n = len(json_series[0]) if json_series else 0
+    if raw_series and json_series:
+        assert len(raw_series[0]) == n, "formats decoded to different sample counts"
+
+    print(f"samples: {n}")
+    print(f"{'format':<6}  {'bytes':>12}  {'gzip bytes':>12}  {'decode s':>9}  {'samples/s':>11}")
+    for label, body, elapsed in (("json", json_body, json_time), ("raw", raw_body, raw_time)):
+        rate = n / elapsed if elapsed else float('inf')
+        print(f"{label:<6}  {len(body):12d}  {len(gzip.compress(body, 6)):12d}  {elapsed:9.3f}  {rate:11.0f}")
+    print(f"raw/json bytes: {len(raw_body) / len(json_body):.2f}  decode speedup: {json_time / raw_time:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+"""
+Local stand-in for the archiver appliance used by the benchmarks.
+
+Serves enough of the mgmt/bpl and retrieval interfaces to exercise the
+ArchiverUtility classes and report tools without touching a production
+appliance. PV statuses are derived from the PV name so results are
+deterministic:
+
+- names ending in `P` are Paused
+- names ending in `N` are Not being archived
+- names ending in `D` are Being archived but currently disconnected
+- names ending in `C` never connected (Initial sampling)
+- everything else is Being archived
+
+When a PV population is given, PVs outside it are Not being archived and the
+listing endpoints (getAllPVs, getPausedPVsForThisAppliance, ...) report from it.
+
+Retrieval (getData.json, getData.raw, getDataAtTime) returns a synthetic
+signal sampled every `sample_period` seconds, or every N seconds for
+`mean_N(pv)`. Management calls (pause, resume, delete, change parameters)
+are acknowledged without changing any state.
+
+Every request can be delayed by `latency` seconds and fails with a 503 with
+probability `error_rate`.
+
+Usage
+-----
+    server = MockAppliance(latency=0.01)
+    server.start()
+    util.web = server.url + "/mgmt/bpl/"
+    ...
+    server.stop()
+
+or as a separate process, printing its URL on the first line of stdout:
+
+    python benchmarks/mock_appliance.py --latency 0.01 --population pvs.txt
+"""
+
+import argparse
+import datetime
+import fnmatch
+import gzip
+import json
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterable, Optional
+from urllib.parse import parse_qs, urlparse
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+from bench_retrieval_formats import synth_raw  # noqa: E402
+
+_OPERATOR = re.compile(r"^\w+_(\d+)\((.*)\)$")
+
+
+def pv_status(pv: str) -> dict:
+    """Return the getPVStatus entry the stand-in reports for `pv`."""
+    if pv.endswith("P"):
+        return {"pvName": pv, "status": "Paused",
+                "lastEvent": "Jan/01/2026 00:00:00 -08:00", "connectionState": "true"}
+    if pv.endswith("N"):
+        return {"pvName": pv, "status": "Not being archived"}
+    if pv.endswith("C"):
+        return {"pvName": pv, "status": "Initial sampling", "connectionState": "false"}
+    if pv.endswith("D"):
+        return {"pvName": pv, "status": "Being archived",
+                "lastEvent": "Jan/01/2026 12:00:00 -08:00", "connectionState": "false"}
+    return {"pvName": pv, "status": "Being archived",
+            "lastEvent": "Jan/02/2026 00:00:00 -08:00", "connectionState": "true"}
+
+
+def _parse_time(text: str) -> float:
+    if text.endswith("Z"):
+        text = text[:-1] + "+00:00"
+    return datetime.datetime.fromisoformat(text).timestamp()
+
+
+def _value(pv: str, t: float) -> float:
+    phase = zlib.crc32(pv.encode()) % 1000
+    return 100.0 + 10.0 * math.sin((t + phase) / 600.0)
+
+
+def synth_pv_samples(pv: str, start: float, end: float, period: float):
+    """(secs, nanos, val, severity, status) samples of `pv` in [start, end], plus the one before start."""
+    first = (math.ceil(start / period) - 1) * period
+    samples = []
+    t = first
+    while t <= end:
+        secs = int(t)
+        samples.append((secs, int(round((t - secs) * 1e9)), _value(pv, t), 0, 0))
+        t += period
+    return samples
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so clients can keep the connection alive between requests
+    protocol_version = "HTTP/1.1"
+    # send headers and body in one segment, otherwise delayed ACKs stall every
+    # keep-alive request by ~40 ms
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_body(self, body: bytes, content_type: str, code: int = 200):
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        if "gzip" in self.headers.get("Accept-Encoding", "") and len(body) > 256:
+            body = gzip.compress(body, 1)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, obj, code: int = 200):
+        self._send_body(json.dumps(obj).encode(), "application/json", code)
+
+    def _count(self):
+        with self.server.lock:
+            self.server.request_count += 1
+            self.server.connections.add(self.client_address)
+
+    def _simulate(self) -> bool:
+        """Apply latency and error injection, return False if the request was failed."""
+        self._count()
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if self.server.error_rate and self.server.rng.random() < self.server.error_rate:
+            self._send_json({"error": "injected failure"}, 503)
+            return False
+        return True
+
+    # status ---------------------------------------------------------------
+
+    def _status(self, pv: str) -> dict:
+        if self.server.population is not None and pv not in self.server.population_set:
+            return {"pvName": pv, "status": "Not being archived"}
+        return pv_status(pv)
+
+    def _listing(self, endpoint: str, query: dict):
+        population = self.server.population or []
+        if endpoint in ("getAllPVs", "getAllExpandedPVNames"):
+            pattern = query.get("pv", ["*"])[0]
+            names = [pv for pv in population if not pv.endswith("N") and fnmatch.fnmatchcase(pv, pattern)]
+            limit = int(query.get("limit", ["500"])[0])
+            return names if limit < 0 else names[:limit]
+        if endpoint == "getPausedPVsForThisAppliance":
+            return [{"pvName": pv, "instance": "mock", "modificationTime": "Jan/01/2026 00:00:00 -08:00"}
+                    for pv in population if pv.endswith("P")]
+        if endpoint == "getCurrentlyDisconnectedPVs":
+            return [{"pvName": pv, "instance": "mock", "connectionLostAt": "Jan/01/2026 12:00:00 -08:00",
+                     "lastKnownEvent": "Jan/01/2026 12:00:00 -08:00"}
+                    for pv in population if pv.endswith("D")]
+        if endpoint == "getNeverConnectedPVs":
+            return [{"pvName": pv, "requestTime": "Jan/01/2026 00:00:00 -08:00"}
+                    for pv in population if pv.endswith("C")]
+        return None
+
+    # retrieval ------------------------------------------------------------
+
+    def _samples(self, query: dict):
+        name = query["pv"][0]
+        period = self.server.sample_period
+        match = _OPERATOR.match(name)
+        if match:
+            period = float(match.group(1))
+            name = match.group(2)
+        return name, synth_pv_samples(name, _parse_time(query["from"][0]), _parse_time(query["to"][0]), period)
+
+    def _get_data_json(self, query: dict):
+        name, samples = self._samples(query)
+        data = [{"secs": s, "nanos": ns, "val": v, "severity": sev, "status": st} for s, ns, v, sev, st in samples]
+        self._send_json([{"meta": {"name": name, "PREC": "3"}, "data": data}])
+
+    def _get_data_raw(self, query: dict):
+        name, samples = self._samples(query)
+        self._send_body(synth_raw(name, samples) if samples else b"", "application/x-protobuf")
+
+    def _get_data_at_time(self, query: dict, pvs: Iterable[str]):
+        at = _parse_time(query["at"][0])
+        reply = {}
+        for pv in pvs:
+            if self._status(pv)["status"] == "Not being archived":
+                continue
+            t = math.floor(at / self.server.sample_period) * self.server.sample_period
+            reply[pv] = {"secs": int(t), "nanos": 0, "val": _value(pv, t), "severity": 0, "status": 0}
+        self._send_json(reply)
+
+    # dispatch -------------------------------------------------------------
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        endpoint = url.path.rsplit("/", 1)[-1]
+        if url.path == "/mock/stats":
+            return self._send_json({"requests": self.server.request_count,
+                                    "connections": len(self.server.connections)})
+        if not self._simulate():
+            return
+        if endpoint == "getPVStatus":
+            self._send_json([self._status(pv) for pv in query["pv"][0].split(",")])
+        elif endpoint == "getData.json":
+            self._get_data_json(query)
+        elif endpoint == "getData.raw":
+            self._get_data_raw(query)
+        elif endpoint in ("pauseArchivingPV", "resumeArchivingPV", "deletePV", "changeArchivalParameters"):
+            self._send_json({"pvName": query.get("pv", [""])[0], "status": "ok"})
+        else:
+            listing = self._listing(endpoint, query)
+            if listing is None:
+                self.send_error(404)
+            else:
+                self._send_json(listing)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        endpoint = url.path.rsplit("/", 1)[-1]
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        if url.path == "/mock/reset":
+            self.server.reset()
+            return self._send_json({"status": "ok"})
+        if not self._simulate():
+            return
+        payload = json.loads(body or b"[]")
+        if endpoint == "getPVStatus":
+            self._send_json([self._status(pv) for pv in payload])
+        elif endpoint == "getDataAtTime":
+            self._get_data_at_time(query, payload)
+        elif endpoint in ("pauseArchivingPV", "resumeArchivingPV"):
+            self._send_json([{"pvName": pv, "status": "ok"} for pv in payload])
+        else:
+            self.send_error(404)
+
+
+class MockAppliance:
+    """
+    Threaded HTTP server standing in for an archiver appliance on localhost.
+
+    Parameters
+    ----------
+    host, port : optional
+        Address to listen on, by default an ephemeral port on 127.0.0.1.
+    latency : float, optional
+        Seconds every request is delayed by.
+    error_rate : float, optional
+        Probability of answering a request with 503.
+    population : iterable of str, optional
+        PVs known to the appliance; all PVs are known if omitted.
+    sample_period : float, optional
+        Seconds between raw retrieval samples, by default 1.
+    seed : int, optional
+        Seed of the error injection.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, error_rate: float = 0.0,
+                 population: Optional[Iterable[str]] = None, sample_period: float = 1.0, seed: int = 0):
+        self.server = ThreadingHTTPServer((host, port), _Handler)
+        self.server.daemon_threads = True
+        self.server.request_queue_size = 128
+        self.server.lock = threading.Lock()
+        self.server.latency = latency
+        self.server.error_rate = error_rate
+        self.server.population = list(dict.fromkeys(population)) if population is not None else None
+        self.server.population_set = set(self.server.population or ())
+        self.server.sample_period = sample_period
+        self.server.rng = random.Random(seed)
+        self.server.reset = self.reset_counters
+        self.server.request_count = 0
+        self.server.connections = set()
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def request_count(self) -> int:
+        return self.server.request_count
+
+    @property
+    def connection_count(self) -> int:
+        """Number of distinct client sockets seen since the last reset."""
+        return len(self.server.connections)
+
+    def reset_counters(self):
+        with self.server.lock:
+            self.server.request_count = 0
+            self.server.connections = set()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the stand-in archiver appliance until interrupted.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of a 503 reply")
+    parser.add_argument("--population", help="File with one known PV name per line")
+    parser.add_argument("--sample-period", type=float, default=1.0, help="Seconds between retrieval samples")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    population = None
+    if args.population:
+        with open(args.population) as f:
+            population = [line.strip() for line in f if line.strip()]
+
+    server = MockAppliance(args.host, args.port, args.latency, args.error_rate, population,
+                           args.sample_period, args.seed)
+    print(server.url, flush=True)
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server.server_close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""
+Synthetic `$IOC_DATA` tree of .archive files for the benchmarks.
+
+Lays out `<root>/sioc-<area>-<subsystem><nn>/archive/<ioc>_<n>.archive` like the
+production IOC data tree, so PathGenerator/ArchiveIndex find the files by
+subsystem. PV names end in the suffixes mock_appliance uses to pick a status
+(P paused, N not archived, D disconnected, C never connected), in the given
+proportions; a share of the PVs is repeated in a second file, as PVs listed by
+several IOCs are in production.
+
+    python benchmarks/synthetic_ioc_data.py /tmp/ioc -s bp mg --iocs 20 --files 5 --pvs 200
+"""
+
+import argparse
+import os
+import random
+from typing import Dict, List, Sequence
+
+DEFAULT_MIX = {"P": 0.05, "N": 0.05, "D": 0.02, "C": 0.01}
+AREAS = ("in20", "li21", "bsyh", "ltuh", "undh")
+
+
+def _suffix(rng: random.Random, mix: Dict[str, float]) -> str:
+    draw = rng.random()
+    for suffix, share in mix.items():
+        if draw < share:
+            return suffix
+        draw -= share
+    return ""
+
+
+def build_ioc_tree(root: str, subsystems: Sequence[str] = ("bp", "mg"), iocs: int = 10, files: int = 4,
+                   pvs: int = 100, mix: Dict[str, float] = None, shared: float = 0.05, seed: int = 0) -> List[str]:
+    """
+    Write a synthetic IOC data tree under `root`.
+
+    Parameters
+    ----------
+    root : str
+        Directory to create the IOC directories in.
+    subsystems : sequence of str, optional
+        Subsystems to create IOCs for.
+    iocs : int, optional
+        IOC directories per subsystem.
+    files : int, optional
+        .archive files per IOC.
+    pvs : int, optional
+        PV lines per .archive file.
+    mix : dict, optional
+        Share of PVs per status suffix, by default DEFAULT_MIX.
+    shared : float, optional
+        Share of PV lines repeating a PV of an earlier file.
+    seed : int, optional
+        Seed of the random layout.
+
+    Returns
+    -------
+    list of str
+        Every distinct PV name written, in the order written.
+    """
+    rng = random.Random(seed)
+    mix = DEFAULT_MIX if mix is None else mix
+    population = []
+    for subsystem in subsystems:
+        for n in range(iocs):
+            area = AREAS[n % len(AREAS)]
+            ioc = f"sioc-{area}-{subsystem}{n:02d}"
+            archive_dir = os.path.join(root, ioc, "archive")
+            os.makedirs(archive_dir, exist_ok=True)
+            for f in range(files):
+                lines = [f"# synthetic archive file {f} of {ioc}\n"]
+                for k in range(pvs):
+                    if population and rng.random() < shared:
+                        pv = rng.choice(population)
+                    else:
+                        pv = f"{subsystem.upper()}:{area.upper()}:{n * files + f}:{k}{_suffix(rng, mix)}"
+                        population.append(pv)
+                    lines.append(f"{pv} 1 Monitor\n")
+                with open(os.path.join(archive_dir, f"{ioc}_{f}.archive"), "w") as out:
+                    out.writelines(lines)
+    return population
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic IOC data tree of .archive files.")
+    parser.add_argument("root", help="Directory to write the tree to")
+    parser.add_argument("-s", "--subsystems", nargs="+", default=["bp", "mg"])
+    parser.add_argument("--iocs", type=int, default=10, help="IOC directories per subsystem")
+    parser.add_argument("--files", type=int, default=4, help=".archive files per IOC")
+    parser.add_argument("--pvs", type=int, default=100, help="PVs per .archive file")
+    parser.add_argument("--population", help="Also write the distinct PV names to this file, one per line")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    population = build_ioc_tree(args.root, args.subsystems, args.iocs, args.files, args.pvs, seed=args.seed)
+    if args.population:
+        with open(args.population, "w") as f:
+            f.writelines(pv + "\n" for pv in population)
+    print(f"{len(population)} PVs under {args.root}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Bulk Channel Access connectivity probe.
+
+Checking PVs one at a time with `epics.PV(pv).wait_for_connection(timeout=.25)`
+costs up to a quarter of a second per disconnected PV. `ConnectivityProbe`
+instead creates every channel up front, lets the CA library search for all of
+them at once, and waits a single shared deadline before splitting the PVs into
+connected and disconnected sets.
+
+The CA calls go through a small backend object so the probe can be driven by
+something other than pyepics (e.g. a fake backend with a fixed set of live PVs).
+"""
+
+import time
+from typing import Iterable, Set, Tuple
+
+import epics
+
+
+class EpicsChannelBackend:
+    """Channel backend built on pyepics' low level `epics.ca` module."""
+
+    def use_context(self):
+        # worker threads need to attach to the process-wide CA context
+        epics.ca.use_initial_context()
+
+    def create_channel(self, pvname: str):
+        return epics.ca.create_channel(pvname, connect=False, auto_cb=False)
+
+    def poll(self, timeout: float):
+        epics.ca.pend_event(timeout)
+
+    def is_connected(self, channel) -> bool:
+        return bool(epics.ca.isConnected(channel))
+
+    def clear_channel(self, channel):
+        epics.ca.clear_channel(channel)
+
+
+class ConnectivityProbe:
+    """
+    Check many PVs for Channel Access connectivity against one shared deadline.
+
+    Parameters
+    ----------
+    timeout : float, optional
+        Total time in seconds to wait for channels to connect, by default 1.0.
+    backend : object, optional
+        Channel backend implementing `use_context`, `create_channel`, `poll`,
+        `is_connected` and `clear_channel`. Defaults to `EpicsChannelBackend`.
+    poll_interval : float, optional
+        Time in seconds spent processing CA events between connection checks.
+    """
+
+    def __init__(self, timeout: float = 1.0, backend=None, poll_interval: float = 0.05):
+        self.timeout = timeout
+        self.backend = backend if backend is not None else EpicsChannelBackend()
+        self.poll_interval = poll_interval
+
+    def probe(self, pvs: Iterable[str]) -> Tuple[Set[str], Set[str]]:
+        """Return (connected, disconnected) sets for the given PVs."""
+        pending = list(dict.fromkeys(pvs))
+        connected = set()
+        if not pending:
+            return connected, set()
+
+        self.backend.use_context()
+        channels = {}
+        try:
+            for pv in pending:
+                channels[pv] = self.backend.create_channel(pv)
+
+            deadline = time.monotonic() + self.timeout
+            while pending:
+                self.backend.poll(self.poll_interval)
+                still_pending = []
+                for pv in pending:
+                    if self.backend.is_connected(channels[pv]):
+                        connected.add(pv)
+                    else:
+                        still_pending.append(pv)
+                pending = still_pending
+                if time.monotonic() >= deadline:
+                    break
+        finally:
+            # the CA context outlives the probe, don't leave channels behind in it
+            for channel in channels.values():
+                self.backend.clear_channel(channel)
+
+        return connected, set(pending)
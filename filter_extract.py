@@ -1,6 +1,13 @@
+import json
 import yaml
 import argparse
 
+try:
+    # libyaml based parser, much faster than the pure-Python one
+    from yaml import CSafeLoader as StreamLoader
+except ImportError:
+    from yaml import SafeLoader as StreamLoader
+
 def load_yaml(file_path):
     """Load YAML file."""
     with open(file_path, "r") as f:
@@ -18,6 +25,89 @@ def extract_pvs(yaml_data, filter_text=None):
                         pvs.append(pv)
     return pvs
 
+def _skip_node(events, event):
+    """Consume the rest of the node that starts with `event`."""
+    if isinstance(event, (yaml.SequenceStartEvent, yaml.MappingStartEvent)):
+        depth = 1
+        while depth:
+            event = next(events)
+            if isinstance(event, (yaml.SequenceStartEvent, yaml.MappingStartEvent)):
+                depth += 1
+            elif isinstance(event, (yaml.SequenceEndEvent, yaml.MappingEndEvent)):
+                depth -= 1
+
+def _iter_yaml_entries(f):
+    """Yield (pv, status) pairs from a {file: [{pv: status}, ...]} YAML report, event by event.
+
+    A status that is not a plain scalar is yielded as None.
+    """
+    events = yaml.parse(f, Loader=StreamLoader)
+    for event in events:
+        if isinstance(event, yaml.MappingStartEvent):
+            break
+    else:
+        return
+
+    # top level mapping: archive file -> list of entries
+    for key in events:
+        if isinstance(key, yaml.MappingEndEvent):
+            return
+        _skip_node(events, key)
+        value = next(events)
+        if not isinstance(value, yaml.SequenceStartEvent):
+            _skip_node(events, value)
+            continue
+
+        for item in events:
+            if isinstance(item, yaml.SequenceEndEvent):
+                break
+            if not isinstance(item, yaml.MappingStartEvent):
+                _skip_node(events, item)
+                continue
+
+            # only the first pair of each entry is the PV and its status
+            first = True
+            for entry_key in events:
+                if isinstance(entry_key, yaml.MappingEndEvent):
+                    break
+                entry_value = next(events)
+                if first and isinstance(entry_key, yaml.ScalarEvent):
+                    if isinstance(entry_value, yaml.ScalarEvent):
+                        yield entry_key.value, entry_value.value
+                    else:
+                        _skip_node(events, entry_value)
+                        yield entry_key.value, None
+                else:
+                    _skip_node(events, entry_key)
+                    _skip_node(events, entry_value)
+                first = False
+
+def _iter_jsonl_entries(f):
+    """Yield (pv, status) pairs from a JSON Lines report written by report_writer."""
+    for line in f:
+        if line.strip():
+            for entry in json.loads(line)["pvs"]:
+                for pv, status in list(entry.items())[:1]:
+                    yield pv, status
+
+def iter_report_entries(file_path):
+    """Yield (pv, status) pairs from a YAML or JSON Lines report without loading it whole."""
+    with open(file_path, "r") as f:
+        if file_path.endswith((".jsonl", ".ndjson")):
+            yield from _iter_jsonl_entries(f)
+        else:
+            yield from _iter_yaml_entries(f)
+
+def stream_pvs(file_path, output_file, filter_text=None):
+    """Write matching PVs from a report to output_file as they are parsed, return how many."""
+    count = 0
+    with open(output_file, "w") as out:
+        for pv, status in iter_report_entries(file_path):
+            if '?' not in pv and (filter_text is None or (status is not None and filter_text in status)):
+                out.write(f"{pv}\n")
+                count += 1
+    return count
+
 def write_pvs_to_file(pvs, output_file):
     """Write PVs to a text file, one per line."""
     with open(output_file, "w") as f:
@@ -25,19 +115,18 @@ def write_pvs_to_file(pvs, output_file):
             f.write(f"{pv}\n")
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Extract and filter PVs from a YAML file.")
-    parser.add_argument("-f", "--yaml_file", help="Path to the YAML file")
+    parser = argparse.ArgumentParser(description="Extract and filter PVs from a YAML or JSON Lines report.")
+    parser.add_argument("-f", "--yaml_file", help="Path to the YAML (or .jsonl) report file")
     parser.add_argument("-o", "--output_file", help="Path to the output text file")
     parser.add_argument("--filter", choices=["Paused", "Archived"], help="Filter PVs by status")
 
     args = parser.parse_args()
 
-    yaml_data = load_yaml(args.yaml_file)
+    filter = None
     if args.filter =='Paused':
         filter = 'Paused'
     elif args.filter == 'Archived':
         filter= "Not being archived"
-    pvs = extract_pvs(yaml_data, filter)
-    write_pvs_to_file(pvs, args.output_file)
+    stream_pvs(args.yaml_file, args.output_file, filter)
 
     print(f"Filtered PV list written to {args.output_file}")
@@ -0,0 +1,398 @@
+"""
+HTTP session setup shared by the ArchiverUtility classes.
+
+Bare `requests.get`/`requests.post` calls open a fresh TCP connection per PV.
+`build_session` returns a `requests.Session` with a keep-alive connection pool
+so sequential and threaded callers reuse a handful of sockets instead.
+
+The session is a `ResilientSession`, which puts every request through
+
+- retries with jittered exponential backoff for connection errors, timeouts
+  and 429/5xx replies (honouring Retry-After). Only GET/HEAD/OPTIONS requests
+  are retried by default; callers pass `retry=True` for read-only POSTs (e.g.
+  getPVStatus batches) and `retry=False` for GETs that change the appliance
+  (pauseArchivingPV, deletePV, ...). Requests that never reached the
+  appliance (connect timeouts) are always retried.
+- an `AdaptiveLimiter` that bounds the requests in flight and adjusts the
+  bound AIMD style: +1 per window of healthy replies, halved on connection
+  errors, timeouts, 429/503 replies and replies much slower than usual for
+  their endpoint. getData and getPVStatus replies differ too much for one
+  latency baseline, so one is kept per endpoint. A streamed response
+  (`stream=True`) holds its slot until it is closed, so it must be closed,
+  e.g. by using it as a context manager.
+- a `CircuitBreaker` that stops sending requests for a while once most recent
+  ones failed, then lets a single probe through to test recovery. Requests
+  held back by it wait inside the retry loop, within the retry budget.
+
+Callers keep using `session.get`/`session.post` and `raise_for_status` as before.
+"""
+
+import collections
+import functools
+import random
+import threading
+import time
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from run_metrics import endpoint_name
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = (10, 120)  # connect, read seconds
+
+# replies worth retrying: throttling and transient server side failures
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# replies telling the client to send less
+CONGESTION_STATUSES = frozenset({429, 503})
+
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """Raised instead of sending a request while the circuit breaker is open."""
+
+
+class AdaptiveLimiter:
+    """
+    Additive-increase/multiplicative-decrease bound on requests in flight.
+
+    The bound shrinks on failures (connection errors, timeouts, 429/503
+    replies) and on replies slower than `latency_tolerance` times the usual
+    latency of their endpoint, an exponentially weighted average kept per
+    endpoint (getPVStatus, getData.json, ...). Healthy replies grow it back,
+    up to `max_limit`: the connection pool holds no more connections, so more
+    requests in flight would only queue for one.
+
+    Parameters
+    ----------
+    max_limit : int
+        Upper bound, normally the connection pool size.
+    initial : int, optional
+        Starting bound, by default `max_limit`.
+    min_limit : int, optional
+        Lower bound, by default 1.
+    latency_tolerance : float, optional
+        A reply slower than this multiple of its endpoint's baseline counts
+        as a congestion signal, by default 3.
+    latency_floor : float, optional
+        Latencies below this many seconds never count as congestion, by default 0.25.
+    smoothing : float, optional
+        Weight of a new reply in its endpoint's baseline, by default 0.1.
+    warmup : int, optional
+        Replies an endpoint needs before its latency is judged, by default 5.
+    backoff : float, optional
+        Factor applied to the bound on congestion, by default 0.5.
+    cooldown : float, optional
+        Minimum seconds between two decreases, so one burst of failed replies
+        only halves the bound once, by default 1.
+    """
+
+    def __init__(self, max_limit: int, initial: Optional[int] = None, min_limit: int = 1,
+                 latency_tolerance: float = 3.0, latency_floor: float = 0.25, smoothing: float = 0.1,
+                 warmup: int = 5, backoff: float = 0.5, cooldown: float = 1.0):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        start = initial if initial is not None else self.max_limit
+        self.limit = float(min(self.max_limit, max(self.min_limit, start)))
+        self.latency_tolerance = latency_tolerance
+        self.latency_floor = latency_floor
+        self.smoothing = smoothing
+        self.warmup = warmup
+        self.backoff = backoff
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.decreases = 0
+        # endpoint -> [latency baseline in seconds, replies seen]
+        self.baselines: Dict[str, list] = {}
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """Block until a request may be sent."""
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def _slow(self, endpoint: str, latency: float) -> bool:
+        """Compare a reply with its endpoint's baseline, then fold it into the baseline."""
+        baseline = self.baselines.get(endpoint)
+        if baseline is None:
+            self.baselines[endpoint] = [latency, 1]
+            return False
+        slow = (baseline[1] >= self.warmup
+                and latency > max(self.latency_floor, self.latency_tolerance * baseline[0]))
+        baseline[0] += self.smoothing * (latency - baseline[0])
+        baseline[1] += 1
+        return slow
+
+    def release(self, endpoint: str = "", latency: Optional[float] = None, congested: bool = False):
+        """
+        Finish a request.
+
+        `congested` when the appliance failed or pushed back. `latency` is the
+        reply time in seconds of a request that got a regular reply, None when
+        it got none (or an error reply) and the bound should not grow.
+        """
+        with self._cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if not congested and latency is not None:
+                congested = self._slow(endpoint, latency)
+            if congested:
+                if now - self._last_decrease >= self.cooldown:
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+                    self._last_decrease = now
+                    self.decreases += 1
+            elif latency is not None:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+
+class CircuitBreaker:
+    """
+    Stop calling an unhealthy appliance for a while.
+
+    Parameters
+    ----------
+    failure_ratio : float, optional
+        Share of failed requests among the last `window` that opens the
+        circuit, by default 0.5.
+    window : int, optional
+        Number of recent requests considered, by default 20.
+    reset_timeout : float, optional
+        Seconds the circuit stays open before a probe request is let through,
+        by default 30.
+    """
+
+    def __init__(self, failure_ratio: float = 0.5, window: int = 20, reset_timeout: float = 30.0):
+        self.failure_ratio = failure_ratio
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.trips = 0
+        self._results = collections.deque(maxlen=max(1, window))
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def retry_in(self) -> float:
+        """Seconds until the open circuit lets a probe through, 0 if it is not open."""
+        with self._lock:
+            if self.state != 'open':
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def before(self):
+        """Raise CircuitOpenError if no request may be sent right now."""
+        with self._lock:
+            if self.state == 'open':
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    raise CircuitOpenError("appliance circuit breaker is open, not sending request")
+                self.state = 'half-open'
+                self._probing = False
+            if self.state == 'half-open':
+                if self._probing:
+                    raise CircuitOpenError("appliance circuit breaker is testing recovery, not sending request")
+                self._probing = True
+
+    def record(self, failed: bool):
+        """Record the outcome of a request let through by `before`."""
+        with self._lock:
+            if self.state == 'half-open':
+                self._probing = False
+                if failed:
+                    self._open()
+                else:
+                    self.state = 'closed'
+                    self._results.clear()
+                return
+            self._results.append(failed)
+            if (len(self._results) == self._results.maxlen
+                    and sum(self._results) >= self.failure_ratio * len(self._results)):
+                self._open()
+
+    def abandon(self):
+        """Forget a request let through by `before` that ended without an outcome."""
+        with self._lock:
+            if self.state == 'half-open':
+                self._probing = False
+
+    def _open(self):
+        self.state = 'open'
+        self._opened_at = time.monotonic()
+        self._results.clear()
+        self.trips += 1
+
+
+class ResilientSession(requests.Session):
+    """
+    `requests.Session` with retries, adaptive concurrency and a circuit breaker.
+
+    Every request method takes an extra `retry` keyword: None (default)
+    retries idempotent methods only, True/False force it on or off.
+
+    Parameters
+    ----------
+    pool_size : int, optional
+        Connection pool size and upper bound of the adaptive limiter.
+    retries : int, optional
+        Retries after the first attempt of a failed request, by default 3.
+        Waiting for an open circuit breaker uses up a retry as well, and is
+        only done when it reopens within `max_backoff`.
+    backoff_base : float, optional
+        Base of the exponential backoff in seconds, by default 0.5.
+    max_backoff : float, optional
+        Cap on a single backoff sleep in seconds, by default 30.
+    timeout : tuple or float, optional
+        Timeout used for requests that do not pass one.
+    limiter : AdaptiveLimiter, optional
+        Pass None to disable concurrency limiting.
+    breaker : CircuitBreaker, optional
+        Pass None to disable the circuit breaker.
+    """
+
+    def __init__(self, pool_size: int = DEFAULT_POOL_SIZE, retries: int = 3, backoff_base: float = 0.5,
+                 max_backoff: float = 30.0, timeout=DEFAULT_TIMEOUT,
+                 limiter: Optional[AdaptiveLimiter] = ..., breaker: Optional[CircuitBreaker] = ...):
+        super().__init__()
+        self.retries = max(0, retries)
+        self.backoff_base = backoff_base
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.limiter = AdaptiveLimiter(pool_size) if limiter is ... else limiter
+        self.breaker = CircuitBreaker() if breaker is ... else breaker
+        self.stats = collections.Counter()
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key: str):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def _backoff(self, attempt: int, resp: Optional[requests.Response]) -> float:
+        # full jitter keeps retrying threads from hitting the appliance in lockstep
+        delay = random.uniform(0, min(self.max_backoff, self.backoff_base * 2 ** attempt))
+        retry_after = resp.headers.get("Retry-After") if resp is not None else None
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, min(self.max_backoff, float(retry_after)))
+        return delay
+
+    def _wait(self, delay: float):
+        self._count("retries")
+        time.sleep(delay)
+
+    def request(self, method, url, *args, retry: Optional[bool] = None, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        if retry is None:
+            retry = method.upper() in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            if self.breaker is not None:
+                try:
+                    self.breaker.before()
+                except CircuitOpenError:
+                    # nothing was sent, so waiting is safe whatever the method
+                    retry_in = self.breaker.retry_in()
+                    if attempt >= self.retries or retry_in > self.max_backoff:
+                        raise
+                    self._wait(max(retry_in, self._backoff(attempt, None)))
+                    attempt += 1
+                    continue
+            if self.limiter is not None:
+                self.limiter.acquire()
+            resp = error = None
+            sent = True
+            latency = None
+            try:
+                resp = super().request(method, url, *args, **kwargs)
+                failed = resp.status_code in RETRY_STATUSES
+                congested = resp.status_code in CONGESTION_STATUSES
+                if not failed:
+                    # time to the reply headers, streamed bodies are not included
+                    latency = resp.elapsed.total_seconds()
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+                failed = congested = True
+                sent = not isinstance(e, requests.ConnectTimeout)
+            except Exception:
+                if self.limiter is not None:
+                    self.limiter.release()
+                if self.breaker is not None:
+                    self.breaker.abandon()
+                raise
+            if self.limiter is not None:
+                release = functools.partial(self.limiter.release, endpoint_name(url), latency, congested)
+                if resp is not None and kwargs.get("stream"):
+                    _release_on_close(resp, release)
+                else:
+                    release()
+            if self.breaker is not None:
+                self.breaker.record(failed)
+
+            self._count("requests")
+            if not failed:
+                return resp
+            self._count("failures")
+            if attempt >= self.retries or not (retry or not sent):
+                if error is not None:
+                    raise error
+                return resp
+
+            delay = self._backoff(attempt, resp)
+            if resp is not None:
+                resp.close()
+            self._wait(delay)
+            attempt += 1
+
+
+def _release_on_close(resp: requests.Response, release):
+    """Keep a streamed response's limiter slot until the response is closed."""
+    close = resp.close
+    released = []
+
+    def close_and_release():
+        try:
+            close()
+        finally:
+            if not released:
+                released.append(True)
+                release()
+
+    resp.close = close_and_release
+
+
+def build_session(pool_size: int = DEFAULT_POOL_SIZE, retries: int = 3, adaptive: bool = True) -> requests.Session:
+    """
+    Return a session that keeps up to `pool_size` connections alive per host.
+
+    Parameters
+    ----------
+    pool_size : int, optional
+        Maximum number of pooled connections per host, by default 10.
+        Should be at least the number of threads sharing the session.
+    retries : int, optional
+        Retries of transient failures, by default 3. 0 disables retrying.
+    adaptive : bool, optional
+        Use the adaptive concurrency limiter and circuit breaker, by default True.
+
+    Returns
+    -------
+    requests.Session
+        ResilientSession with gzip-encoded responses and keep-alive enabled.
+    """
+    pool_size = max(1, pool_size)
+    if adaptive:
+        session = ResilientSession(pool_size, retries=retries)
+    else:
+        session = ResilientSession(pool_size, retries=retries, limiter=None, breaker=None)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({
+        "Accept-Encoding": "gzip, deflate",
+        "Connection": "keep-alive",
+    })
+    return session
@@ -1,16 +1,32 @@
 
 import argparse
+import asyncio
+import contextlib
+import concurrent.futures
 import os
+import time
+from dataclasses import dataclass
 import requests
-import epics
-from typing import List, Dict
+from http_session import build_session, DEFAULT_POOL_SIZE
+from connectivity_probe import ConnectivityProbe
+from status_cache import StatusCache, DEFAULT_CACHE_PATH
+from archive_index import ArchiveIndex, ParsedArchiveCache, DEFAULT_INDEX_PATH, DEFAULT_PARSE_CACHE_PATH, ioc_data_path
+from run_metrics import RunMetrics
+from run_profiler import add_profile_arguments, build_profiler
+import report_state
+from pv_registry import PVNameTable, PVRegistry, unique_pvs
+from status_listings import ApplianceListings, classify_statuses
+from typing import List, Dict, Optional
 import glob
 import datetime
+import logging
 
 #TODO: fix dev
 
 class ArchiverUtility:
-    def __init__(self, mode: str):
+    def __init__(self, mode: str, batch_size: int = 100, pool_size: int = DEFAULT_POOL_SIZE,
+                 probe_timeout: float = 1.0, cache: StatusCache = None,
+                 parse_cache: ParsedArchiveCache = None):
         base_urls = {
             "dev": "http://dev-archapp.slac.stanford.edu",
             "lcls": "http://lcls-archapp.slac.stanford.edu",
@@ -25,16 +41,72 @@ class ArchiverUtility:
         self.web = f"{base}/mgmt/bpl/"
         self.retrieval_url = f"{base.replace(':17665', '')}:17668/retrieval/data/"
         self.post_url = f"{base.replace(':17665', '')}/retrieval/data/"
+        self.batch_size = max(1, batch_size)
+        self.session = build_session(pool_size)
+        self.probe = ConnectivityProbe(timeout=probe_timeout)
+        self.cache = cache
+        self.parse_cache = parse_cache
+        # request counts/latencies of this run plus per-phase timings, see run_metrics
+        self.metrics = RunMetrics({"appliance": mode})
+        self.metrics.attach(self.session)
 
     def get_pv_status(self, pv: str) -> Dict:
         """Request current archiver status for a single PV."""
+        if self.cache is not None:
+            cached = self.cache.get(self.web, pv)
+            if cached is not None:
+                return cached
+
+        status = self._request_pv_status(pv)
+        if self.cache is not None:
+            self.cache.put(self.web, pv, status)
+        return status
+
+    def _request_pv_status(self, pv: str) -> Dict:
         url = self.web + "getPVStatus"
-        response = requests.get(url, params={'pv': pv})
+        response = self.session.get(url, params={'pv': pv})
         response.raise_for_status()
         return response.json()[0]
+
+    def get_pv_statuses(self, pv_list: List[str]) -> Dict[str, Dict]:
+        """Request current archiver status for many PVs, batch_size PVs per request.
+
+        PVs with a fresh entry in the status cache are not requested again.
+        """
+        statuses = self.cache.get_many(self.web, pv_list) if self.cache is not None else {}
+        missing = [pv for pv in dict.fromkeys(pv_list) if pv not in statuses]
+
+        fetched = {}
+        for start in range(0, len(missing), self.batch_size):
+            fetched.update(self._get_status_batch(missing[start:start + self.batch_size]))
+
+        if self.cache is not None and fetched:
+            self.cache.put_many(self.web, fetched)
+        statuses.update(fetched)
+        return statuses
+
+    def _get_status_batch(self, pvs: List[str]) -> Dict[str, Dict]:
+        """POST one batch of PVs to getPVStatus and split the reply back out per PV."""
+        if len(pvs) == 1:
+            return {pvs[0]: self._request_pv_status(pvs[0])}
+
+        url = self.web + "getPVStatus"
+        response = self.session.post(url, json=pvs, retry=True)
+        response.raise_for_status()
+        by_name = {entry.get("pvName"): entry for entry in response.json()}
+
+        # the appliance should answer for every PV it was asked about; ask it
+        # again about any it left out rather than guessing their status
+        for pv in pvs:
+            if pv not in by_name:
+                by_name[pv] = self._request_pv_status(pv)
+        return {pv: by_name[pv] for pv in pvs}
     
     def parse_archive_file(self, archive_filename: str):
         """Extract PVs and their parameters from a given archive file."""
+        if self.parse_cache is not None:
+            return self.parse_cache.pvs(archive_filename)
+
         pv_list = []
         pv_params_list = []
 
@@ -52,10 +124,15 @@ class ArchiverUtility:
     
     def get_status(self, pv_list: List[str], **filters) -> Dict[str, Dict]:
         """Retrieve and filter PV status reports."""
+        statuses = self.get_pv_statuses(pv_list)
+        return self.filter_statuses(pv_list, statuses, **filters)
+
+    def filter_statuses(self, pv_list: List[str], statuses: Dict[str, Dict], **filters) -> Dict[str, Dict]:
+        """Filter already retrieved PV statuses down to the requested report entries."""
 
         report = {}
         for i, pv in enumerate(pv_list):
-            response = self.get_pv_status(pv)
+            response = statuses[pv]
             if response.get("status", "Invalid") not in filters.get("status"): 
                 continue
             
@@ -69,24 +146,69 @@ class ArchiverUtility:
 
             filtered_entry[pv].update(filtered_fields)
 
-            if filters.get("disconnectedStatus", None):
-                pv_connection = epics.PV(pv)
-                if pv_connection.wait_for_connection(timeout=.25):
-                    
-                   # skip to next pv if we are checking only for disconnected PVs
-                   # and the PV is connected, this can be made quicker probably.
-                   # but pyepics seems to have limitations with caget_many so I don't
-                   # know.
-                    continue
-                
-
             report.update(filtered_entry)
 
+        if filters.get("disconnectedStatus", None):
+            # only disconnected PVs are reported, so probe every candidate
+            # against one shared deadline and keep the ones that never connected
+            with self.metrics.phase("probe"):
+                _, disconnected = self.probe.probe(report)
+            self.metrics.inc("probed_pvs_total", len(report), help_text="PVs checked for Channel Access connectivity.")
+            self.metrics.inc("disconnected_pvs_total", len(disconnected), help_text="Probed PVs that did not connect.")
+            report = {pv: stats for pv, stats in report.items() if pv in disconnected}
+
         return report
 
+class AsyncStatusClient:
+    """Asyncio status engine that keeps `concurrency` getPVStatus requests in flight.
+
+    Requests are issued through the wrapped ArchiverUtility (one batch per
+    request) on a dedicated thread pool, so the blocking HTTP calls overlap
+    instead of waiting on each other.
+    """
+    def __init__(self, archiver_utility, concurrency: int = 8):
+        self.util = archiver_utility
+        self.concurrency = max(1, concurrency)
+
+    async def fetch_statuses(self, pv_list: List[str]) -> Dict[str, Dict]:
+        """Fetch statuses for every unique PV in pv_list, keyed by PV."""
+        unique_pvs = list(dict.fromkeys(pv_list))
+        size = self.util.batch_size
+        batches = [unique_pvs[i:i + size] for i in range(0, len(unique_pvs), size)]
+
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            async def fetch(batch):
+                async with semaphore:
+                    return await loop.run_in_executor(executor, self.util.get_pv_statuses, batch)
+
+            results = await asyncio.gather(*(fetch(batch) for batch in batches))
+
+        statuses = {}
+        for result in results:
+            statuses.update(result)
+        return statuses
+
+    async def get_reports(self, pv_dict: Dict[str, List[str]], search_kwargs: Dict) -> Dict[str, Dict]:
+        """Return {filename: file_report} in the same shape get_status produces per file."""
+        statuses = await self.fetch_statuses(unique_pvs(pv_dict))
+        return {
+            filename: self.util.filter_statuses(pvs_in_file, statuses, **search_kwargs.copy())
+            for filename, pvs_in_file in pv_dict.items()
+        }
+
+    def run(self, pv_dict: Dict[str, List[str]], search_kwargs: Dict) -> Dict[str, Dict]:
+        return asyncio.run(self.get_reports(pv_dict, search_kwargs))
+
+    def run_fetch(self, pv_list: List[str]) -> Dict[str, Dict]:
+        return asyncio.run(self.fetch_statuses(pv_list))
+
 class PathGenerator():
-    def __init__(self,sub_sys:str = None,loca: str = None)->None:
-        self.base_path = '/mccfs2/u1/lcls/epics/ioc/data/' #'$IOC_DATA'
+    def __init__(self,sub_sys:str = None,loca: str = None, index: ArchiveIndex = None)->None:
+        self.base_path = index.base_path if index else ioc_data_path()
+        self.index = index
         if sub_sys: 
             self.sub_sys = sub_sys
         else:
@@ -94,32 +216,36 @@ class PathGenerator():
 
         if loca:
             self.area = loca
-            self.ioc_wildcard_string = '*-{}*-{}*/archive/*.archive'.format(self.area.lower(),self.sub_sys.lower())
+            self.ioc_pattern = '*-{}*-{}*'.format(self.area.lower(),self.sub_sys.lower())
         else:
-           self.ioc_wildcard_string = '*-*-{}*/archive/*.archive'.format(self.sub_sys.lower()) 
+           self.ioc_pattern = '*-*-{}*'.format(self.sub_sys.lower()) 
+        self.ioc_wildcard_string = self.ioc_pattern + '/archive/*.archive'
 
-        self.path = self.base_path + self.ioc_wildcard_string
+        self.path = os.path.join(self.base_path, self.ioc_wildcard_string)
         print(f'Wildcard Path: {self.path}')
 
     def get_paths(self):
         temp_paths = []
-        for file_path in glob.glob(self.path):
+        # the index only re-lists IOC directories that changed since the last run
+        file_paths = self.index.query(self.ioc_pattern) if self.index else glob.glob(self.path)
+        for file_path in file_paths:
             print(file_path)
             temp_paths.append(file_path)
         return temp_paths        
 
 # Functions not in util
-def generate_filepaths(subsystem:str):
-    generator = PathGenerator(sub_sys = subsystem)
+def generate_filepaths(subsystem:str, index: ArchiveIndex = None):
+    generator = PathGenerator(sub_sys = subsystem, index = index)
     return generator.get_paths() 
 
-def collect_pvs(args: argparse.Namespace, util: ArchiverUtility):
+def collect_pvs(args: argparse.Namespace, util: ArchiverUtility) -> PVRegistry:
     """Collect PVs and parameters from provided file or directory."""
-    pv_dict = {}
+    pv_dict = PVRegistry()
     param_dict = {}
 
     if args.file:
-        pvs = util.parse_archive_file(args.file)
+        with util.metrics.phase("parse"):
+            pvs = util.parse_archive_file(args.file)
         pv_dict[args.file] = pvs
         #param_dict[args.file] = params
 
@@ -127,19 +253,50 @@ def collect_pvs(args: argparse.Namespace, util: ArchiverUtility):
         for filename in os.listdir(args.directory):
             filepath = os.path.join(args.directory, filename)
             if filepath.endswith('.archive') and os.path.isfile(filepath):
-                pvs= util.parse_archive_file(filepath)
+                with util.metrics.phase("parse"):
+                    pvs= util.parse_archive_file(filepath)
                 pv_dict[filename] = pvs
                 #param_dict[filename] = params
     
     elif args.subsystem:
-        filepaths = generate_filepaths(args.subsystem)
-        for filepath in filepaths:
-            pvs = util.parse_archive_file(filepath)
-            filename = os.path.basename(filepath)
-            pv_dict[filename] = pvs
+        # the same .archive file name may occur in several subsystems
+        for subsystem, subsystem_pvs in collect_subsystem_pvs(args.subsystem, util, build_index(args),
+                                                              pv_dict.table).items():
+            pv_dict.merge(subsystem_pvs, prefix=f'{subsystem}/')
+
+    if util.parse_cache is not None:
+        util.parse_cache.save()
 
     return pv_dict #, param_dict
 
+def build_index(args: argparse.Namespace) -> Optional[ArchiveIndex]:
+    """Return the archive file index selected on the command line, None to glob."""
+    return None if args.no_index else ArchiveIndex(index_path=args.index_file)
+
+def collect_subsystem_pvs(subsystems: List[str],
+                          util: ArchiverUtility,
+                          index: ArchiveIndex = None,
+                          table: PVNameTable = None) -> Dict[str, PVRegistry]:
+    """Collect {subsystem: {filename: pvs}} for every subsystem, interning PV names into one shared table."""
+    table = table if table is not None else PVNameTable()
+    subsystem_dicts = {}
+    for subsystem in subsystems:
+        pv_dict = PVRegistry(table)
+        with util.metrics.phase("discover"):
+            filepaths = generate_filepaths(subsystem, index)
+        with util.metrics.phase("parse"):
+            for filepath in filepaths:
+                pvs = util.parse_archive_file(filepath)
+                filename = os.path.basename(filepath)
+                pv_dict[filename] = pvs
+        util.metrics.inc("archive_files_total", len(pv_dict), help_text="Archive files collected.", subsystem=subsystem)
+        subsystem_dicts[subsystem] = pv_dict
+
+    if util.parse_cache is not None:
+        util.parse_cache.save()
+
+    return subsystem_dicts
+
 
 def setup_search_kwargs(args: argparse.Namespace) -> Dict:
     """Return filtered search kwargs based on CLI options."""
@@ -154,15 +311,40 @@ def setup_search_kwargs(args: argparse.Namespace) -> Dict:
 
     search_kwargs = keyword_logic[args.keyword]()
     for arg,val in vars(args).items():
-        if val == True:
+        if val is True:
             search_kwargs.update({arg : val})
     return search_kwargs
 
-def printer(pv_dict: Dict[str, Dict], archiver_utility: ArchiverUtility, search_kwargs: Dict):
+def iter_reports(pv_dict: Dict[str, List[str]],
+                 archiver_utility: ArchiverUtility,
+                 search_kwargs: Dict,
+                 concurrency: int = 1):
+    """Yield (filename, file_report) pairs, using the async engine when concurrency > 1.
+
+    Each PV is queried once, the first time a file lists it; files listing it
+    again reuse that status.
+    """
+    if concurrency > 1:
+        with archiver_utility.metrics.phase("status"):
+            reports = AsyncStatusClient(archiver_utility, concurrency).run(pv_dict, search_kwargs)
+        yield from reports.items()
+        return
 
+    statuses = {}
     for filename, pvs_in_file in pv_dict.items():
+        with archiver_utility.metrics.phase("status"):
+            missing = [pv for pv in pvs_in_file if pv not in statuses]
+            if missing:
+                statuses.update(archiver_utility.get_pv_statuses(missing))
+        with archiver_utility.metrics.phase("filter"):
+            file_report = archiver_utility.filter_statuses(pvs_in_file, statuses, **search_kwargs.copy())
+        yield filename, file_report
+
+def printer(pv_dict: Dict[str, Dict], archiver_utility: ArchiverUtility, search_kwargs: Dict,
+            concurrency: int = 1):
+
+    for filename, file_report in iter_reports(pv_dict, archiver_utility, search_kwargs, concurrency):
         print(filename)
-        file_report = archiver_utility.get_status(pvs_in_file, **search_kwargs.copy()) 
         for pv, stats in file_report.items():
             status = stats.get("status", "")
             last_event = stats.get("lastEvent", "")
@@ -170,23 +352,201 @@ def printer(pv_dict: Dict[str, Dict], archiver_utility: ArchiverUtility, search_
 
             print(f"{pv:<35}  {status:<18}  {last_event:<28}  {conn}")
 
-def subsystem_printer(subsystem:str,
-                      pv_dict: Dict[str, Dict],
-                      archiver_utility: ArchiverUtility, 
-                      search_kwargs: Dict):
-        
+def write_subsystem_report(subsystem: str, file_reports, report_dir: str = 'reports') -> str:
+        """Write (filename, file_report) pairs to a timestamped .qa report and return its path."""
         ts = datetime.datetime.now().astimezone().strftime("%Y-%m-%d_%H-%M-%S%z")
-        with open(f'reports/{subsystem}_report_{ts}.qa','w') as f:
-            for filename, pvs_in_file in pv_dict.items():
+        os.makedirs(report_dir, exist_ok=True)
+        report_path = os.path.join(report_dir, f'{subsystem}_report_{ts}.qa')
+        with open(report_path,'w') as f:
+            for filename, file_report in file_reports:
                 print(filename)
                 print('\n', filename, file=f)
-                file_report = archiver_utility.get_status(pvs_in_file, **search_kwargs.copy()) 
                 for pv, stats in file_report.items():
                     status = stats.get("status", "")
                     last_event = stats.get("lastEvent", "")
                     conn = stats.get("connectionState", "")
 
                     print(f"{pv:<35}  {status:<18}  {last_event:<28}  {conn}", file=f)
+        return report_path
+
+def write_report(subsystem: str,
+                 file_reports: Dict[str, Dict],
+                 search_kwargs: Dict,
+                 report_dir: str = 'reports',
+                 diff: bool = False):
+    """
+    Write the report of one subsystem and save its state snapshot.
+
+    With diff, only the PVs new, resolved or still failing since the previous
+    snapshot are written (see report_state), otherwise the full report.
+
+    Returns
+    -------
+    tuple
+        (report path, report_state.ReportDiff or None)
+    """
+    statuses = search_kwargs.get("status", [])
+    path = report_state.state_path(report_dir, subsystem)
+    current = report_state.snapshot(file_reports.items())
+    changes = None
+    if diff:
+        changes = report_state.diff_states(report_state.load_state(path, statuses), current)
+        report_path = report_state.write_diff_report(subsystem, changes, report_dir)
+    else:
+        report_path = write_subsystem_report(subsystem, file_reports.items(), report_dir)
+    report_state.save_state(path, current, statuses)
+    return report_path, changes
+
+def fetch_statuses(pv_list: List[str], archiver_utility: ArchiverUtility, concurrency: int = 1) -> Dict[str, Dict]:
+    """Fetch the status of every unique PV in pv_list once."""
+    unique_pvs = list(dict.fromkeys(pv_list))
+    metrics = archiver_utility.metrics
+    start = time.perf_counter()
+    with metrics.phase("status"):
+        if concurrency > 1:
+            statuses = AsyncStatusClient(archiver_utility, concurrency).run_fetch(unique_pvs)
+        else:
+            statuses = archiver_utility.get_pv_statuses(unique_pvs)
+    elapsed = time.perf_counter() - start
+    metrics.inc("status_pvs_total", len(unique_pvs), help_text="Unique PVs whose archiver status was looked up.")
+    metrics.set("status_pvs_per_second", len(unique_pvs) / elapsed if elapsed > 0 else 0.0,
+                help_text="Status lookup throughput of the last sweep.")
+    return statuses
+
+def fetch_statuses_from_listings(pv_list: List[str],
+                                 archiver_utility: ArchiverUtility,
+                                 search_kwargs: Dict,
+                                 concurrency: int = 1) -> Dict[str, Dict]:
+    """
+    Classify PVs from the appliance-wide listings, see status_listings.
+
+    Only PVs the listings cannot settle (not listed, never connected) or whose
+    reported status needs a lastEvent go through fetch_statuses. If a listing
+    cannot be fetched, every PV does.
+    """
+    metrics = archiver_utility.metrics
+    try:
+        with metrics.phase("listings"):
+            listings = ApplianceListings.fetch(archiver_utility.session, archiver_utility.web)
+    except (requests.RequestException, ValueError) as e:
+        logging.warning(f"Could not fetch appliance listings, querying every PV: {e}")
+        return fetch_statuses(pv_list, archiver_utility, concurrency)
+
+    for listing, size in listings.sizes().items():
+        metrics.set("listing_pvs", size, help_text="PVs in an appliance-wide listing.", listing=listing)
+    with metrics.phase("classify"):
+        statuses, lookups = classify_statuses(pv_list, listings, search_kwargs.get("status", []),
+                                              last_event=bool(search_kwargs.get("lastEvent")))
+    metrics.inc("listing_classified_pvs_total", len(statuses),
+                help_text="PVs whose status was settled by the appliance listings.")
+    if lookups:
+        statuses.update(fetch_statuses(lookups, archiver_utility, concurrency))
+    return statuses
+
+@dataclass
+class ReportOutcome:
+    """Result of checking one subsystem with run_subsystems."""
+    subsystem: str
+    report_path: str
+    files: int
+    pvs: int
+    unique_pvs: int
+    reported: int
+    collect_s: float
+    status_s: float
+    total_s: float
+    # set for differential reports only
+    new: Optional[int] = None
+    resolved: Optional[int] = None
+    still_failing: Optional[int] = None
+
+def run_subsystems(subsystems: List[str],
+                   archiver_utility: ArchiverUtility,
+                   search_kwargs: Dict,
+                   concurrency: int = 1,
+                   index: ArchiveIndex = None,
+                   report_dir: str = 'reports',
+                   diff: bool = False,
+                   listings: bool = False) -> Dict[str, ReportOutcome]:
+    """
+    Write one .qa report per subsystem from a single deduplicated status sweep.
+
+    The union of PVs over all subsystems is queried once; each subsystem's
+    report is then filtered out of the shared statuses. Collection and
+    status timings are those of the shared sweep. With diff, the reports
+    only hold the changes since the previous run (see write_report). With
+    listings, statuses are classified from the appliance-wide listings
+    instead of one getPVStatus lookup per PV (see fetch_statuses_from_listings).
+
+    Returns
+    -------
+    dict[str, ReportOutcome]
+        Outcome per subsystem, in the order given.
+    """
+    start = time.perf_counter()
+    table = PVNameTable()
+    subsystem_dicts = collect_subsystem_pvs(subsystems, archiver_utility, index, table)
+    collected = time.perf_counter()
+
+    # the shared table holds the union of all subsystems' PVs, each once
+    if listings:
+        statuses = fetch_statuses_from_listings(table.names, archiver_utility, search_kwargs, concurrency)
+    else:
+        statuses = fetch_statuses(table.names, archiver_utility, concurrency)
+    fetched = time.perf_counter()
+
+    metrics = archiver_utility.metrics
+    outcomes = {}
+    for subsystem, pv_dict in subsystem_dicts.items():
+        with metrics.phase("filter"):
+            file_reports = {filename: archiver_utility.filter_statuses(pvs_in_file, statuses, **search_kwargs.copy())
+                            for filename, pvs_in_file in pv_dict.items()}
+        with metrics.phase("write"):
+            report_path, changes = write_report(subsystem, file_reports, search_kwargs, report_dir, diff)
+        outcomes[subsystem] = ReportOutcome(
+            subsystem=subsystem,
+            report_path=report_path,
+            files=len(pv_dict),
+            pvs=pv_dict.references,
+            unique_pvs=len(pv_dict.unique_ids()),
+            reported=sum(len(report) for report in file_reports.values()),
+            collect_s=collected - start,
+            status_s=fetched - collected,
+            total_s=time.perf_counter() - start,
+        )
+        if changes is not None:
+            outcomes[subsystem].new = len(changes.new)
+            outcomes[subsystem].resolved = len(changes.resolved)
+            outcomes[subsystem].still_failing = len(changes.still_failing)
+        record_outcome(metrics, outcomes[subsystem])
+    return outcomes
+
+def record_outcome(metrics: RunMetrics, outcome: ReportOutcome):
+    """Export the counts of one subsystem report as gauges."""
+    for field in ("files", "pvs", "unique_pvs", "reported", "new", "resolved", "still_failing"):
+        if getattr(outcome, field) is None:
+            continue
+        metrics.set(f"subsystem_{field}", getattr(outcome, field),
+                    help_text=f"{field.replace('_', ' ').capitalize()} of the subsystem report.",
+                    subsystem=outcome.subsystem)
+
+def collect_run_metrics(archiver_utility: ArchiverUtility) -> RunMetrics:
+    """Add HTTP session and cache state to the utility's run metrics and return them."""
+    metrics = archiver_utility.metrics
+    metrics.collect_session(archiver_utility.session)
+    if archiver_utility.parse_cache is not None:
+        metrics.set("parse_cache_hits", archiver_utility.parse_cache.hits, help_text="Archive files served from the parse cache.")
+        metrics.set("parse_cache_misses", archiver_utility.parse_cache.misses, help_text="Archive files (re-)parsed.")
+    return metrics
+
+def write_run_metrics(archiver_utility: ArchiverUtility, textfile: str = None, json_path: str = None) -> RunMetrics:
+    """Write the run metrics as a Prometheus text file and/or JSON summary."""
+    metrics = collect_run_metrics(archiver_utility)
+    if textfile:
+        metrics.write_textfile(textfile)
+    if json_path:
+        metrics.write_json(json_path)
+    return metrics
 
 def build_parser() -> argparse.ArgumentParser:
     """Define and return command-line argument parser."""
@@ -209,7 +569,27 @@ def build_parser() -> argparse.ArgumentParser:
     
     parser.add_argument("-sub", "--subsystem",
                         type=str,
-                        help="Subsystem to check, pass bp to get all iocs in the wildcard format *-*-bp*")
+                        nargs="+",
+                        help=("Subsystem(s) to check, pass bp to get all iocs in the wildcard format *-*-bp*. "
+                              "With --dump, several subsystems share one status sweep and get one report each"))
+
+    parser.add_argument("--index-file",
+                        default=DEFAULT_INDEX_PATH,
+                        type=str,
+                        help="Location of the cached $IOC_DATA archive file index used with -sub")
+
+    parser.add_argument("--no-index",
+                        action="store_true",
+                        help="Glob $IOC_DATA directly instead of using the archive file index")
+
+    parser.add_argument("--parse-cache",
+                        default=DEFAULT_PARSE_CACHE_PATH,
+                        type=str,
+                        help="Location of the cache of parsed .archive files, only changed files are re-read")
+
+    parser.add_argument("--no-parse-cache",
+                        action="store_true",
+                        help="Re-read every .archive file instead of using the parse cache")
 
     parser.add_argument("-k", "--keyword", choices=['Archived', 'Unarchived', 'Paused', 'All', 'UP'],
                         default = 'All',
@@ -221,6 +601,11 @@ def build_parser() -> argparse.ArgumentParser:
                         action="store_const",
                         const=True,
                         help= "Filter results to show only disconnected PVs in the control system matching all other criteria")
+
+    parser.add_argument("--probe-timeout",
+                        default=1.0,
+                        type=float,
+                        help="Seconds to wait for all PVs of a file to connect when using -ds, default is 1.0")
     
     parser.add_argument("-l", "--lastEvent",
                         default = None,
@@ -234,31 +619,102 @@ def build_parser() -> argparse.ArgumentParser:
                         const=True,
                         help= "Optional argument that displays whether the archiver has connection to the PV")
     
+    parser.add_argument("-b", "--batch-size",
+                        default=100,
+                        type=int,
+                        help="Number of PVs sent per getPVStatus request, default is 100. Use 1 for one request per PV")
+
+    parser.add_argument("--concurrency",
+                        default=1,
+                        type=int,
+                        help="Number of getPVStatus requests kept in flight at once, default is 1 (serial)")
+
+    parser.add_argument("--max-age",
+                        default=None,
+                        type=float,
+                        help="Reuse PV statuses cached locally within the last MAX_AGE seconds instead of asking the appliance")
+
+    parser.add_argument("--status-cache",
+                        default=DEFAULT_CACHE_PATH,
+                        type=str,
+                        help="Location of the local PV status cache used with --max-age")
+
+    parser.add_argument("--metrics-textfile",
+                        default=None,
+                        type=str,
+                        help="Write run metrics in Prometheus text format (node-exporter textfile collector) to this file")
+
+    parser.add_argument("--metrics-json",
+                        default=None,
+                        type=str,
+                        help="Write a JSON summary of the run metrics (phases, requests, latencies) to this file")
+
     parser.add_argument('--dump', action='store_true')
+
+    parser.add_argument("--report-dir",
+                        default='reports',
+                        type=str,
+                        help="Directory the --dump reports and state snapshots are written to, default is reports")
+
+    parser.add_argument("--diff",
+                        action="store_true",
+                        help=("With --dump, only report PVs new, resolved or still failing since the previous run "
+                              "(compared with the <subsystem>_state.json snapshot in the report directory)"))
+
+    parser.add_argument("--listings",
+                        action="store_true",
+                        help=("With --dump, classify PVs from the appliance-wide paused, disconnected, never connected "
+                              "and archived PV listings; getPVStatus is only asked about PVs needing a lastEvent "
+                              "or a status the listings cannot settle"))
+
+    add_profile_arguments(parser)
     return parser
 
+def profile_name(args: argparse.Namespace) -> str:
+    """Name the profile files after the subsystems, file or directory being checked."""
+    if getattr(args, 'subsystem', None):
+        return '_'.join(args.subsystem)
+    path = args.file or args.directory or 'run'
+    return os.path.splitext(os.path.basename(os.path.normpath(path)))[0]
+
+def build_utility(args: argparse.Namespace, pool_size: int = DEFAULT_POOL_SIZE) -> ArchiverUtility:
+    """Create the ArchiverUtility (HTTP pool, caches, CA probe) described by the CLI options."""
+    cache = StatusCache(args.status_cache, ttl=args.max_age) if args.max_age is not None else None
+    parse_cache = None if args.no_parse_cache else ParsedArchiveCache(args.parse_cache)
+    return ArchiverUtility(args.archiver, batch_size=args.batch_size,
+                           pool_size=max(pool_size, args.concurrency),
+                           probe_timeout=args.probe_timeout,
+                           cache=cache,
+                           parse_cache=parse_cache)
+
 def main():
     parser = build_parser()
     args = parser.parse_args()
+    for option in ("diff", "listings"):
+        if getattr(args, option) and not args.dump:
+            parser.error(f"--{option} requires --dump")
     print(args)
 
     if not args.file and not args.directory and not args.subsystem:
         parser.print_help()
         return
 
-    util = ArchiverUtility(args.archiver)
+    util = build_utility(args)
     
     search_kwargs = setup_search_kwargs(args)
     
-    
-    pv_dict = collect_pvs(args, util)
-    
+    profiler = build_profiler(args, util.metrics, profile_name(args))
+    with profiler or contextlib.nullcontext():
+        if args.dump and args.subsystem:
+            run_subsystems(args.subsystem, util, search_kwargs, args.concurrency, build_index(args),
+                           report_dir=args.report_dir, diff=args.diff, listings=args.listings)
+        
+        else:
+            pv_dict = collect_pvs(args, util)
+            printer(pv_dict, util, search_kwargs, args.concurrency)
 
-    if args.dump and args.subsystem:
-        subsystem_printer(args.subsystem, pv_dict, util, search_kwargs)
-    
-    else:
-        printer(pv_dict, util, search_kwargs)
+    if args.metrics_textfile or args.metrics_json:
+        write_run_metrics(util, args.metrics_textfile, args.metrics_json)
 
 
 
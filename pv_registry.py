@@ -0,0 +1,129 @@
+"""
+Interned PV names shared by the archive files of a run.
+
+The same PV is often listed by several .archive files and IOCs. Kept as one
+list of strings per file, every occurrence holds its own copy of the name and
+each consumer deduplicates the union again before querying the appliance.
+
+`PVNameTable` interns every distinct name once and gives it a dense integer
+ID. `PVRegistry` stores the PVs of each archive file as an `array('I')` of
+those IDs, 4 bytes per reference, and reads as a {filename: [pv, ...]}
+mapping, so code written against the per-file dicts keeps working.
+
+Registries of several subsystems can share one table. Its names are then the
+union of their PVs, each exactly once: the list the status sweep queries
+before the statuses are fanned back out to every file referencing a PV.
+"""
+
+from array import array
+from collections.abc import MutableMapping
+from typing import Dict, Iterable, Iterator, List, Mapping
+
+
+class PVNameTable:
+    """Distinct PV names in first-seen order, ID i is `names[i]`."""
+
+    def __init__(self):
+        self.names: List[str] = []
+        self._ids: Dict[str, int] = {}
+
+    def intern(self, pv: str) -> int:
+        """Return the ID of `pv`, assigning the next one to a new name."""
+        pv_id = self._ids.get(pv)
+        if pv_id is None:
+            pv_id = self._ids[pv] = len(self.names)
+            self.names.append(pv)
+        return pv_id
+
+    def ids(self, pvs: Iterable[str]) -> array:
+        """Return the IDs of `pvs`, in order, interning new names."""
+        return array('I', map(self.intern, pvs))
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, pv) -> bool:
+        return pv in self._ids
+
+
+class PVRegistry(MutableMapping):
+    """
+    {archive file: [pv, ...]} mapping backed by interned PV IDs.
+
+    Parameters
+    ----------
+    table : PVNameTable, optional
+        Name table to intern into, shared to deduplicate across registries.
+        A private one is created if omitted.
+    """
+
+    def __init__(self, table: PVNameTable = None):
+        self.table = table if table is not None else PVNameTable()
+        self._files: Dict[str, array] = {}
+
+    def __setitem__(self, filename: str, pvs: Iterable[str]):
+        self._files[filename] = self.table.ids(pvs)
+
+    def __getitem__(self, filename: str) -> List[str]:
+        names = self.table.names
+        return [names[pv_id] for pv_id in self._files[filename]]
+
+    def __delitem__(self, filename: str):
+        del self._files[filename]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._files)
+
+    def __len__(self) -> int:
+        return len(self._files)
+
+    def ids(self, filename: str) -> array:
+        """IDs of the PVs of one file."""
+        return self._files[filename]
+
+    def merge(self, other: 'PVRegistry', prefix: str = ''):
+        """
+        Add the files of another registry, copying IDs when both share a table.
+
+        Each file is added as `prefix + filename`, so registries whose file
+        names overlap (e.g. of two subsystems) can be merged without one
+        replacing the other.
+        """
+        for filename in other:
+            if other.table is self.table:
+                self._files[prefix + filename] = array('I', other.ids(filename))
+            else:
+                self[prefix + filename] = other[filename]
+
+    def unique_ids(self) -> array:
+        """IDs of the distinct PVs over all files, in first-seen order."""
+        seen = bytearray(len(self.table))
+        unique = array('I')
+        for ids in self._files.values():
+            for pv_id in ids:
+                if not seen[pv_id]:
+                    seen[pv_id] = 1
+                    unique.append(pv_id)
+        return unique
+
+    def unique_pvs(self) -> List[str]:
+        """Distinct PV names over all files, in first-seen order."""
+        names = self.table.names
+        return [names[pv_id] for pv_id in self.unique_ids()]
+
+    @property
+    def references(self) -> int:
+        """Number of PV lines over all files, repeated PVs counted every time."""
+        return sum(len(ids) for ids in self._files.values())
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes taken by the file membership arrays."""
+        return sum(ids.itemsize * len(ids) for ids in self._files.values())
+
+
+def unique_pvs(pv_dict: Mapping[str, List[str]]) -> List[str]:
+    """Distinct PVs of a {filename: pvs} mapping, registry or plain dict, in first-seen order."""
+    if isinstance(pv_dict, PVRegistry):
+        return pv_dict.unique_pvs()
+    return list(dict.fromkeys(pv for pvs in pv_dict.values() for pv in pvs))
@@ -0,0 +1,135 @@
+"""
+Per-subsystem report state and differential QA reports.
+
+Day to day only a handful of PVs change state, yet the full .qa report lists
+every reported PV each run. After each run the reported PVs of a subsystem are
+saved as a compact JSON snapshot, `<subsystem>_state.json`:
+
+    {"version": 1, "taken_at": "...", "statuses": ["Not being archived", "Paused"],
+     "pvs": {"<pv>": {"status": "...", "lastEvent": "...", "files": ["<archive file>", ...]}}}
+
+`diff_states` compares the new snapshot with the previous one by hashed PV
+name, in time linear in the number of PVs, and `write_diff_report` writes a
+`<subsystem>_diff_<ts>.qa` report listing the new and resolved PVs in full and
+the still failing ones by name and status only. Old text reports are never
+re-parsed.
+
+A snapshot taken with a different status filter (e.g. -k Paused instead of
+-k UP) is not a meaningful baseline; it is ignored and every PV counts as new.
+"""
+
+import datetime
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from atomic_write import write_json_atomic
+
+STATE_VERSION = 1
+
+
+def state_path(report_dir: str, subsystem: str) -> str:
+    """Location of the state snapshot of `subsystem` in `report_dir`."""
+    return os.path.join(report_dir, f'{subsystem}_state.json')
+
+
+def snapshot(file_reports: Iterable[Tuple[str, Dict[str, Dict]]]) -> Dict[str, Dict]:
+    """Return {pv: report entry plus the archive files listing it} from (filename, file_report) pairs."""
+    pvs = {}
+    for filename, file_report in file_reports:
+        for pv, stats in file_report.items():
+            entry = pvs.get(pv)
+            if entry is None:
+                entry = pvs[pv] = dict(stats, files=[])
+            entry['files'].append(filename)
+    return pvs
+
+
+def load_state(path: str, statuses: Optional[List[str]] = None) -> Optional[Dict]:
+    """
+    Return the snapshot saved at `path`, None if there is no usable one.
+
+    A snapshot saved with other `statuses` than the current filter is not
+    comparable and also yields None.
+    """
+    try:
+        with open(path, 'r') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if state.get('version') != STATE_VERSION:
+        return None
+    if statuses is not None and sorted(state.get('statuses', [])) != sorted(statuses):
+        return None
+    return state
+
+
+def save_state(path: str, pvs: Dict[str, Dict], statuses: List[str]):
+    """Atomically replace the snapshot at `path`."""
+    state = {
+        'version': STATE_VERSION,
+        'taken_at': datetime.datetime.now().astimezone().isoformat(timespec='seconds'),
+        'statuses': sorted(statuses),
+        'pvs': pvs,
+    }
+    write_json_atomic(path, state)
+
+
+@dataclass
+class ReportDiff:
+    """PVs reported now but not before, before but not now, and in both runs."""
+    new: Dict[str, Dict] = field(default_factory=dict)
+    resolved: Dict[str, Dict] = field(default_factory=dict)
+    still_failing: Dict[str, Dict] = field(default_factory=dict)
+    # still failing PVs whose status changed, pv -> previous status
+    changed: Dict[str, str] = field(default_factory=dict)
+    baseline: Optional[str] = None
+
+
+def diff_states(previous: Optional[Dict], current: Dict[str, Dict]) -> ReportDiff:
+    """Classify the PVs of two snapshots, without a previous one every PV is new."""
+    before = previous['pvs'] if previous else {}
+    diff = ReportDiff(baseline=previous.get('taken_at') if previous else None)
+    for pv, entry in current.items():
+        old = before.get(pv)
+        if old is None:
+            diff.new[pv] = entry
+            continue
+        diff.still_failing[pv] = entry
+        if old.get('status') != entry.get('status'):
+            diff.changed[pv] = old.get('status', '')
+    for pv, entry in before.items():
+        if pv not in current:
+            diff.resolved[pv] = entry
+    return diff
+
+
+def _format_entry(pv: str, entry: Dict) -> str:
+    status = entry.get("status", "")
+    last_event = entry.get("lastEvent", "")
+    conn = entry.get("connectionState", "")
+    return f"{pv:<35}  {status:<18}  {last_event:<28}  {conn}  [{', '.join(entry.get('files', []))}]"
+
+
+def write_diff_report(subsystem: str, diff: ReportDiff, report_dir: str = 'reports') -> str:
+    """Write the new, resolved and still failing PVs to a timestamped .qa report and return its path."""
+    ts = datetime.datetime.now().astimezone().strftime("%Y-%m-%d_%H-%M-%S%z")
+    os.makedirs(report_dir, exist_ok=True)
+    report_path = os.path.join(report_dir, f'{subsystem}_diff_{ts}.qa')
+    baseline = diff.baseline or 'no previous run'
+    with open(report_path, 'w') as f:
+        print(f"# {subsystem}: {len(diff.new)} new, {len(diff.resolved)} resolved, "
+              f"{len(diff.still_failing)} still failing since {baseline}", file=f)
+        for title, entries in (('New', diff.new), ('Resolved', diff.resolved)):
+            print(f"\n== {title} ({len(entries)}) ==", file=f)
+            for pv in sorted(entries):
+                print(_format_entry(pv, entries[pv]), file=f)
+        # already known PVs only get their status, and the old one if it changed
+        print(f"\n== Still failing ({len(diff.still_failing)}) ==", file=f)
+        for pv in sorted(diff.still_failing):
+            line = f"{pv:<35}  {diff.still_failing[pv].get('status', '')}"
+            if pv in diff.changed:
+                line += f"  (was {diff.changed[pv]})"
+            print(line, file=f)
+    return report_path
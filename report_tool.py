@@ -2,16 +2,25 @@
 #TODO: last event should only be asked for if specified...
 #TODO: add dump file
 import argparse
+import contextlib
 import os
 import requests
 import pprint
-import epics
+from http_session import build_session, DEFAULT_POOL_SIZE
+from connectivity_probe import ConnectivityProbe
+from status_cache import StatusCache, DEFAULT_CACHE_PATH
+from archive_index import ParsedArchiveCache, DEFAULT_PARSE_CACHE_PATH
 from typing import List, Dict
 import yaml
 from collections import OrderedDict
+from new_report_tool import iter_reports, write_run_metrics, profile_name
+from run_metrics import RunMetrics
+from run_profiler import add_profile_arguments, build_profiler
+from pv_registry import PVRegistry
 
 class ArchiverUtility:
-    def __init__(self, mode: str):
+    def __init__(self, mode: str, pool_size: int = DEFAULT_POOL_SIZE, probe_timeout: float = 1.0,
+                 cache: StatusCache = None, parse_cache: ParsedArchiveCache = None):
         base_urls = {
             "dev": "http://dev-archapp.slac.stanford.edu",
             "lcls": "http://lcls-archapp.slac.stanford.edu",
@@ -25,16 +34,40 @@ class ArchiverUtility:
         self.web = f"{base}/mgmt/bpl/"
         self.retrieval_url = f"{base.replace(':17665', '')}:17668/retrieval/data/"
         self.post_url = f"{base.replace(':17665', '')}/retrieval/data/"
+        # one PV per getPVStatus request
+        self.batch_size = 1
+        self.session = build_session(pool_size)
+        self.probe = ConnectivityProbe(timeout=probe_timeout)
+        self.cache = cache
+        self.parse_cache = parse_cache
+        self.metrics = RunMetrics({"appliance": mode})
+        self.metrics.attach(self.session)
 
     def get_pv_status(self, pv: str) -> Dict:
         """Request current archiver status for a single PV."""
+        if self.cache is not None:
+            cached = self.cache.get(self.web, pv)
+            if cached is not None:
+                return cached
+
+        status = self._request_pv_status(pv)
+        if self.cache is not None:
+            self.cache.put(self.web, pv, status)
+        return status
+
+    def _request_pv_status(self, pv: str) -> Dict:
         url = self.web + "getPVStatus"
-        response = requests.get(url, params={'pv': pv})
+        response = self.session.get(url, params={'pv': pv})
         response.raise_for_status()
         return response.json()[0]
     
     def parse_archive_file(self, archive_filename: str):
         """Extract PVs and their parameters from a given archive file."""
+        if self.parse_cache is not None:
+            records = self.parse_cache.records(archive_filename)
+            return ([pv for pv, _, _ in records],
+                    [{'pvname': pv, 'scan': scan, 'method': method} for pv, scan, method in records])
+
         pv_list = []
         pv_params_list = []
 
@@ -49,12 +82,30 @@ class ArchiverUtility:
 
         return pv_list, pv_params_list
     
+    def get_pv_statuses(self, pv_list: List[str]) -> Dict[str, Dict]:
+        """Request current archiver status for each PV in pv_list.
+
+        PVs with a fresh entry in the status cache are not requested again.
+        """
+        statuses = self.cache.get_many(self.web, pv_list) if self.cache is not None else {}
+        fetched = {pv: self._request_pv_status(pv) for pv in dict.fromkeys(pv_list) if pv not in statuses}
+
+        if self.cache is not None and fetched:
+            self.cache.put_many(self.web, fetched)
+        statuses.update(fetched)
+        return statuses
+
     def get_status(self, pv_list: List[str], **filters) -> Dict[str, Dict]:
         """Retrieve and filter PV status reports."""
+        statuses = self.get_pv_statuses(pv_list)
+        return self.filter_statuses(pv_list, statuses, **filters)
+
+    def filter_statuses(self, pv_list: List[str], statuses: Dict[str, Dict], **filters) -> Dict[str, Dict]:
+        """Filter already retrieved PV statuses down to the requested report entries."""
 
         report = {}
         for i, pv in enumerate(pv_list):
-            response = self.get_pv_status(pv)
+            response = statuses[pv]
             if response.get("status", "Invalid") not in filters.get("status"): 
                 continue
             
@@ -68,19 +119,15 @@ class ArchiverUtility:
 
             filtered_entry[pv].update(filtered_fields)
 
-            if filters.get("disconnectedStatus", None):
-                pv_connection = epics.PV(pv)
-                if pv_connection.wait_for_connection(timeout=.25):
-                    
-                   # skip to next pv if we are checking only for disconnected PVs
-                   # and the PV is connected, this can be made quicker probably.
-                   # but pyepics seems to have limitations with caget_many so I don't
-                   # know.
-                    continue
-                
-
             report.update(filtered_entry)
 
+        if filters.get("disconnectedStatus", None):
+            # only disconnected PVs are reported, so probe every candidate
+            # against one shared deadline and keep the ones that never connected
+            with self.metrics.phase("probe"):
+                _, disconnected = self.probe.probe(report)
+            report = {pv: stats for pv, stats in report.items() if pv in disconnected}
+
         return report
         
 
@@ -88,7 +135,7 @@ class ArchiverUtility:
 
 def collect_pvs(args: argparse.Namespace, util: ArchiverUtility):
     """Collect PVs and parameters from provided file or directory."""
-    pv_dict = {}
+    pv_dict = PVRegistry()
     param_dict = {}
 
     if args.file:
@@ -104,6 +151,9 @@ def collect_pvs(args: argparse.Namespace, util: ArchiverUtility):
                 pv_dict[filename] = pvs
                 param_dict[filename] = params
 
+    if util.parse_cache is not None:
+        util.parse_cache.save()
+
     return pv_dict, param_dict
 
 
@@ -119,7 +169,7 @@ def setup_search_kwargs(args: argparse.Namespace) -> Dict:
 
     search_kwargs = keyword_logic[args.keyword]()
     for arg,val in vars(args).items():
-        if val == True:
+        if val is True:
             search_kwargs.update({arg : val})
     return search_kwargs
 
@@ -155,6 +205,11 @@ def build_parser() -> argparse.ArgumentParser:
                         action="store_const",
                         const=True,
                         help= "Filter results to show only disconnected PVs in the control system matching all other criteria")
+
+    parser.add_argument("--probe-timeout",
+                        default=1.0,
+                        type=float,
+                        help="Seconds to wait for all PVs of a file to connect when using -ds, default is 1.0")
     
     parser.add_argument("-l", "--lastEvent",
                         default = None,
@@ -167,6 +222,42 @@ def build_parser() -> argparse.ArgumentParser:
                         action="store_const",
                         const=True,
                         help= "Optional argument that displays whether the archiver has connection to the PV")
+
+    parser.add_argument("--concurrency",
+                        default=1,
+                        type=int,
+                        help="Number of getPVStatus requests kept in flight at once, default is 1 (serial)")
+
+    parser.add_argument("--max-age",
+                        default=None,
+                        type=float,
+                        help="Reuse PV statuses cached locally within the last MAX_AGE seconds instead of asking the appliance")
+
+    parser.add_argument("--status-cache",
+                        default=DEFAULT_CACHE_PATH,
+                        type=str,
+                        help="Location of the local PV status cache used with --max-age")
+
+    parser.add_argument("--parse-cache",
+                        default=DEFAULT_PARSE_CACHE_PATH,
+                        type=str,
+                        help="Location of the cache of parsed .archive files, only changed files are re-read")
+
+    parser.add_argument("--no-parse-cache",
+                        action="store_true",
+                        help="Re-read every .archive file instead of using the parse cache")
+
+    parser.add_argument("--metrics-textfile",
+                        default=None,
+                        type=str,
+                        help="Write run metrics in Prometheus text format (node-exporter textfile collector) to this file")
+
+    parser.add_argument("--metrics-json",
+                        default=None,
+                        type=str,
+                        help="Write a JSON summary of the run metrics (phases, requests, latencies) to this file")
+
+    add_profile_arguments(parser)
     return parser
 
 def main():
@@ -178,26 +269,30 @@ def main():
         parser.print_help()
         return
 
-    util = ArchiverUtility(args.archiver)
+    cache = StatusCache(args.status_cache, ttl=args.max_age) if args.max_age is not None else None
+    parse_cache = None if args.no_parse_cache else ParsedArchiveCache(args.parse_cache)
+    util = ArchiverUtility(args.archiver, pool_size=max(DEFAULT_POOL_SIZE, args.concurrency),
+                           probe_timeout=args.probe_timeout, cache=cache, parse_cache=parse_cache)
     
     search_kwargs = setup_search_kwargs(args)
     
-    
-    pv_dict, _ = collect_pvs(args, util)
-    
-
-    
-    for filename, pvs_in_file in pv_dict.items():
-        print(filename)
-        file_report = util.get_status(pvs_in_file, **search_kwargs.copy()) 
-        #
-        for pv, stats in file_report.items():
-            status = stats.get("status", "")
-            last_event = stats.get("lastEvent", "")
-            conn = stats.get("connectionState", "")
-
-            print(f"{pv:<35}  {status:<18}  {last_event:<28}  {conn}")
-
+    profiler = build_profiler(args, util.metrics, profile_name(args))
+    with profiler or contextlib.nullcontext():
+        with util.metrics.phase("parse"):
+            pv_dict, _ = collect_pvs(args, util)
+        
+        for filename, file_report in iter_reports(pv_dict, util, search_kwargs, args.concurrency):
+            print(filename)
+            #
+            for pv, stats in file_report.items():
+                status = stats.get("status", "")
+                last_event = stats.get("lastEvent", "")
+                conn = stats.get("connectionState", "")
+
+                print(f"{pv:<35}  {status:<18}  {last_event:<28}  {conn}")
+
+    if args.metrics_textfile or args.metrics_json:
+        write_run_metrics(util, args.metrics_textfile, args.metrics_json)
 
 
 
@@ -0,0 +1,80 @@
+"""
+Streaming report writer for the archive file status reports.
+
+Re-reading and re-dumping the whole YAML report after every archive file makes
+writing a report quadratic in its size. `StreamingReportWriter` instead appends
+one JSON Lines record per archive file as soon as its results are known:
+
+    {"file": "<archive file>", "pvs": [{"<pv>": "<status>"}, ...]}
+
+`finalize_yaml` turns such a file into the YAML layout the tools have always
+produced ({archive file: [{pv: status}, ...]}), merging into an existing YAML
+report the same way the per-file rewrite did.
+"""
+
+import json
+import os
+from typing import Dict, Iterator, List, Tuple
+
+import yaml
+
+
+class StreamingReportWriter:
+    """
+    Append-only JSON Lines writer with constant cost per archive file.
+
+    Parameters
+    ----------
+    path : str
+        JSON Lines file to write.
+    append : bool, optional
+        Keep records already in `path` (default) or start a fresh file.
+    """
+
+    def __init__(self, path: str, append: bool = True):
+        self.path = path
+        self._f = open(path, 'a' if append else 'w')
+
+    def write(self, archive_file: str, entries: List[Dict[str, str]]):
+        """Append the results of one archive file and flush them to disk."""
+        self._f.write(json.dumps({"file": archive_file, "pvs": entries}) + "\n")
+        self._f.flush()
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def iter_jsonl_report(path: str) -> Iterator[Tuple[str, List[Dict[str, str]]]]:
+    """Yield (archive file, entries) records from a JSON Lines report."""
+    with open(path, 'r') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                yield record["file"], record["pvs"]
+
+
+def finalize_yaml(jsonl_path: str, yaml_path: str) -> Dict[str, List[Dict[str, str]]]:
+    """
+    Merge a JSON Lines report into the YAML report at `yaml_path`.
+
+    Entries for an archive file already present in the YAML report are
+    appended to its list, new archive files are added as new keys.
+    """
+    if os.path.exists(yaml_path):
+        with open(yaml_path, 'r') as f:
+            report = yaml.safe_load(f) or {}
+    else:
+        report = {}
+
+    for archive_file, entries in iter_jsonl_report(jsonl_path):
+        report.setdefault(archive_file, []).extend(entries)
+
+    with open(yaml_path, 'w') as f:
+        yaml.dump(report, f, default_flow_style=False, allow_unicode=True, indent=4, width=200)
+    return report
@@ -0,0 +1,263 @@
+"""
+On-disk cache of retrieved archiver data.
+
+Analyses are often re-run over overlapping windows with the same `mean_<binsize>`
+operator. `RetrievalCache` keeps the samples already retrieved as compressed
+segments in a local SQLite database keyed by (appliance, PV, operator), each
+segment recording the time interval it completely covers. A request is split
+into the parts already covered, read back from disk, and the gaps, which are
+the only intervals fetched from the appliance.
+
+A stored series is merged with the segments it overlaps, whose samples it
+replaces, and with touching segments that are not full yet. Segments are
+capped at `max_segment_bytes` (compressed), larger merges are split, so a PV
+fetched window by window builds up a run of bounded segments instead of one
+blob rewritten on every store, and eviction drops old segments rather than a
+PV's whole history. Least recently used segments are evicted once the cache
+grows past `max_bytes`. Like StatusCache
+the database is opened in WAL mode so several tools can share one file.
+
+Only numeric series are cached; string and other object valued series are
+always fetched.
+"""
+
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from archiver_timeseries import PVTimeSeries
+
+DEFAULT_RETRIEVAL_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "archiver-report-tools", "retrieval.sqlite")
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_MAX_SEGMENT_BYTES = 256 * 1024
+
+
+def _pack(series: PVTimeSeries) -> bytes:
+    buf = io.BytesIO()
+    np.savez_compressed(buf, timestamps=series.timestamps, values=series.values,
+                        severity=series.severity, status=series.status)
+    return buf.getvalue()
+
+
+def _unpack(pv: str, blob: bytes, meta: str) -> PVTimeSeries:
+    with np.load(io.BytesIO(blob), allow_pickle=False) as arrays:
+        return PVTimeSeries(pv, arrays["timestamps"], arrays["values"], arrays["severity"], arrays["status"],
+                            json.loads(meta))
+
+
+def _slice(series: PVTimeSeries, lo: int, hi: int) -> PVTimeSeries:
+    return PVTimeSeries(series.pv, series.timestamps[lo:hi], series.values[lo:hi],
+                        series.severity[lo:hi], series.status[lo:hi], series.meta)
+
+
+def _window(series: PVTimeSeries, start_ns: int, end_ns: int) -> PVTimeSeries:
+    lo = int(np.searchsorted(series.timestamps, start_ns, side='left'))
+    hi = int(np.searchsorted(series.timestamps, end_ns, side='right'))
+    if lo == 0 and hi == len(series):
+        return series
+    return _slice(series, lo, hi)
+
+
+class RetrievalCache:
+    """
+    SQLite-backed cache of retrieved PV samples by covered time interval.
+
+    Parameters
+    ----------
+    path : str, optional
+        Location of the SQLite database, created if missing.
+    max_bytes : int, optional
+        Size of the stored (compressed) segments above which the least
+        recently used ones are evicted, by default 512 MiB.
+    max_segment_bytes : int, optional
+        Compressed size of a segment above which it is not merged any
+        further, by default 256 KiB, and at most a quarter of `max_bytes`.
+    """
+
+    def __init__(self, path: str = DEFAULT_RETRIEVAL_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES,
+                 max_segment_bytes: int = DEFAULT_MAX_SEGMENT_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_segment_bytes = max(1, min(max_segment_bytes, max_bytes // 4))
+        # requests answered entirely / partly / not at all from the cache
+        self.hits = 0
+        self.partial_hits = 0
+        self.misses = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS segments ("
+                " id INTEGER PRIMARY KEY,"
+                " appliance TEXT NOT NULL,"
+                " pv TEXT NOT NULL,"
+                " operator TEXT NOT NULL,"
+                " start_ns INTEGER NOT NULL,"
+                " end_ns INTEGER NOT NULL,"
+                " meta TEXT NOT NULL,"
+                " data BLOB NOT NULL,"
+                " nbytes INTEGER NOT NULL,"
+                " last_used REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS segments_key ON segments (appliance, pv, operator, start_ns)"
+            )
+
+    def lookup(self, appliance: str, pv: str, operator: str,
+               start_ns: int, end_ns: int) -> Tuple[List[PVTimeSeries], List[Tuple[int, int]]]:
+        """
+        Return the cached samples in [start_ns, end_ns] and the gaps not covered.
+
+        Returns
+        -------
+        tuple
+            (cached parts in time order, [(gap start_ns, gap end_ns), ...])
+        """
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                "SELECT id, start_ns, end_ns, meta, data FROM segments"
+                " WHERE appliance = ? AND pv = ? AND operator = ? AND start_ns < ? AND end_ns > ?"
+                " ORDER BY start_ns",
+                (appliance, pv, operator, end_ns, start_ns),
+            ).fetchall()
+            if rows:
+                self._conn.executemany("UPDATE segments SET last_used = ? WHERE id = ?",
+                                       [(time.time(), row[0]) for row in rows])
+
+        parts = []
+        gaps = []
+        cursor = start_ns
+        for _, seg_start, seg_end, meta, data in rows:
+            # segments split from one series cover [a, b] and [b + 1, c]
+            if seg_start > cursor + 1:
+                gaps.append((cursor, seg_start))
+            parts.append(_window(_unpack(pv, data, meta), start_ns, end_ns))
+            cursor = max(cursor, seg_end)
+        if cursor < end_ns:
+            gaps.append((cursor, end_ns))
+
+        with self._lock:
+            if not rows:
+                self.misses += 1
+            elif gaps:
+                self.partial_hits += 1
+            else:
+                self.hits += 1
+        return parts, gaps
+
+    def store(self, appliance: str, pv: str, operator: str, start_ns: int, end_ns: int, series: PVTimeSeries):
+        """
+        Record that `series` holds every sample of [start_ns, end_ns].
+
+        Segments overlapping the interval are merged in, the fresh samples
+        winning, as are touching segments below `max_segment_bytes`. The
+        result is stored in segments of about `max_segment_bytes` each.
+        """
+        if series.values.dtype == object:
+            return
+        series = _window(series, start_ns, end_ns)
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                "SELECT id, start_ns, end_ns, meta, data, nbytes FROM segments"
+                " WHERE appliance = ? AND pv = ? AND operator = ? AND start_ns <= ? AND end_ns >= ?",
+                (appliance, pv, operator, end_ns + 1, start_ns - 1),
+            ).fetchall()
+            # full segments that only touch the interval are left alone, merging
+            # into them would rewrite ever larger blobs; one sharing an end point
+            # keeps its sample there
+            merge = []
+            for row in rows:
+                if (row[1] < end_ns and row[2] > start_ns) or row[5] < self.max_segment_bytes:
+                    merge.append(row)
+                elif row[2] == start_ns:
+                    start_ns += 1
+                elif row[1] == end_ns:
+                    end_ns -= 1
+            if start_ns > end_ns:
+                return
+            rows = merge
+            series = _window(series, start_ns, end_ns)
+            if rows:
+                parts = [_unpack(pv, data, meta) for _, _, _, meta, data, _ in rows] + [series]
+                timestamps = np.concatenate([part.timestamps for part in parts])
+                # keep one sample per timestamp, the freshly fetched one wins
+                order = np.argsort(timestamps, kind='stable')
+                keep = np.ones(len(order), dtype=bool)
+                keep[:-1] = timestamps[order][1:] != timestamps[order][:-1]
+                order = order[keep]
+                series = PVTimeSeries(
+                    pv, timestamps[order],
+                    np.concatenate([part.values for part in parts])[order],
+                    np.concatenate([part.severity for part in parts])[order],
+                    np.concatenate([part.status for part in parts])[order],
+                    series.meta or parts[0].meta,
+                )
+                start_ns = min(start_ns, *(row[1] for row in rows))
+                end_ns = max(end_ns, *(row[2] for row in rows))
+                self._conn.executemany("DELETE FROM segments WHERE id = ?", [(row[0],) for row in rows])
+
+            meta = json.dumps(series.meta, default=str)
+            now = time.time()
+            self._conn.executemany(
+                "INSERT INTO segments (appliance, pv, operator, start_ns, end_ns, meta, data, nbytes, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(appliance, pv, operator, lo, hi, meta, data, len(data), now)
+                 for lo, hi, data in self._segments(series, start_ns, end_ns)],
+            )
+            self._evict()
+
+    def _segments(self, series: PVTimeSeries, start_ns: int, end_ns: int) -> List[Tuple[int, int, bytes]]:
+        """Pack `series` covering [start_ns, end_ns] into (start_ns, end_ns, data) pieces of bounded size."""
+        data = _pack(series)
+        pieces = min(len(series), -(-len(data) // self.max_segment_bytes))
+        if pieces <= 1:
+            return [(start_ns, end_ns, data)]
+        bounds = [len(series) * i // pieces for i in range(pieces + 1)]
+        segments = []
+        lo_ns = start_ns
+        for i in range(pieces):
+            # a piece covers up to the first sample of the next one
+            hi_ns = end_ns if i == pieces - 1 else int(series.timestamps[bounds[i + 1]]) - 1
+            segments.append((lo_ns, hi_ns, _pack(_slice(series, bounds[i], bounds[i + 1]))))
+            lo_ns = hi_ns + 1
+        return segments
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM segments").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        victims = []
+        for seg_id, nbytes in self._conn.execute("SELECT id, nbytes FROM segments ORDER BY last_used"):
+            if total <= self.max_bytes:
+                break
+            victims.append((seg_id,))
+            total -= nbytes
+        self._conn.executemany("DELETE FROM segments WHERE id = ?", victims)
+
+    @property
+    def size(self) -> int:
+        """Total size in bytes of the stored segments."""
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM segments").fetchone()[0]
+
+    def clear(self, appliance: Optional[str] = None):
+        """Drop all segments, or only those of one appliance."""
+        with self._lock, self._conn:
+            if appliance is None:
+                self._conn.execute("DELETE FROM segments")
+            else:
+                self._conn.execute("DELETE FROM segments WHERE appliance = ?", (appliance,))
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,254 @@
+"""
+Metrics of a QA report run.
+
+`RunMetrics` collects, for one run of the report pipeline,
+
+- counters and gauges (PVs collected, reported, probed, ...),
+- latency histograms, fed by a `requests` response hook for every HTTP
+  request sent to the appliance (retried attempts included),
+- per-phase wall and CPU time (file discovery, .archive parsing, status
+  requests, filtering, EPICS probes, report writing).
+
+Phases may nest (the EPICS probe runs inside filtering) and phases run by
+several threads at once add up, so phase times are not meant to sum to the
+run's duration.
+
+`write_textfile` exports everything in the Prometheus text format for the
+node-exporter textfile collector, `write_json` as a structured summary.
+"""
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional, Tuple
+from urllib.parse import urlparse
+
+from atomic_write import write_atomic
+
+PREFIX = "archiver_qa_"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels, extra: Iterable[Tuple[str, str]] = ()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def endpoint_name(url: str) -> str:
+    """Last path component of a request URL, e.g. getPVStatus or getData.json."""
+    path = urlparse(url).path.rstrip("/")
+    return path.rsplit("/", 1)[-1] or "/"
+
+
+class _Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield bound, total
+        yield float("inf"), self.count
+
+
+class RunMetrics:
+    """
+    Thread-safe counters, gauges, histograms and phase timers of one run.
+
+    Parameters
+    ----------
+    labels : dict, optional
+        Labels added to every exported sample, e.g. {"appliance": "lcls"}.
+    """
+
+    def __init__(self, labels: Optional[Dict] = None):
+        self.labels = _labels(labels or {})
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._gauges: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], _Histogram] = {}
+        # phase -> [wall seconds, cpu seconds, times entered]
+        self._phases: Dict[str, list] = {}
+
+    def _register(self, name: str, kind: str, help_text: str):
+        if name not in self._help:
+            self._help[name] = (kind, help_text)
+
+    def inc(self, name: str, value: float = 1, help_text: str = "", **labels):
+        """Add `value` to a counter."""
+        key = (name, _labels(labels))
+        with self._lock:
+            self._register(name, "counter", help_text)
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, help_text: str = "", **labels):
+        """Set a gauge."""
+        with self._lock:
+            self._register(name, "gauge", help_text)
+            self._gauges[(name, _labels(labels))] = value
+
+    def observe(self, name: str, value: float, help_text: str = "", buckets=LATENCY_BUCKETS, **labels):
+        """Record one observation in a histogram."""
+        key = (name, _labels(labels))
+        with self._lock:
+            self._register(name, "histogram", help_text)
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(tuple(buckets))
+            histogram.observe(value)
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time a block of the pipeline as phase `name` (wall and CPU time)."""
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = time.process_time() - cpu
+            with self._lock:
+                totals = self._phases.setdefault(name, [0.0, 0.0, 0])
+                totals[0] += wall
+                totals[1] += cpu
+                totals[2] += 1
+
+    def phase_seconds(self, name: str) -> float:
+        with self._lock:
+            return self._phases.get(name, [0.0])[0]
+
+    def attach(self, session):
+        """Count and time every response of a requests session."""
+        session.hooks.setdefault("response", []).append(self._on_response)
+        return session
+
+    def _on_response(self, response, *args, **kwargs):
+        endpoint = endpoint_name(response.request.url if response.request is not None else response.url)
+        method = response.request.method if response.request is not None else ""
+        self.inc("http_requests_total", help_text="HTTP requests sent to the archiver appliance.",
+                 endpoint=endpoint, method=method, code=response.status_code)
+        self.observe("http_request_duration_seconds", response.elapsed.total_seconds(),
+                     help_text="Time until the appliance's response headers arrived.", endpoint=endpoint)
+        return response
+
+    def collect_session(self, session):
+        """Copy retry, concurrency limit and circuit breaker state of a ResilientSession into gauges."""
+        stats = getattr(session, "stats", None)
+        if stats is not None:
+            for key in ("requests", "failures", "retries"):
+                self.set(f"session_{key}", stats.get(key, 0), help_text=f"Session {key} including retried attempts.")
+        limiter = getattr(session, "limiter", None)
+        if limiter is not None:
+            self.set("session_concurrency_limit", limiter.limit, help_text="Current adaptive concurrency limit.")
+            self.set("session_concurrency_decreases", limiter.decreases, help_text="Times the concurrency limit was cut.")
+        breaker = getattr(session, "breaker", None)
+        if breaker is not None:
+            self.set("session_circuit_trips", breaker.trips, help_text="Times the circuit breaker opened.")
+            self.set("session_circuit_open", int(breaker.state != "closed"), help_text="1 while the circuit breaker is not closed.")
+
+    def summary(self) -> Dict:
+        """Return all metrics as a JSON-serialisable dict."""
+        def by_name(items):
+            out = {}
+            for (name, labels), value in items:
+                out.setdefault(name, []).append({"labels": dict(labels), "value": value})
+            return out
+
+        with self._lock:
+            histograms = {}
+            for (name, labels), h in self._histograms.items():
+                histograms.setdefault(name, []).append({
+                    "labels": dict(labels),
+                    "count": h.count,
+                    "sum": h.sum,
+                    "mean": h.sum / h.count if h.count else 0.0,
+                    "buckets": {str(b): c for b, c in zip(h.buckets, h.counts)},
+                })
+            return {
+                "started": self.started,
+                "finished": time.time(),
+                "labels": dict(self.labels),
+                "phases": {name: {"wall_s": t[0], "cpu_s": t[1], "count": t[2]} for name, t in self._phases.items()},
+                "counters": by_name(self._counters.items()),
+                "gauges": by_name(self._gauges.items()),
+                "histograms": histograms,
+            }
+
+    def to_prometheus(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            def header(name, kind, help_text):
+                lines.append(f"# HELP {PREFIX}{name} {help_text or name}")
+                lines.append(f"# TYPE {PREFIX}{name} {kind}")
+
+            for name in sorted(self._help):
+                kind, help_text = self._help[name]
+                header(name, kind, help_text)
+                if kind == "histogram":
+                    for (hname, labels), h in sorted(self._histograms.items()):
+                        if hname != name:
+                            continue
+                        for bound, total in h.cumulative():
+                            lines.append(f"{PREFIX}{name}_bucket"
+                                         f"{_format_labels(self.labels + labels, [('le', _format_value(bound))])} {total}")
+                        lines.append(f"{PREFIX}{name}_sum{_format_labels(self.labels + labels)} {_format_value(h.sum)}")
+                        lines.append(f"{PREFIX}{name}_count{_format_labels(self.labels + labels)} {h.count}")
+                    continue
+                series = self._counters if kind == "counter" else self._gauges
+                for (sname, labels), value in sorted(series.items()):
+                    if sname == name:
+                        lines.append(f"{PREFIX}{name}{_format_labels(self.labels + labels)} {_format_value(value)}")
+
+            if self._phases:
+                header("phase_seconds", "gauge", "Wall time spent per pipeline phase in the last run.")
+                for name, t in sorted(self._phases.items()):
+                    lines.append(f"{PREFIX}phase_seconds{_format_labels(self.labels, [('phase', name)])} {_format_value(t[0])}")
+                header("phase_cpu_seconds", "gauge", "Process CPU time spent per pipeline phase in the last run.")
+                for name, t in sorted(self._phases.items()):
+                    lines.append(f"{PREFIX}phase_cpu_seconds{_format_labels(self.labels, [('phase', name)])} {_format_value(t[1])}")
+
+            header("run_start_timestamp_seconds", "gauge", "Unix time the run started.")
+            lines.append(f"{PREFIX}run_start_timestamp_seconds{_format_labels(self.labels)} {_format_value(self.started)}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str):
+        """Write the Prometheus text file atomically, as the textfile collector requires."""
+        write_atomic(path, self.to_prometheus())
+
+    def write_json(self, path: str):
+        """Write the structured summary as JSON."""
+        write_atomic(path, json.dumps(self.summary(), indent=2, sort_keys=True) + "\n")
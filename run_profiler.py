@@ -0,0 +1,215 @@
+"""
+Profiling mode of the report tools (--profile).
+
+`RunProfiler` wraps one run of a report tool and, on exit, prints
+
+- the wall and CPU time of every pipeline phase recorded in the run's
+  RunMetrics (discover, parse, status, probe, filter, write),
+- optionally the functions with the highest cumulative time from a cProfile
+  run, whose pstats dump is written next to the .qa report,
+- optionally the path of a collapsed stack file (one `frame;frame;... count`
+  line per distinct stack) sampled from every thread at a fixed interval, which
+  flamegraph.pl, speedscope or inferno render as a flame graph.
+
+cProfile only sees the thread that enabled it, so with --concurrency the
+status requests issued from worker threads show up in the sampled stacks but
+not in the pstats dump. Stacks are sampled by wall clock, threads blocked on
+the network included, which is what shows where a slow run waits.
+"""
+
+import cProfile
+import collections
+import io
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from typing import Dict, Optional
+
+from run_metrics import RunMetrics
+
+DEFAULT_SAMPLE_INTERVAL = 0.005
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """
+    Sample the stacks of all threads into collapsed-stack counts.
+
+    Parameters
+    ----------
+    interval : float, optional
+        Seconds between two samples, by default 0.005.
+    """
+
+    def __init__(self, interval: float = DEFAULT_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.counts = collections.Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                # pool threads are numbered per worker, fold them into one root
+                stack.append(re.sub(r"_\d+$", "", names.get(ident, "thread")))
+                self.counts[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def write(self, path: str):
+        """Write the counts in the collapsed stack format."""
+        with open(path, "w") as f:
+            for stack, count in self.counts.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class RunProfiler:
+    """
+    Context manager profiling one report tool run.
+
+    Parameters
+    ----------
+    metrics : RunMetrics
+        Metrics of the run, whose phase timings are summarised.
+    output_dir : str, optional
+        Directory the profile files are written to, normally the report directory.
+    name : str, optional
+        Prefix of the profile file names, e.g. the subsystem.
+    cprofile : bool, optional
+        Run cProfile and write `<name>_profile_<ts>.pstats`.
+    stacks : bool, optional
+        Sample all threads and write `<name>_profile_<ts>.folded`.
+    interval : float, optional
+        Seconds between stack samples.
+    top : int, optional
+        Number of functions listed from the cProfile run.
+    """
+
+    def __init__(self, metrics: RunMetrics, output_dir: str = 'reports', name: str = 'run',
+                 cprofile: bool = False, stacks: bool = False, interval: float = DEFAULT_SAMPLE_INTERVAL,
+                 top: int = 15):
+        self.metrics = metrics
+        self.output_dir = output_dir
+        self.name = name
+        self.top = top
+        self.profile = cProfile.Profile() if cprofile else None
+        self.sampler = StackSampler(interval) if stacks else None
+        self.paths: Dict[str, str] = {}
+        self.wall_s = 0.0
+        self.cpu_s = 0.0
+
+    def __enter__(self):
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        if self.sampler is not None:
+            self.sampler.start()
+        if self.profile is not None:
+            self.profile.enable()
+        return self
+
+    def __exit__(self, *exc):
+        if self.profile is not None:
+            self.profile.disable()
+        if self.sampler is not None:
+            self.sampler.stop()
+        self.wall_s = time.perf_counter() - self._wall
+        self.cpu_s = time.process_time() - self._cpu
+        self.write()
+        print(self.summary())
+        return False
+
+    def _path(self, suffix: str) -> str:
+        ts = time.strftime("%Y-%m-%d_%H-%M-%S%z")
+        return os.path.join(self.output_dir, f"{self.name}_profile_{ts}.{suffix}")
+
+    def write(self) -> Dict[str, str]:
+        """Write the pstats dump and/or the collapsed stacks, return {kind: path}."""
+        if self.profile is None and self.sampler is None:
+            return self.paths
+        os.makedirs(self.output_dir, exist_ok=True)
+        if self.profile is not None:
+            self.paths["pstats"] = self._path("pstats")
+            self.profile.dump_stats(self.paths["pstats"])
+        if self.sampler is not None:
+            self.paths["stacks"] = self._path("folded")
+            self.sampler.write(self.paths["stacks"])
+        return self.paths
+
+    def summary(self) -> str:
+        """Per-phase wall/CPU table, top cProfile functions and the files written."""
+        lines = [f"Profile: wall {self.wall_s:.2f} s, CPU {self.cpu_s:.2f} s"]
+        phases = self.metrics.summary()["phases"]
+        if phases:
+            lines.append(f"{'phase':<12} {'wall s':>9} {'cpu s':>9} {'count':>7}")
+            for name, t in sorted(phases.items(), key=lambda item: -item[1]["wall_s"]):
+                lines.append(f"{name:<12} {t['wall_s']:9.3f} {t['cpu_s']:9.3f} {t['count']:7d}")
+        if self.profile is not None:
+            out = io.StringIO()
+            pstats.Stats(self.profile, stream=out).sort_stats("cumulative").print_stats(self.top)
+            lines.append(f"Top {self.top} functions by cumulative time (main thread):")
+            lines.append(out.getvalue().strip())
+        if self.sampler is not None:
+            lines.append(f"{self.sampler.samples} stack samples every {self.sampler.interval * 1000:g} ms")
+        for kind, path in self.paths.items():
+            lines.append(f"Wrote {kind}: {path}")
+        return "\n".join(lines)
+
+
+def add_profile_arguments(parser):
+    """Add the --profile options shared by the report tools."""
+    parser.add_argument("--profile",
+                        action="store_true",
+                        help="Print per-phase wall and CPU time at the end of the run")
+
+    parser.add_argument("--profile-cprofile",
+                        action="store_true",
+                        help="With --profile, also run cProfile and write a .pstats dump next to the report")
+
+    parser.add_argument("--profile-stacks",
+                        action="store_true",
+                        help="With --profile, also write sampled stacks of all threads (.folded, for flame graphs)")
+
+    parser.add_argument("--profile-interval",
+                        default=DEFAULT_SAMPLE_INTERVAL,
+                        type=float,
+                        help="Seconds between stack samples with --profile-stacks, default is 0.005")
+
+    parser.add_argument("--profile-dir",
+                        default=None,
+                        type=str,
+                        help="Directory the profile files are written to, default is the --report-dir of the run, or reports")
+    return parser
+
+
+def build_profiler(args, metrics: RunMetrics, name: str) -> Optional[RunProfiler]:
+    """Return the RunProfiler selected on the command line, None without --profile."""
+    if not args.profile:
+        return None
+    output_dir = args.profile_dir or getattr(args, 'report_dir', None) or 'reports'
+    return RunProfiler(metrics, output_dir, name, cprofile=args.profile_cprofile,
+                       stacks=args.profile_stacks, interval=args.profile_interval)
@@ -0,0 +1,107 @@
+"""
+On-disk cache of archiver PV statuses.
+
+Report runs and ad-hoc follow-up queries often ask the appliance for the same
+statuses within minutes of each other. `StatusCache` keeps the getPVStatus
+replies in a local SQLite database keyed by (appliance, PV) together with the
+time they were fetched, so a re-run only goes to the network for entries that
+are missing or older than the TTL.
+
+The database is opened in WAL mode so several tools can share one cache file.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "archiver-report-tools", "pv_status.sqlite")
+
+# stay well below SQLite's limit on host parameters per statement
+_LOOKUP_CHUNK = 500
+
+
+class StatusCache:
+    """
+    SQLite-backed cache of getPVStatus entries.
+
+    Parameters
+    ----------
+    path : str, optional
+        Location of the SQLite database, created if missing.
+    ttl : float, optional
+        Age in seconds after which a cached status is considered expired,
+        by default 3600.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl: float = 3600.0):
+        self.path = path
+        self.ttl = ttl
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # connections are shared with the status worker threads, access is
+        # serialised through self._lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS pv_status ("
+                " appliance TEXT NOT NULL,"
+                " pv TEXT NOT NULL,"
+                " fetched REAL NOT NULL,"
+                " status TEXT NOT NULL,"
+                " PRIMARY KEY (appliance, pv))"
+            )
+
+    def _cutoff(self, max_age: Optional[float]) -> float:
+        return time.time() - (self.ttl if max_age is None else max_age)
+
+    def get(self, appliance: str, pv: str, max_age: Optional[float] = None) -> Optional[Dict]:
+        """Return the cached status of a single PV, or None if missing or expired."""
+        return self.get_many(appliance, [pv], max_age).get(pv)
+
+    def get_many(self, appliance: str, pvs: Iterable[str], max_age: Optional[float] = None) -> Dict[str, Dict]:
+        """Return {pv: status} for every PV with a fresh cache entry."""
+        pvs = list(dict.fromkeys(pvs))
+        cutoff = self._cutoff(max_age)
+        found = {}
+        with self._lock:
+            for start in range(0, len(pvs), _LOOKUP_CHUNK):
+                chunk = pvs[start:start + _LOOKUP_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT pv, status FROM pv_status"
+                    f" WHERE appliance = ? AND fetched >= ? AND pv IN ({placeholders})",
+                    [appliance, cutoff, *chunk],
+                )
+                for pv, status in rows:
+                    found[pv] = json.loads(status)
+        return found
+
+    def put(self, appliance: str, pv: str, status: Dict):
+        """Store the status of a single PV."""
+        self.put_many(appliance, {pv: status})
+
+    def put_many(self, appliance: str, statuses: Dict[str, Dict]):
+        """Store {pv: status} entries, replacing older ones."""
+        now = time.time()
+        rows = [(appliance, pv, now, json.dumps(status)) for pv, status in statuses.items()]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO pv_status (appliance, pv, fetched, status) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+
+    def purge(self, max_age: Optional[float] = None) -> int:
+        """Delete expired entries and return how many were removed."""
+        with self._lock, self._conn:
+            cursor = self._conn.execute("DELETE FROM pv_status WHERE fetched < ?", (self._cutoff(max_age),))
+        return cursor.rowcount
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,133 @@
+"""
+Set-based PV status classification from appliance-wide listings.
+
+A status sweep asks getPVStatus about every PV of a report, N/batch_size
+requests for N PVs. The appliance also publishes which PVs it archives, which
+are paused, which are disconnected and which never connected. Four bulk
+requests fetch those listings once per run, then every archive file PV is
+classified with hash-set lookups:
+
+- not in getAllPVs                           -> asked individually
+- in getNeverConnectedPVs                    -> ambiguous (still in the archive
+                                                workflow), asked individually
+- in getPausedPVsForThisAppliance            -> Paused
+- anything else listed                       -> Being archived
+- connectionState from getCurrentlyDisconnectedPVs
+
+This assumes a single-appliance deployment, where the listings of the
+appliance behind the mgmt URL cover every archived PV. A PV missing from them
+may be archived by another appliance of a cluster, so the listings never
+conclude "Not being archived": getPVStatus, which answers cluster-wide, does.
+In a cluster a PV paused on another appliance would still be classified
+Being archived; use the per-PV sweep there.
+
+Only names listed verbatim by getAllPVs, the real PV names, are settled from
+the sets. The paused and disconnected listings also carry real names only,
+so an archive file PV written as an alias or as `NAME.VAL` would be found in
+an expanded listing (getAllExpandedPVNames) but never in the paused one, and
+a paused PV would pass as Being archived. Such names are not in getAllPVs and
+are asked individually.
+
+The listings carry no lastEvent. When the report asks for it, PVs classified
+into a reported status that has one (Paused, Being archived) are still
+asked individually. In the usual `-k UP -l` run these are the paused PVs
+on top of the unlisted ones. getPVStatus remains the source of truth for
+every PV it is asked about.
+"""
+
+import concurrent.futures
+from typing import Dict, Iterable, List, Set, Tuple
+
+LISTING_ENDPOINTS = {
+    "all": "getAllPVs",
+    "paused": "getPausedPVsForThisAppliance",
+    "disconnected": "getCurrentlyDisconnectedPVs",
+    "never_connected": "getNeverConnectedPVs",
+}
+
+# statuses whose getPVStatus reply includes a lastEvent
+STATUSES_WITH_LAST_EVENT = frozenset({"Paused", "Being archived"})
+
+
+def _names(reply) -> Set[str]:
+    """PV names of a listing reply, a list of names or of {"pvName": ...} records."""
+    return {item["pvName"] if isinstance(item, dict) else item for item in reply or []}
+
+
+class ApplianceListings:
+    """
+    Appliance-wide PV listings held as sets.
+
+    Parameters
+    ----------
+    all_pvs, paused, disconnected, never_connected : set of str
+        PV names of each listing, real names only (no aliases or `.VAL` forms).
+    """
+
+    def __init__(self, all_pvs: Set[str], paused: Set[str], disconnected: Set[str], never_connected: Set[str]):
+        self.all_pvs = all_pvs
+        self.paused = paused
+        self.disconnected = disconnected
+        self.never_connected = never_connected
+
+    @classmethod
+    def fetch(cls, session, web: str) -> 'ApplianceListings':
+        """Request the four listings at once from the mgmt/bpl URL `web`."""
+        def get(endpoint, params=None):
+            response = session.get(web + endpoint, params=params)
+            response.raise_for_status()
+            return _names(response.json())
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(LISTING_ENDPOINTS)) as executor:
+            futures = {
+                key: executor.submit(get, endpoint, {"limit": "-1"} if key == "all" else None)
+                for key, endpoint in LISTING_ENDPOINTS.items()
+            }
+            listed = {key: future.result() for key, future in futures.items()}
+        return cls(listed["all"], listed["paused"], listed["disconnected"], listed["never_connected"])
+
+    def sizes(self) -> Dict[str, int]:
+        return {"all": len(self.all_pvs), "paused": len(self.paused),
+                "disconnected": len(self.disconnected), "never_connected": len(self.never_connected)}
+
+    def classify(self, pv: str):
+        """Return the status entry of `pv`, or None when only getPVStatus can tell."""
+        if pv in self.never_connected or pv not in self.all_pvs:
+            return None
+        status = "Paused" if pv in self.paused else "Being archived"
+        return {"pvName": pv, "status": status,
+                "connectionState": "false" if pv in self.disconnected else "true"}
+
+
+def classify_statuses(pvs: Iterable[str], listings: ApplianceListings, report_statuses: Iterable[str],
+                      last_event: bool = False) -> Tuple[Dict[str, Dict], List[str]]:
+    """
+    Classify PVs from the listings.
+
+    Parameters
+    ----------
+    pvs : iterable of str
+        PVs to classify, duplicates are classified once.
+    listings : ApplianceListings
+        Listings fetched for this run.
+    report_statuses : iterable of str
+        Statuses the report keeps, e.g. ["Not being archived", "Paused"].
+    last_event : bool, optional
+        The report shows lastEvent, so reported PVs with one need getPVStatus.
+
+    Returns
+    -------
+    tuple
+        ({pv: status entry} of the PVs settled by the listings,
+         [pvs to ask getPVStatus about])
+    """
+    detail_statuses = set(report_statuses) & STATUSES_WITH_LAST_EVENT if last_event else set()
+    statuses = {}
+    lookups = []
+    for pv in dict.fromkeys(pvs):
+        entry = listings.classify(pv)
+        if entry is None or entry["status"] in detail_statuses:
+            lookups.append(pv)
+        else:
+            statuses[pv] = entry
+    return statuses, lookups
@@ -0,0 +1,131 @@
+import calendar
+import struct
+import time
+
+import pytest
+
+from archiver_pb import UnsupportedPayload, decode_raw, escape, iter_lines, unescape
+
+SCALAR_STRING = 0
+SCALAR_SHORT = 1
+SCALAR_DOUBLE = 6
+
+
+def varint(value):
+    value &= 0xFFFFFFFFFFFFFFFF
+    out = bytearray()
+    while True:
+        b = value & 0x7F
+        value >>= 7
+        if not value:
+            out.append(b)
+            return bytes(out)
+        out.append(b | 0x80)
+
+
+def zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+
+def length_delimited(field, data):
+    return varint(field << 3 | 2) + varint(len(data)) + data
+
+
+def payload_info(payload_type, pv, year, headers=()):
+    msg = varint(1 << 3) + varint(payload_type) + length_delimited(2, pv.encode()) + varint(3 << 3) + varint(year)
+    for name, val in headers:
+        msg += length_delimited(15, length_delimited(1, name.encode()) + length_delimited(2, val.encode()))
+    return msg
+
+
+def sample(payload_type, secs_into_year, nanos, value, severity=0, status=0):
+    msg = varint(1 << 3) + varint(secs_into_year) + varint(2 << 3) + varint(nanos)
+    if payload_type == SCALAR_DOUBLE:
+        msg += varint(3 << 3 | 1) + struct.pack('<d', value)
+    elif payload_type == SCALAR_SHORT:
+        msg += varint(3 << 3) + varint(zigzag(value))
+    elif payload_type == SCALAR_STRING:
+        msg += length_delimited(3, value.encode())
+    if severity:
+        msg += varint(4 << 3) + varint(severity)
+    if status:
+        msg += varint(5 << 3) + varint(status)
+    return msg
+
+
+def encode(payload_type, pv, samples, headers=()):
+    """Encode (epoch ns, value, severity, status) samples as a getData.raw stream, one chunk per year."""
+    lines = []
+    year = None
+    for timestamp_ns, value, severity, status in samples:
+        secs, nanos = divmod(timestamp_ns, 1_000_000_000)
+        sample_year = time.gmtime(secs).tm_year
+        if sample_year != year:
+            if year is not None:
+                lines.append(b'')
+            year = sample_year
+            year_start = calendar.timegm((year, 1, 1, 0, 0, 0))
+            lines.append(escape(payload_info(payload_type, pv, year, headers)))
+        lines.append(escape(sample(payload_type, secs - year_start, nanos, value, severity, status)))
+    return b'\n'.join(lines) + b'\n'
+
+
+def in_pieces(data, size):
+    return (data[i:i + size] for i in range(0, len(data), size))
+
+
+def test_escape_round_trip():
+    message = b'a\nb\rc\x1bd\x1b\x02'
+    escaped = escape(message)
+    assert b'\n' not in escaped and b'\r' not in escaped
+    assert unescape(escaped) == message
+
+
+def test_iter_lines_reassembles_pieces():
+    assert list(iter_lines(in_pieces(b'one\ntwo\n\nthree', 2))) == [b'one', b'two', b'', b'three']
+
+
+@pytest.mark.parametrize("piece_size", [1, 7, 1 << 20])
+def test_double_round_trip_across_year_boundary(piece_size):
+    new_year = calendar.timegm((2024, 1, 1, 0, 0, 0)) * 1_000_000_000
+    samples = [
+        (new_year - 2_000_000_000, 1.5, 0, 0),
+        # nanos of 10, 13 and 27 encode as the escaped bytes \n, \r and ESC
+        (new_year - 1_000_000_000 + 10, -2.25, 1, 3),
+        (new_year + 13, 1e300, 2, 0),
+        (new_year + 1_000_000_027, float(0x0A0D1B), 0, 7),
+    ]
+    stream = encode(SCALAR_DOUBLE, "TEST:PV", samples, headers=[("PREC", "3"), ("EGU", "mA")])
+
+    [series] = decode_raw(in_pieces(stream, piece_size))
+
+    assert series.pv == "TEST:PV"
+    assert series.timestamps.tolist() == [s[0] for s in samples]
+    assert series.values.tolist() == [s[1] for s in samples]
+    assert series.severity.tolist() == [s[2] for s in samples]
+    assert series.status.tolist() == [s[3] for s in samples]
+    assert series.meta["PREC"] == "3" and series.meta["EGU"] == "mA"
+    assert series.meta["type"] == "SCALAR_DOUBLE"
+
+
+def test_sint_and_string_payloads():
+    t0 = calendar.timegm((2023, 6, 1, 0, 0, 0)) * 1_000_000_000
+    [shorts] = decode_raw([encode(SCALAR_SHORT, "S", [(t0, -5, 0, 0), (t0 + 1, 32767, 0, 0)])])
+    [strings] = decode_raw([encode(SCALAR_STRING, "T", [(t0, "on\nline", 0, 0), (t0 + 1, "off", 0, 0)])])
+
+    assert shorts.values.tolist() == [-5, 32767]
+    assert list(strings.values) == ["on\nline", "off"]
+
+
+def test_name_override_and_empty_stream():
+    t0 = calendar.timegm((2023, 6, 1, 0, 0, 0)) * 1_000_000_000
+    [series] = decode_raw([encode(SCALAR_DOUBLE, "RAW:PV", [(t0, 1.0, 0, 0)])], pv="mean_60(RAW:PV)")
+
+    assert series.pv == "mean_60(RAW:PV)"
+    assert series.meta["name"] == "RAW:PV"
+    assert decode_raw([]) == []
+
+
+def test_unsupported_payload_type():
+    with pytest.raises(UnsupportedPayload):
+        decode_raw([escape(payload_info(99, "V4:PV", 2024)) + b'\n'])
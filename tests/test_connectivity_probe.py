@@ -0,0 +1,109 @@
+import time
+
+import pytest
+
+from connectivity_probe import ConnectivityProbe
+
+
+class FakeBackend:
+    """Channels of `live` PVs connect after `connect_polls` polls, the others never do."""
+
+    def __init__(self, live, connect_polls=1, fail_on=None):
+        self.live = set(live)
+        self.fail_on = fail_on
+        self.connect_polls = connect_polls
+        self.polls = 0
+        self.contexts = 0
+        self.created = []
+        self.cleared = []
+
+    def use_context(self):
+        self.contexts += 1
+
+    def create_channel(self, pvname):
+        if self.fail_on == "create" and len(self.created) == 2:
+            raise RuntimeError("channel limit")
+        self.created.append(pvname)
+        return pvname
+
+    def poll(self, timeout):
+        if self.fail_on == "poll":
+            raise RuntimeError("CA error")
+        self.polls += 1
+        time.sleep(timeout)
+
+    def is_connected(self, channel):
+        return channel in self.live and self.polls >= self.connect_polls
+
+    def clear_channel(self, channel):
+        self.cleared.append(channel)
+
+
+def test_splits_connected_and_disconnected():
+    backend = FakeBackend({"A:ON", "B:ON"})
+    probe = ConnectivityProbe(timeout=0.2, backend=backend, poll_interval=0.01)
+
+    connected, disconnected = probe.probe(["A:ON", "X:OFF", "B:ON", "Y:OFF"])
+
+    assert connected == {"A:ON", "B:ON"}
+    assert disconnected == {"X:OFF", "Y:OFF"}
+    assert backend.contexts == 1
+    assert sorted(backend.cleared) == sorted(backend.created)
+
+
+def test_dead_pvs_share_one_deadline():
+    dead = [f"DEAD:{i}" for i in range(200)]
+    backend = FakeBackend(set())
+    probe = ConnectivityProbe(timeout=0.2, backend=backend, poll_interval=0.02)
+
+    start = time.monotonic()
+    connected, disconnected = probe.probe(dead)
+    elapsed = time.monotonic() - start
+
+    assert connected == set()
+    assert disconnected == set(dead)
+    # one deadline for all PVs, not one timeout per PV
+    assert elapsed < 0.6
+    assert backend.polls <= 0.2 / 0.02 + 2
+
+
+def test_stops_polling_once_everything_connected():
+    backend = FakeBackend({"A", "B"}, connect_polls=2)
+    probe = ConnectivityProbe(timeout=10, backend=backend, poll_interval=0.001)
+
+    connected, disconnected = probe.probe(["A", "B"])
+
+    assert connected == {"A", "B"}
+    assert disconnected == set()
+    assert backend.polls == 2
+
+
+def test_duplicates_are_probed_once():
+    backend = FakeBackend({"A"})
+    probe = ConnectivityProbe(timeout=0.05, backend=backend, poll_interval=0.001)
+
+    connected, _ = probe.probe(["A", "A", "A"])
+
+    assert connected == {"A"}
+    assert backend.created == ["A"]
+
+
+def test_no_pvs_never_touches_the_backend():
+    backend = FakeBackend(set())
+    probe = ConnectivityProbe(backend=backend)
+
+    assert probe.probe([]) == (set(), set())
+    assert backend.contexts == 0
+    assert backend.polls == 0
+
+
+@pytest.mark.parametrize("fail_on", ["create", "poll"])
+def test_channels_are_cleared_when_the_backend_fails(fail_on):
+    backend = FakeBackend({"A"}, fail_on=fail_on)
+    probe = ConnectivityProbe(timeout=0.05, backend=backend, poll_interval=0.001)
+
+    with pytest.raises(RuntimeError):
+        probe.probe(["A", "B", "C", "D"])
+
+    assert backend.created
+    assert sorted(backend.cleared) == sorted(backend.created)
@@ -0,0 +1,157 @@
+import io
+
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+
+from http_session import AdaptiveLimiter, CircuitBreaker, CircuitOpenError, ResilientSession
+
+
+class ScriptedAdapter(BaseAdapter):
+    """Answer requests from a list of status codes or exceptions, one per attempt."""
+
+    def __init__(self, outcomes):
+        super().__init__()
+        self.outcomes = list(outcomes)
+        self.sent = []
+
+    def send(self, request, **kwargs):
+        self.sent.append(request.method)
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        response = requests.Response()
+        response.status_code = outcome
+        response.request = request
+        response.url = request.url
+        response.raw = io.BytesIO(b"[]")
+        return response
+
+    def close(self):
+        pass
+
+
+def session(outcomes, **kwargs):
+    kwargs.setdefault("backoff_base", 0.001)
+    s = ResilientSession(4, **kwargs)
+    adapter = ScriptedAdapter(outcomes)
+    s.mount("http://", adapter)
+    return s, adapter
+
+
+def test_limiter_cuts_on_congestion_and_grows_back():
+    limiter = AdaptiveLimiter(8, cooldown=0)
+    assert limiter.limit == 8
+
+    limiter.acquire()
+    limiter.release("getPVStatus", congested=True)
+    assert limiter.limit == 4 and limiter.decreases == 1
+
+    for _ in range(20):
+        limiter.acquire()
+        limiter.release("getPVStatus", 0.01)
+    assert 4 < limiter.limit <= 8
+
+
+def reply(limiter, endpoint, latency, times=1):
+    for _ in range(times):
+        limiter.acquire()
+        limiter.release(endpoint, latency)
+
+
+def test_limiter_judges_latency_per_endpoint():
+    limiter = AdaptiveLimiter(8, cooldown=0)
+    reply(limiter, "getPVStatus", 0.02, times=10)
+    # slow next to getPVStatus, but the first getData replies set their own baseline
+    reply(limiter, "getData.raw", 0.6, times=10)
+    assert limiter.decreases == 0
+
+    reply(limiter, "getPVStatus", 0.6)
+    assert limiter.decreases == 1 and limiter.limit == 4
+    # a slow getData reply is still normal for getData
+    reply(limiter, "getData.raw", 0.7)
+    assert limiter.decreases == 1
+
+
+def test_limiter_ignores_latency_below_the_floor_and_during_warmup():
+    limiter = AdaptiveLimiter(8, cooldown=0)
+    reply(limiter, "getPVStatus", 0.001, times=2)
+    reply(limiter, "getPVStatus", 1.0)
+    assert limiter.decreases == 0
+
+    reply(limiter, "getPVStatus", 0.001, times=20)
+    reply(limiter, "getPVStatus", 0.2)
+    assert limiter.decreases == 0
+
+
+def test_streamed_response_holds_its_slot_until_closed():
+    s, adapter = session([200])
+    with s.get("http://archiver/retrieval/data/getData.raw", stream=True) as resp:
+        assert resp.status_code == 200
+        assert s.limiter.in_flight == 1
+    assert s.limiter.in_flight == 0
+    resp.close()
+    assert s.limiter.in_flight == 0
+
+    s, adapter = session([200])
+    s.get("http://archiver/getPVStatus")
+    assert s.limiter.in_flight == 0
+
+
+def test_get_is_retried_until_it_succeeds():
+    s, adapter = session([503, requests.ConnectionError("reset"), 200])
+    assert s.get("http://archiver/getPVStatus").status_code == 200
+    assert len(adapter.sent) == 3
+    assert s.stats["retries"] == 2
+
+
+def test_post_is_not_retried_unless_asked():
+    s, adapter = session([503, 200])
+    assert s.post("http://archiver/getPVStatus", json=[]).status_code == 503
+    assert len(adapter.sent) == 1
+
+    s, adapter = session([503, 200])
+    assert s.post("http://archiver/getPVStatus", json=[], retry=True).status_code == 200
+    assert len(adapter.sent) == 2
+
+
+def test_changing_get_opts_out_but_connect_timeouts_are_retried():
+    s, adapter = session([requests.ReadTimeout("slow")])
+    with pytest.raises(requests.ReadTimeout):
+        s.get("http://archiver/pauseArchivingPV", retry=False)
+    assert len(adapter.sent) == 1
+
+    # a connect timeout never reached the appliance, so it is safe to resend
+    s, adapter = session([requests.ConnectTimeout("unreachable"), 200])
+    assert s.get("http://archiver/pauseArchivingPV", retry=False).status_code == 200
+    assert len(adapter.sent) == 2
+
+
+def test_gives_up_after_the_retry_budget():
+    s, adapter = session([503] * 4, retries=2)
+    assert s.get("http://archiver/getData.json").status_code == 503
+    assert len(adapter.sent) == 3
+
+
+def test_open_breaker_is_waited_out_within_the_budget():
+    breaker = CircuitBreaker(reset_timeout=0.05)
+    breaker._open()
+    s, adapter = session([200], breaker=breaker)
+    assert s.get("http://archiver/getPVStatus").status_code == 200
+    assert breaker.state == "closed"
+
+    # no retry left
+    breaker = CircuitBreaker(reset_timeout=0.05)
+    breaker._open()
+    s, adapter = session([200], breaker=breaker, retries=0)
+    with pytest.raises(CircuitOpenError):
+        s.get("http://archiver/getPVStatus")
+    assert adapter.sent == []
+
+    # open for longer than any backoff
+    breaker = CircuitBreaker(reset_timeout=60)
+    breaker._open()
+    s, adapter = session([200], breaker=breaker, max_backoff=1)
+    with pytest.raises(CircuitOpenError):
+        s.get("http://archiver/getPVStatus")
+    assert adapter.sent == []
@@ -0,0 +1,66 @@
+from array import array
+
+from pv_registry import PVNameTable, PVRegistry, unique_pvs
+
+
+def test_table_interns_each_name_once():
+    table = PVNameTable()
+    assert table.ids(["A", "B", "A"]) == array('I', [0, 1, 0])
+    assert table.names == ["A", "B"]
+    assert len(table) == 2
+    assert "A" in table and "C" not in table
+
+
+def test_registry_reads_as_mapping():
+    registry = PVRegistry()
+    registry["f1.archive"] = ["A", "B"]
+    registry["f2.archive"] = ["B", "C", "B"]
+
+    assert dict(registry) == {"f1.archive": ["A", "B"], "f2.archive": ["B", "C", "B"]}
+    assert registry.references == 5
+    assert registry.nbytes == 5 * array('I').itemsize
+
+    del registry["f1.archive"]
+    assert list(registry) == ["f2.archive"]
+
+
+def test_unique_pvs_in_first_seen_order():
+    registry = PVRegistry()
+    registry["f1.archive"] = ["C", "A"]
+    registry["f2.archive"] = ["A", "B", "C"]
+
+    assert registry.unique_pvs() == ["C", "A", "B"]
+    assert unique_pvs(registry) == ["C", "A", "B"]
+    assert unique_pvs({"f1": ["C", "A"], "f2": ["A", "B"]}) == ["C", "A", "B"]
+
+
+def test_unique_pvs_skips_names_only_other_registries_use():
+    table = PVNameTable()
+    first, second = PVRegistry(table), PVRegistry(table)
+    first["f.archive"] = ["A", "B"]
+    second["g.archive"] = ["B", "C"]
+
+    assert second.unique_pvs() == ["B", "C"]
+    assert table.names == ["A", "B", "C"]
+
+
+def test_merge_with_shared_and_private_tables():
+    table = PVNameTable()
+    bp, mg = PVRegistry(table), PVRegistry(table)
+    bp["ioc.archive"] = ["A", "B"]
+    mg["ioc.archive"] = ["B", "C"]
+
+    merged = PVRegistry(table)
+    merged.merge(bp, prefix="bp/")
+    merged.merge(mg, prefix="mg/")
+    assert dict(merged) == {"bp/ioc.archive": ["A", "B"], "mg/ioc.archive": ["B", "C"]}
+    assert len(table) == 3
+
+    private = PVRegistry()
+    private.merge(merged)
+    assert dict(private) == dict(merged)
+    assert private.table is not table
+
+    # the merged copy does not alias the source arrays
+    merged["bp/ioc.archive"] = ["C"]
+    assert bp["ioc.archive"] == ["A", "B"]
@@ -0,0 +1,84 @@
+import json
+import os
+
+from report_state import diff_states, load_state, save_state, snapshot, state_path, write_diff_report
+
+
+def entry(status, files=("f.archive",)):
+    return {"status": status, "files": list(files)}
+
+
+def test_snapshot_collects_files_per_pv():
+    pvs = snapshot([
+        ("a.archive", {"X": {"status": "Paused"}}),
+        ("b.archive", {"X": {"status": "Paused"}, "Y": {"status": "Not being archived"}}),
+    ])
+    assert pvs == {
+        "X": {"status": "Paused", "files": ["a.archive", "b.archive"]},
+        "Y": {"status": "Not being archived", "files": ["b.archive"]},
+    }
+
+
+def test_diff_without_previous_state_reports_everything_new():
+    current = {"X": entry("Paused")}
+    diff = diff_states(None, current)
+    assert diff.new == current
+    assert not diff.resolved and not diff.still_failing
+    assert diff.baseline is None
+
+
+def test_diff_classifies_new_resolved_still_failing_and_changed():
+    previous = {"taken_at": "yesterday", "pvs": {
+        "KEEP": entry("Paused"),
+        "FLIP": entry("Paused"),
+        "GONE": entry("Not being archived"),
+    }}
+    current = {
+        "KEEP": entry("Paused"),
+        "FLIP": entry("Not being archived"),
+        "NEW": entry("Paused"),
+    }
+
+    diff = diff_states(previous, current)
+
+    assert set(diff.new) == {"NEW"}
+    assert set(diff.resolved) == {"GONE"}
+    assert set(diff.still_failing) == {"KEEP", "FLIP"}
+    assert diff.changed == {"FLIP": "Paused"}
+    assert diff.baseline == "yesterday"
+
+
+def test_state_round_trip_and_status_filter(tmp_path):
+    path = state_path(str(tmp_path / "reports"), "bp")
+    pvs = {"X": entry("Paused")}
+
+    save_state(path, pvs, ["Paused", "Not being archived"])
+
+    assert load_state(path)["pvs"] == pvs
+    assert load_state(path, ["Not being archived", "Paused"])["pvs"] == pvs
+    # a snapshot taken with another -k filter is no baseline
+    assert load_state(path, ["Paused"]) is None
+    assert os.listdir(tmp_path / "reports") == ["bp_state.json"]
+
+
+def test_unusable_state_files(tmp_path):
+    assert load_state(str(tmp_path / "missing.json")) is None
+    broken = tmp_path / "broken.json"
+    broken.write_text("{not json")
+    assert load_state(str(broken)) is None
+    old = tmp_path / "old.json"
+    old.write_text(json.dumps({"version": 0, "pvs": {}}))
+    assert load_state(str(old)) is None
+
+
+def test_diff_report_lists_sections(tmp_path):
+    previous = {"taken_at": "yesterday", "pvs": {"KEEP": entry("Paused"), "GONE": entry("Paused")}}
+    diff = diff_states(previous, {"KEEP": entry("Not being archived"), "NEW": entry("Paused")})
+
+    path = write_diff_report("bp", diff, str(tmp_path))
+    text = open(path).read()
+
+    assert os.path.basename(path).startswith("bp_diff_")
+    assert text.startswith("# bp: 1 new, 1 resolved, 1 still failing since yesterday")
+    assert "== New (1) ==" in text and "== Resolved (1) ==" in text
+    assert "KEEP" in text and "(was Paused)" in text
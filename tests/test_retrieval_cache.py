@@ -0,0 +1,160 @@
+import numpy as np
+import pytest
+
+from archiver_timeseries import PVTimeSeries
+from retrieval_cache import RetrievalCache
+
+S = 1_000_000_000
+APPLIANCE = "http://archiver/retrieval/data/"
+OPERATOR = "mean_60"
+
+
+def series(seconds, pv="PV"):
+    return PVTimeSeries.from_samples(pv, [(t * S, float(t), 0, 0) for t in seconds], {"PREC": "2"})
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = RetrievalCache(str(tmp_path / "retrieval.sqlite"))
+    yield cache
+    cache.close()
+
+
+def lookup(cache, start, end, pv="PV"):
+    parts, gaps = cache.lookup(APPLIANCE, pv, OPERATOR, start * S, end * S)
+    joined = PVTimeSeries.concat(parts, pv)
+    return (joined.timestamps // S).tolist(), [(lo // S, hi // S) for lo, hi in gaps]
+
+
+def test_miss_then_full_hit(cache):
+    assert lookup(cache, 0, 100) == ([], [(0, 100)])
+
+    cache.store(APPLIANCE, "PV", OPERATOR, 0, 100 * S, series(range(0, 100, 10)))
+
+    assert lookup(cache, 20, 50) == ([20, 30, 40, 50], [])
+    assert (cache.misses, cache.partial_hits, cache.hits) == (1, 0, 1)
+
+
+def test_partial_hit_returns_the_gaps(cache):
+    cache.store(APPLIANCE, "PV", OPERATOR, 100 * S, 200 * S, series(range(100, 200, 10)))
+    cache.store(APPLIANCE, "PV", OPERATOR, 300 * S, 400 * S, series(range(300, 400, 10)))
+
+    timestamps, gaps = lookup(cache, 50, 450)
+
+    assert gaps == [(50, 100), (200, 300), (400, 450)]
+    assert timestamps == list(range(100, 200, 10)) + list(range(300, 400, 10))
+    assert cache.partial_hits == 1
+
+
+def test_touching_segments_are_merged(cache):
+    cache.store(APPLIANCE, "PV", OPERATOR, 0, 100 * S, series(range(0, 100, 10)))
+    cache.store(APPLIANCE, "PV", OPERATOR, 100 * S, 200 * S, series(range(100, 200, 10)))
+    # overlapping refetch, the fresh samples win
+    fresh = series([50, 60])
+    fresh.values[:] = -1
+    cache.store(APPLIANCE, "PV", OPERATOR, 50 * S, 70 * S, fresh)
+
+    parts, gaps = cache.lookup(APPLIANCE, "PV", OPERATOR, 0, 200 * S)
+
+    assert len(parts) == 1 and gaps == []
+    merged = parts[0]
+    assert (merged.timestamps // S).tolist() == list(range(0, 200, 10))
+    assert merged.values[5] == -1 and merged.values[6] == -1 and merged.values[7] == 70
+    assert merged.meta == {"PREC": "2"}
+
+
+def test_samples_outside_the_covered_interval_are_not_stored(cache):
+    cache.store(APPLIANCE, "PV", OPERATOR, 10 * S, 20 * S, series([0, 10, 15, 20, 30]))
+    assert lookup(cache, 0, 40) == ([10, 15, 20], [(0, 10), (20, 40)])
+
+
+def test_keys_are_separate(cache):
+    cache.store(APPLIANCE, "PV", OPERATOR, 0, 100 * S, series([10]))
+    assert cache.lookup(APPLIANCE, "OTHER", OPERATOR, 0, 100 * S)[1] == [(0, 100 * S)]
+    assert cache.lookup(APPLIANCE, "PV", "mean_10", 0, 100 * S)[1] == [(0, 100 * S)]
+    assert cache.lookup("http://other/", "PV", OPERATOR, 0, 100 * S)[1] == [(0, 100 * S)]
+
+
+def test_object_series_are_not_cached(cache):
+    strings = PVTimeSeries("PV", np.array([S], dtype=np.int64), np.array(["on"], dtype=object),
+                           np.zeros(1, dtype=np.int32), np.zeros(1, dtype=np.int32))
+    cache.store(APPLIANCE, "PV", OPERATOR, 0, 10 * S, strings)
+    assert cache.size == 0
+
+
+def test_eviction_and_clear(tmp_path):
+    cache = RetrievalCache(str(tmp_path / "small.sqlite"), max_bytes=1)
+    try:
+        cache.store(APPLIANCE, "A", OPERATOR, 0, 10 * S, series([1], "A"))
+        cache.store(APPLIANCE, "B", OPERATOR, 0, 10 * S, series([1], "B"))
+        # over budget, so at most the most recent segment is left
+        assert cache.lookup(APPLIANCE, "A", OPERATOR, 0, 10 * S)[0] == []
+
+        cache.max_bytes = 1 << 20
+        cache.store(APPLIANCE, "A", OPERATOR, 0, 10 * S, series([1], "A"))
+        cache.store("http://other/", "A", OPERATOR, 0, 10 * S, series([1], "A"))
+        cache.clear(APPLIANCE)
+        assert cache.lookup(APPLIANCE, "A", OPERATOR, 0, 10 * S)[1] == [(0, 10 * S)]
+        assert cache.lookup("http://other/", "A", OPERATOR, 0, 10 * S)[1] == []
+    finally:
+        cache.close()
+
+
+def segments(cache):
+    with cache._lock:
+        return cache._conn.execute(
+            "SELECT start_ns, end_ns, nbytes FROM segments ORDER BY start_ns").fetchall()
+
+
+def test_incremental_stores_keep_segments_bounded(tmp_path):
+    cache = RetrievalCache(str(tmp_path / "capped.sqlite"), max_segment_bytes=4096)
+    try:
+        for day in range(20):
+            start = day * 1000
+            cache.store(APPLIANCE, "PV", OPERATOR, start * S, (start + 1000) * S, series(range(start, start + 1000)))
+
+        stored = segments(cache)
+        assert len(stored) > 1
+        # a full segment is never merged into again, so none grows much past the cap
+        assert max(nbytes for _, _, nbytes in stored) < 3 * 4096
+        assert all(prev[1] + 1 >= nxt[0] for prev, nxt in zip(stored, stored[1:]))
+
+        timestamps, gaps = lookup(cache, 0, 20000)
+        assert gaps == []
+        assert timestamps == list(range(0, 20000))
+    finally:
+        cache.close()
+
+
+def test_refetch_over_split_segments(tmp_path):
+    cache = RetrievalCache(str(tmp_path / "split.sqlite"), max_segment_bytes=4096)
+    try:
+        cache.store(APPLIANCE, "PV", OPERATOR, 0, 10000 * S, series(range(0, 10000)))
+        assert len(segments(cache)) > 1
+
+        fresh = series(range(4000, 6000))
+        fresh.values[:] = -1
+        cache.store(APPLIANCE, "PV", OPERATOR, 4000 * S, 6000 * S, fresh)
+
+        parts, gaps = cache.lookup(APPLIANCE, "PV", OPERATOR, 0, 10000 * S)
+        merged = PVTimeSeries.concat(parts, "PV")
+        assert gaps == []
+        assert (merged.timestamps // S).tolist() == list(range(0, 10000))
+        assert (merged.values[4000:6000] == -1).all()
+        assert merged.values[3999] == 3999 and merged.values[6000] == 6000
+    finally:
+        cache.close()
+
+
+def test_newly_stored_data_survives_eviction(tmp_path):
+    cache = RetrievalCache(str(tmp_path / "evict.sqlite"), max_bytes=64 * 1024, max_segment_bytes=8192)
+    try:
+        for day in range(50):
+            start = day * 1000
+            cache.store(APPLIANCE, "PV", OPERATOR, start * S, (start + 1000) * S, series(range(start, start + 1000)))
+            assert lookup(cache, start, start + 1000)[1] == []
+        assert cache.size <= 64 * 1024
+        # the oldest windows were evicted
+        assert lookup(cache, 0, 1000)[1] != []
+    finally:
+        cache.close()
@@ -0,0 +1,57 @@
+from status_listings import ApplianceListings, _names, classify_statuses
+
+
+def listings():
+    return ApplianceListings(
+        all_pvs={"ARCH", "PAUSED", "DISC", "NEVER"},
+        paused={"PAUSED"},
+        disconnected={"DISC", "PAUSED"},
+        never_connected={"NEVER"},
+    )
+
+
+def test_listing_replies_of_names_or_records():
+    assert _names(["A", "B"]) == {"A", "B"}
+    assert _names([{"pvName": "A"}, {"pvName": "B"}]) == {"A", "B"}
+    assert _names(None) == set()
+
+
+def test_classify():
+    lists = listings()
+    assert lists.classify("ARCH") == {"pvName": "ARCH", "status": "Being archived", "connectionState": "true"}
+    assert lists.classify("DISC")["connectionState"] == "false"
+    assert lists.classify("PAUSED") == {"pvName": "PAUSED", "status": "Paused", "connectionState": "false"}
+    # never connected PVs are still in the archive workflow, only getPVStatus knows
+    assert lists.classify("NEVER") is None
+    # an unlisted PV may be archived by another appliance of a cluster
+    assert lists.classify("UNLISTED") is None
+
+
+def test_classify_statuses_settles_listed_pvs():
+    statuses, lookups = classify_statuses(
+        ["ARCH", "PAUSED", "UNLISTED", "NEVER", "ARCH"], listings(), ["Not being archived", "Paused"])
+
+    assert set(statuses) == {"ARCH", "PAUSED"}
+    assert lookups == ["UNLISTED", "NEVER"]
+
+
+def test_classify_statuses_looks_up_reported_pvs_needing_last_event():
+    statuses, lookups = classify_statuses(
+        ["ARCH", "PAUSED", "UNLISTED"], listings(), ["Not being archived", "Paused"], last_event=True)
+
+    # Paused is reported and has a lastEvent, Being archived is not reported
+    assert set(statuses) == {"ARCH"}
+    assert lookups == ["PAUSED", "UNLISTED"]
+
+
+def test_alias_and_val_forms_of_a_paused_pv_are_looked_up():
+    lists = listings()
+
+    # PAUSED is archived under its real name; the archive files use other forms
+    assert lists.classify("PAUSED.VAL") is None
+    assert lists.classify("PAUSED_ALIAS") is None
+
+    statuses, lookups = classify_statuses(
+        ["PAUSED.VAL", "PAUSED_ALIAS", "PAUSED"], lists, ["Not being archived", "Paused"])
+    assert statuses == {"PAUSED": {"pvName": "PAUSED", "status": "Paused", "connectionState": "false"}}
+    assert lookups == ["PAUSED.VAL", "PAUSED_ALIAS"]